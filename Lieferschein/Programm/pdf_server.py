@@ -2,21 +2,14 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import os
 import sys
-import tempfile
-from datetime import datetime
-import requests
-import json
 
 # Add parent directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+# Backend directory holds the shared PDF service (Render copies it to the root directory)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
-# Try to import from different locations depending on deployment
-try:
-    # Production (Render) - files are in root directory
-    from lieferschein_generator import generate_lieferschein, generate_laufkarte, generate_rechnung
-except ImportError:
-    # Development - files are in Vorlagen directory
-    from Vorlagen.lieferschein_generator import generate_lieferschein, generate_laufkarte, generate_rechnung
+from pdf_service import render_document_cached, build_history_record, download_name, pdf_response_headers, DOCUMENT_TYPES
+from history_recorder import HistoryRecorder
 
 app = Flask(__name__)
 CORS(app)
@@ -24,11 +17,19 @@ CORS(app)
 # Backend API URL
 BACKEND_API_URL = os.environ.get('BACKEND_API_URL', 'http://localhost:8001')
 
+# Document history is written in the background, in batches
+history_recorder = HistoryRecorder(f"{BACKEND_API_URL}/api/document-history/bulk")
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "service": "pdf-server-python"})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Document history queue metrics"""
+    return jsonify({"document_history": history_recorder.metrics()})
+
 @app.route('/generate-pdf', methods=['POST'])
 def generate_pdf():
     """Generate PDF based on document type"""
@@ -40,61 +41,32 @@ def generate_pdf():
         if not doc_type:
             return jsonify({"error": "docType is required"}), 400
         
-        # Generate PDF based on type and get document number
-        document_number = None
-        if doc_type == 'lieferschein':
-            pdf_path = generate_lieferschein(doc_data)
-            # Get the generated Lieferschein number from the counter
-            try:
-                from lieferschein_counter import get_current_number
-            except ImportError:
-                from Vorlagen.lieferschein_counter import get_current_number
-            document_number = f"DZ{datetime.now().year}-{get_current_number():04d}"
-        elif doc_type == 'laufkarte':
-            pdf_path = generate_laufkarte(doc_data)
-            # Laufkarte uses the order number
-            document_number = doc_data.get('bestellnummer', '')
-        elif doc_type == 'rechnung':
-            pdf_path = generate_rechnung(doc_data)
-            # Rechnung uses RE- prefix
-            document_number = f"RE-{doc_data.get('bestellnummer', '')}"
-        else:
+        if doc_type not in DOCUMENT_TYPES:
             return jsonify({"error": f"Unknown docType: {doc_type}"}), 400
         
-        # Record document generation in history
-        try:
-            history_data = {
-                "bestellnummer": doc_data.get("bestellnummer", ""),
-                "document_type": doc_type,
-                "generated_by": "pdf_server",
-                "document_data": doc_data,
-                "metadata": {
-                    "pdf_path": pdf_path,
-                    "timestamp": datetime.now().isoformat(),
-                    "document_number": document_number
-                }
-            }
-            
-            # Send to backend API
-            response = requests.post(
-                f"{BACKEND_API_URL}/api/document-history",
-                json=history_data,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code not in [200, 201]:
-                print(f"Warning: Failed to record document history: {response.text}")
-        except Exception as e:
-            print(f"Warning: Error recording document history: {str(e)}")
+        # Generate PDF based on type and get document number
+        result = render_document_cached(doc_type, doc_data)
+        
+        # Record document generation in history (queued, does not delay the download)
+        history_recorder.record(
+            build_history_record(doc_type, doc_data, result, "pdf_server")
+        )
         
         # Send the PDF file
-        return send_file(
-            pdf_path,
+        response = send_file(
+            result.pdf_path,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'{doc_type}_{doc_data.get("bestellnummer", "unknown")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+            download_name=download_name(doc_type, doc_data)
         )
+        for header, value in pdf_response_headers(doc_type, doc_data, result).items():
+            if header != 'Content-Disposition':
+                response.headers[header] = value
+        return response
         
+    except ValueError as e:
+        # Invalid document data, e.g. a price that is not a number
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         return jsonify({"error": str(e)}), 500
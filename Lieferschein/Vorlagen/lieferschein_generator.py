@@ -1,18 +1,30 @@
+import io
 import os
+import json
+import hashlib
+import shutil
 import tempfile
+import threading
+import subprocess
 from datetime import datetime
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject, StreamObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.units import mm
 from reportlab.lib.colors import black
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Tuple, Optional
+from functools import lru_cache
+from decimal import Decimal, ROUND_HALF_UP
 try:
     from .lieferschein_counter import get_next_lieferschein_number
+    from .number_format import normalize_number
 except ImportError:
     from lieferschein_counter import get_next_lieferschein_number
+    from number_format import normalize_number
 
 # Register fonts if available
 try:
@@ -69,6 +81,7 @@ RECHNUNG_FIELDS = {
     'kunde_plz_ort': (100, 610),
     'positions_start': (80, 500),
     'positions_row_height': 20,
+    'positions_min_y': 230,        # Unterhalb beginnt der Summenblock, dann neue Seite
     'summe_netto': (440, 200),
     'mwst': (440, 180),
     'summe_brutto': (440, 160),
@@ -92,55 +105,133 @@ def create_overlay(data: Dict[str, Any], doc_type: str) -> str:
     c.save()
     return overlay_path
 
-def create_lieferschein_overlay(c: canvas.Canvas, data: Dict[str, Any]):
-    """Create overlay for Lieferschein"""
-    fields = LIEFERSCHEIN_FIELDS
+@lru_cache(maxsize=8192)
+def measure_word(word: str, font: str = DEFAULT_FONT, size: float = 10) -> float:
+    """Width of a single word, memoised per font and size"""
+    return stringWidth(word, font, size)
+
+def wrap_text(text: str, max_width: float, font: str = DEFAULT_FONT, size: float = 10) -> List[str]:
+    """Split text into lines that fit max_width.
+
+    Lines are built from cached word widths (plus the width of the joining
+    spaces), so each word is measured once instead of re-measuring the whole
+    growing line for every word.
+    """
+    space_width = measure_word(' ', font, size)
+    lines = []
+    current_words = []
+    current_width = 0.0
+    
+    for word in text.split():
+        word_width = measure_word(word, font, size)
+        test_width = current_width + space_width + word_width if current_words else word_width
+        
+        if test_width <= max_width or not current_words:
+            current_words.append(word)
+            current_width = test_width
+        else:
+            lines.append(' '.join(current_words))
+            current_words = [word]
+            current_width = word_width
+    
+    if current_words:
+        lines.append(' '.join(current_words))
+    
+    return lines
+
+def layout_lieferschein_rows(positions: List[Dict[str, Any]], fields: Dict[str, Any] = LIEFERSCHEIN_FIELDS) -> List[List[Dict[str, Any]]]:
+    """Measure, wrap and paginate all Lieferschein positions up front.
+
+    Returns one list of rows per page. Every row carries its final y
+    coordinate, so the draw stage does not make any layout decisions.
+    """
+    line_height = 10
+    max_width = fields['menge_x'] - fields['beschreibung_x'] - 20
+    start_y = fields['positions_start'][1]
+    min_y = fields['positions_min_y']
+    
+    pages = [[]]
+    y = start_y
+    
+    for i, pos in enumerate(positions):
+        lines = wrap_text(str(pos.get('beschreibung', '') or ''), max_width)
+        vorgang = pos.get('vorgang', '') or ''
+        
+        # Lowest baseline used by the row (extra description lines + Vorgang)
+        extra_lines = max(len(lines), 1) - 1 + (1 if vorgang else 0)
+        depth = extra_lines * line_height
+        
+        # Row height: base height plus extra space for each additional description line
+        height = fields['positions_row_height']
+        if len(lines) > 1:
+            height += (len(lines) - 1) * line_height
+        
+        # Start a new page if the complete row does not fit (an empty page always takes the row)
+        if pages[-1] and y - depth < min_y:
+            pages.append([])
+            y = start_y
+        
+        werkstoff = str(pos.get('werkstoff', '') or '')
+        if len(werkstoff) > 15:
+            werkstoff = werkstoff[:14] + '.'
+        modell = str(pos.get('modellnummer', '') or '')
+        if len(modell) > 12:
+            modell = modell[:11] + '.'
+        menge = pos.get('menge', '')
+        preis = pos.get('preis', '')
+        
+        pages[-1].append({
+            'y': y,
+            'auftrag': f"{i + 1}){pos.get('auftrag', '')}",
+            'lines': lines,
+            'vorgang': vorgang,
+            'fv': str(pos.get('fv', '') or ''),
+            'menge': str(int(float(menge))) if menge else '',
+            'werkstoff': werkstoff,
+            'modell': modell,
+            'preis': f"{float(preis):.2f}" if preis else '',
+        })
+        
+        y -= height
     
-    # Generate Lieferschein number if not provided
-    lieferschein_nr = data.get('lieferschein_nr', '')
-    if not lieferschein_nr:
-        # Get next number from counter (DZ2025-0900 onwards)
-        lieferschein_nr = get_next_lieferschein_number()
+    return pages
+
+def draw_lieferschein_header(c: canvas.Canvas, fields: Dict[str, Any], header: Dict[str, str], with_customer: bool = False):
+    """Draw the header fields and table headings of one Lieferschein page"""
+    draw_lieferschein_header_fields(c, fields, header)
+    draw_lieferschein_page_frame(c, fields, header.get('kunde') if with_customer else None)
+
+def draw_lieferschein_header_fields(c: canvas.Canvas, fields: Dict[str, Any], header: Dict[str, str]):
+    """Draw Lieferschein number, order number and date (change with every document)"""
+    c.setFont(DEFAULT_FONT, 10)
+    c.setFillColor(black)
     
-    # Header fields
     if 'lieferschein_nr' in fields:
-        c.drawString(fields['lieferschein_nr'][0], fields['lieferschein_nr'][1], 
-                    str(lieferschein_nr))
+        c.drawString(fields['lieferschein_nr'][0], fields['lieferschein_nr'][1], header['lieferschein_nr'])
     if 'bestellnummer' in fields:
-        c.drawString(fields['bestellnummer'][0], fields['bestellnummer'][1], 
-                    str(data.get('bestellnummer', '')))
-    
-    # Date field
-    datum_text = str(data.get('datum', datetime.now().strftime('%d.%m.%Y')))
-    
-    # Ensure we only have the date part, no time
-    if ', ' in datum_text:
-        # If there's a comma followed by time, remove it
-        datum_text = datum_text.split(',')[0].strip()
-    
+        c.drawString(fields['bestellnummer'][0], fields['bestellnummer'][1], header['bestellnummer'])
     if 'datum' in fields:
-        c.drawString(fields['datum'][0], fields['datum'][1], datum_text)
+        c.drawString(fields['datum'][0], fields['datum'][1], header['datum'])
+
+def draw_lieferschein_page_frame(c: canvas.Canvas, fields: Dict[str, Any], kunde: Optional[Dict[str, Any]] = None):
+    """Draw customer info (first page only) and the table headings"""
+    c.setFont(DEFAULT_FONT, 10)
+    c.setFillColor(black)
     
-    # Customer info (if available)
-    if data.get('kunde'):
+    if kunde:
         if 'kunde_name' in fields:
             c.drawString(fields['kunde_name'][0], fields['kunde_name'][1], 
-                        str(data['kunde'].get('name', '')))
+                        str(kunde.get('name', '')))
         if 'kunde_adresse' in fields:
             c.drawString(fields['kunde_adresse'][0], fields['kunde_adresse'][1], 
-                        str(data['kunde'].get('adresse', '')))
+                        str(kunde.get('adresse', '')))
         if 'kunde_plz_ort' in fields:
             c.drawString(fields['kunde_plz_ort'][0], fields['kunde_plz_ort'][1], 
-                        f"{data['kunde'].get('plz', '')} {data['kunde'].get('ort', '')}")
+                        f"{kunde.get('plz', '')} {kunde.get('ort', '')}")
     
-    # Only draw table if table fields are defined
+    # Table headers (neue Reihenfolge)
     if 'positions_start' in fields and 'auftrag_x' in fields:
-        # Table headers
         y = fields['positions_start'][1] + 20  # Start slightly higher for headers
-        c.setFont(DEFAULT_FONT, 10)
-        c.setFillColor(black)
-        
-        # Draw table headers
         c.drawString(fields['auftrag_x'], y, "Auftrag")
         c.drawString(fields['beschreibung_x'], y, "Bezeichnung")
         c.drawString(fields['fv_x'], y, "F/V")
@@ -151,132 +242,76 @@ def create_lieferschein_overlay(c: canvas.Canvas, data: Dict[str, Any]):
         
         # Draw line under headers
         c.line(fields['auftrag_x'] - 5, y - 5, fields['preis_x'] + 45, y - 5)
+
+def draw_lieferschein_rows(c: canvas.Canvas, fields: Dict[str, Any], rows: List[Dict[str, Any]]):
+    """Draw pre-laid-out rows; all coordinates come from layout_lieferschein_rows"""
+    c.setFont(DEFAULT_FONT, 10)  # Einheitliche Schriftgröße
+    
+    for row in rows:
+        y = row['y']
         
-        # Positions
-        positions = data.get('positionen', [])
-        y = fields['positions_start'][1]
-        page_positions = 0
+        # Auftrag kombiniert mit Position (Format: 1)FL-10001)
+        c.drawString(fields['auftrag_x'], y, row['auftrag'])
         
-        for i, pos in enumerate(positions):
-            # Check if we need a new page
-            if y < fields['positions_min_y']:
-                c.showPage()  # Create new page
-                c.setFont(DEFAULT_FONT, 10)
-                
-                # Repeat header on new page
-                if 'lieferschein_nr' in fields:
-                    c.drawString(fields['lieferschein_nr'][0], fields['lieferschein_nr'][1], 
-                                str(lieferschein_nr))
-                if 'bestellnummer' in fields:
-                    c.drawString(fields['bestellnummer'][0], fields['bestellnummer'][1], 
-                                str(data.get('bestellnummer', '')))
-                # Use the cleaned date text from above
-                if 'datum' in fields:
-                    c.drawString(fields['datum'][0], fields['datum'][1], datum_text)
-                
-                # Repeat table headers on new page (neue Reihenfolge)
-                y_header = fields['positions_start'][1] + 20
-                c.drawString(fields['auftrag_x'], y_header, "Auftrag")
-                c.drawString(fields['beschreibung_x'], y_header, "Bezeichnung")
-                c.drawString(fields['fv_x'], y_header, "F/V")
-                c.drawString(fields['menge_x'], y_header, "Stk")
-                c.drawString(fields['werkstoff_x'], y_header, "Werkstoff")
-                c.drawString(fields['modell_x'], y_header, "Modellnummer")
-                c.drawString(fields['preis_x'], y_header, "EUR/Stk")
-                c.line(fields['auftrag_x'] - 5, y_header - 5, fields['preis_x'] + 45, y_header - 5)
-                
-                y = fields['positions_start'][1]  # Reset Y position
-                page_positions = 0
-            
-            # Auftrag kombiniert mit Position (Format: 1)FL-10001)
-            c.setFont(DEFAULT_FONT, 10)
-            auftrag_text = f"{i + 1}){pos.get('auftrag', '')}"
-            c.drawString(fields['auftrag_x'], y, auftrag_text)
-            
-            # Beschreibung mit automatischem Zeilenumbruch
-            beschreibung = str(pos.get('beschreibung', ''))
-            
-            # Calculate available width for beschreibung (from beschreibung_x to menge_x with some margin)
-            max_width = fields['menge_x'] - fields['beschreibung_x'] - 20
-            
-            # Split text into lines that fit the width
-            from reportlab.pdfbase.pdfmetrics import stringWidth
-            
-            lines = []
-            current_line = ""
-            words = beschreibung.split()
-            
-            for word in words:
-                test_line = current_line + " " + word if current_line else word
-                line_width = stringWidth(test_line, DEFAULT_FONT, 10)
-                
-                if line_width <= max_width:
-                    current_line = test_line
-                else:
-                    if current_line:
-                        lines.append(current_line)
-                    current_line = word
-            
-            if current_line:
-                lines.append(current_line)
-            
-            # Draw the first line at the normal position
-            if lines:
-                c.drawString(fields['beschreibung_x'], y, lines[0])
-                
-                # Draw additional lines below
-                for i, line in enumerate(lines[1:], 1):
-                    c.setFont(DEFAULT_FONT, 10)  # Einheitliche Schriftgröße
-                    c.drawString(fields['beschreibung_x'], y - (i * 10), line)
-            
-            # Vorgang unter der Beschreibung
-            vorgang = pos.get('vorgang', '')
-            if vorgang:
-                c.setFont(DEFAULT_FONT, 10)  # Einheitliche Schriftgröße
-                # Position vorgang below all description lines
-                vorgang_y = y - (len(lines) * 10) if lines else y - 10
-                c.drawString(fields['beschreibung_x'], vorgang_y, vorgang)
-            
-            # F/V
-            c.setFont(DEFAULT_FONT, 10)
-            fv = pos.get('fv', '')
-            if fv:
-                c.drawString(fields['fv_x'], y, str(fv))
-            
-            # Stk (Menge)
-            menge = pos.get('menge', '')
-            if menge:
-                c.drawString(fields['menge_x'], y, str(int(float(menge))))
-            
-            # Werkstoff
-            werkstoff = pos.get('werkstoff', '')
-            if werkstoff:
-                # Kürze Werkstoff wenn zu lang
-                if len(werkstoff) > 15:
-                    werkstoff = werkstoff[:14] + '.'
-                c.drawString(fields['werkstoff_x'], y, werkstoff)
-            
-            # Modellnummer
-            modell = pos.get('modellnummer', '')
-            if modell:
-                # Kürze Modellnummer wenn zu lang
-                if len(modell) > 12:
-                    modell = modell[:11] + '.'
-                c.drawString(fields['modell_x'], y, modell)
-            
-            # EUR/Stk (Preis)
-            preis = pos.get('preis', '')
-            if preis:
-                c.drawString(fields['preis_x'], y, f"{float(preis):.2f}")
-            
-            # Calculate actual row height based on number of description lines
-            actual_row_height = fields['positions_row_height']
-            if lines and len(lines) > 1:
-                # Add extra space for each additional line
-                actual_row_height += (len(lines) - 1) * 10
-            
-            y -= actual_row_height
-            page_positions += 1
+        # Beschreibung, additional lines below the first
+        lines = row['lines']
+        for line_no, line in enumerate(lines):
+            c.drawString(fields['beschreibung_x'], y - (line_no * 10), line)
+        
+        # Vorgang unter der Beschreibung
+        if row['vorgang']:
+            vorgang_y = y - (len(lines) * 10) if lines else y - 10
+            c.drawString(fields['beschreibung_x'], vorgang_y, row['vorgang'])
+        
+        if row['fv']:
+            c.drawString(fields['fv_x'], y, row['fv'])
+        if row['menge']:
+            c.drawString(fields['menge_x'], y, row['menge'])
+        if row['werkstoff']:
+            c.drawString(fields['werkstoff_x'], y, row['werkstoff'])
+        if row['modell']:
+            c.drawString(fields['modell_x'], y, row['modell'])
+        if row['preis']:
+            c.drawString(fields['preis_x'], y, row['preis'])
+
+def lieferschein_header(data: Dict[str, Any], lieferschein_nr: str) -> Dict[str, Any]:
+    """Header values printed on every Lieferschein page"""
+    # Date field
+    datum_text = str(data.get('datum', datetime.now().strftime('%d.%m.%Y')))
+    
+    # Ensure we only have the date part, no time
+    if ', ' in datum_text:
+        # If there's a comma followed by time, remove it
+        datum_text = datum_text.split(',')[0].strip()
+    
+    return {
+        'lieferschein_nr': str(lieferschein_nr),
+        'bestellnummer': str(data.get('bestellnummer', '')),
+        'datum': datum_text,
+        'kunde': data.get('kunde'),
+    }
+
+def create_lieferschein_overlay(c: canvas.Canvas, data: Dict[str, Any]):
+    """Create overlay for Lieferschein"""
+    fields = LIEFERSCHEIN_FIELDS
+    
+    # Generate Lieferschein number if not provided
+    lieferschein_nr = data.get('lieferschein_nr', '')
+    if not lieferschein_nr:
+        # Get next number from counter (DZ2025-0900 onwards)
+        lieferschein_nr = get_next_lieferschein_number()
+    
+    header = lieferschein_header(data, lieferschein_nr)
+    
+    # Layout stage: all measuring and pagination happens before drawing
+    pages = layout_lieferschein_rows(data.get('positionen', []), fields)
+    
+    # Draw stage
+    for page_no, rows in enumerate(pages):
+        if page_no > 0:
+            c.showPage()  # Create new page
+        draw_lieferschein_header(c, fields, header, with_customer=(page_no == 0))
+        draw_lieferschein_rows(c, fields, rows)
     
 
 def create_laufkarte_overlay(c: canvas.Canvas, data: Dict[str, Any]):
@@ -312,87 +347,147 @@ def create_laufkarte_overlay(c: canvas.Canvas, data: Dict[str, Any]):
         
         y -= fields['positions_row_height'] + 10
 
-def create_rechnung_overlay(c: canvas.Canvas, data: Dict[str, Any]):
-    """Create overlay for Rechnung"""
-    fields = RECHNUNG_FIELDS
-    
-    # Header fields
+CENT = Decimal('0.01')
+MWST_SATZ = Decimal('0.19')
+
+def to_decimal(value: Any) -> Decimal:
+    """Convert a menge/preis value to Decimal (via str to avoid float artefacts).
+
+    German (1.234,56) and English (1,234.56) notation are both read, as in the
+    position import; anything else raises ValueError instead of counting as 0.
+    """
+    text = normalize_number(value)
+    return Decimal('0') if text is None else Decimal(text)
+
+def position_amounts(pos: Dict[str, Any]) -> Tuple[Decimal, Decimal]:
+    """(menge, preis) of a Rechnung position; ValueError names the position"""
+    amounts = []
+    for field in ('menge', 'preis'):
+        try:
+            amounts.append(to_decimal(pos.get(field, 0)))
+        except ValueError as e:
+            raise ValueError(f"Position {pos.get('pos_nr', '?')}, {field}: {str(e)}")
+    return amounts[0], amounts[1]
+
+def format_euro(amount: Decimal) -> str:
+    """Format an amount rounded to cents"""
+    return f"{amount.quantize(CENT, rounding=ROUND_HALF_UP)} €"
+
+def draw_rechnung_header(c: canvas.Canvas, fields: Dict[str, Any], data: Dict[str, Any], with_customer: bool = False):
+    """Draw the header fields of one Rechnung page"""
+    c.setFont(DEFAULT_FONT, 10)
     c.drawString(fields['rechnungsnummer'][0], fields['rechnungsnummer'][1], 
                 f"RE-{data.get('bestellnummer', '')}")
     c.drawString(fields['datum'][0], fields['datum'][1], 
                 str(data.get('datum', datetime.now().strftime('%d.%m.%Y'))))
     
-    # Customer info
-    if data.get('kunde'):
+    # Customer info (only on the first page)
+    if with_customer and data.get('kunde'):
         c.drawString(fields['kunde_name'][0], fields['kunde_name'][1], 
                     str(data['kunde'].get('name', '')))
         c.drawString(fields['kunde_adresse'][0], fields['kunde_adresse'][1], 
                     str(data['kunde'].get('adresse', '')))
         c.drawString(fields['kunde_plz_ort'][0], fields['kunde_plz_ort'][1], 
                     f"{data['kunde'].get('plz', '')} {data['kunde'].get('ort', '')}")
+
+def create_rechnung_overlay(c: canvas.Canvas, data: Dict[str, Any]):
+    """Create overlay for Rechnung.
+
+    Positions are consumed in a single pass (any iterable works), so the
+    invoice covers every position. When a page is full the running net
+    total is printed as "Übertrag" and carried to the top of the next page.
+    """
+    fields = RECHNUNG_FIELDS
+    row_height = fields['positions_row_height']
+    start_y = fields['positions_start'][1]
     
-    # Positions
-    positions = data.get('positionen', [])
-    y = fields['positions_start'][1]
-    total_netto = 0.0
+    draw_rechnung_header(c, fields, data, with_customer=True)
+    
+    y = start_y
+    page_no = 1
+    total_netto = Decimal('0')
     
-    for pos in positions[:15]:
+    for pos in data.get('positionen', []):
+        # Page full: close it with the carried-over subtotal and continue on a new page
+        if y < fields['positions_min_y']:
+            c.setFont(DEFAULT_FONT, 10)
+            c.drawRightString(fields['summe_netto'][0], fields['summe_netto'][1], 
+                             f"Übertrag: {format_euro(total_netto)}")
+            c.showPage()
+            page_no += 1
+            
+            draw_rechnung_header(c, fields, data)
+            y = start_y
+            c.drawString(120, y, f"Übertrag von Seite {page_no - 1}")
+            c.drawRightString(500, y, format_euro(total_netto))
+            y -= row_height
+        
+        c.setFont(DEFAULT_FONT, 10)
+        
         # Position number
         c.drawString(80, y, str(pos.get('pos_nr', '')))
         
         # Beschreibung
         c.drawString(120, y, str(pos.get('beschreibung', '')))
         
+        menge, preis = position_amounts(pos)
+        
         # Menge
-        menge = pos.get('menge', 0)
         if menge:
-            c.drawRightString(380, y, f"{float(menge):.2f}")
+            c.drawRightString(380, y, f"{menge.quantize(CENT, rounding=ROUND_HALF_UP)}")
         
         # Einzelpreis
-        preis = pos.get('preis', 0)
         if preis:
-            c.drawRightString(440, y, f"{float(preis):.2f} €")
+            c.drawRightString(440, y, format_euro(preis))
         
         # Gesamtpreis
         if menge and preis:
-            gesamt = float(menge) * float(preis)
+            gesamt = (menge * preis).quantize(CENT, rounding=ROUND_HALF_UP)
             total_netto += gesamt
-            c.drawRightString(500, y, f"{gesamt:.2f} €")
+            c.drawRightString(500, y, format_euro(gesamt))
         
-        y -= fields['positions_row_height']
+        y -= row_height
     
     # Totals
     c.setFont(DEFAULT_FONT, 10)
     c.drawRightString(fields['summe_netto'][0], fields['summe_netto'][1], 
-                     f"Netto: {total_netto:.2f} €")
+                     f"Netto: {format_euro(total_netto)}")
     
-    mwst = total_netto * 0.19
+    mwst = (total_netto * MWST_SATZ).quantize(CENT, rounding=ROUND_HALF_UP)
     c.drawRightString(fields['mwst'][0], fields['mwst'][1], 
-                     f"MwSt 19%: {mwst:.2f} €")
+                     f"MwSt 19%: {format_euro(mwst)}")
     
     c.setFont(DEFAULT_FONT, 12)
     c.drawRightString(fields['summe_brutto'][0], fields['summe_brutto'][1], 
-                     f"Gesamt: {(total_netto + mwst):.2f} €")
+                     f"Gesamt: {format_euro(total_netto + mwst)}")
+
+def load_template_bytes(template_path: str) -> bytes:
+    """Template file contents, read from disk only when the file changed"""
+    stat = os.stat(template_path)
+    return _read_template(os.path.abspath(template_path), stat.st_size, stat.st_mtime_ns)
+
+@lru_cache(maxsize=16)
+def _read_template(path: str, size: int, mtime_ns: int) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
 
 def merge_with_template(template_path: str, overlay_path: str, output_path: str):
     """Merge overlay with template PDF"""
-    # Read template
-    template_pdf = PdfReader(template_path)
     overlay_pdf = PdfReader(overlay_path)
     output_pdf = PdfWriter()
     
     # Always use fresh template pages
     num_pages_needed = len(overlay_pdf.pages)
     
+    template_bytes = load_template_bytes(template_path)
     for i in range(num_pages_needed):
         # Always use the first template page as base
-        # Open template fresh each time to avoid accumulation
-        with open(template_path, 'rb') as f:
-            fresh_template = PdfReader(f)
-            template_page = fresh_template.pages[0]
-            overlay_page = overlay_pdf.pages[i]
-            template_page.merge_page(overlay_page)
-            output_pdf.add_page(template_page)
+        # Parse the template fresh each time to avoid accumulation (bytes are cached)
+        fresh_template = PdfReader(io.BytesIO(template_bytes))
+        template_page = fresh_template.pages[0]
+        overlay_page = overlay_pdf.pages[i]
+        template_page.merge_page(overlay_page)
+        output_pdf.add_page(template_page)
     
     # Write output
     with open(output_path, 'wb') as f:
@@ -401,8 +496,336 @@ def merge_with_template(template_path: str, overlay_path: str, output_path: str)
     # Clean up
     os.remove(overlay_path)
 
+# Output optimisation for archived and mailed PDFs
+PDF_OPTIMIZE = os.getenv("PDF_OPTIMIZE", "true").lower() == "true"
+PDF_LINEARIZE = os.getenv("PDF_LINEARIZE", "false").lower() == "true"
+DEDUP_RESOURCE_TYPES = ('/Font', '/XObject', '/ExtGState', '/ColorSpace', '/Pattern', '/Shading')
+
+def _object_digest(obj: Any, memo: Dict[Tuple[int, int], str]) -> str:
+    """Content hash of a PDF object, following indirect references"""
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = f"cycle:{obj.idnum}"  # Guard against reference cycles
+            memo[key] = _object_digest(obj.get_object(), memo)
+        return memo[key]
+    
+    h = hashlib.sha256()
+    if isinstance(obj, DictionaryObject):
+        h.update(b'stream' if isinstance(obj, StreamObject) else b'dict')
+        for k in sorted(obj.keys()):
+            if k in ('/Length', '/Parent'):
+                continue
+            h.update(k.encode('utf-8'))
+            h.update(_object_digest(obj.raw_get(k), memo).encode('ascii'))
+        if isinstance(obj, StreamObject):
+            try:
+                h.update(obj.get_data() or b'')
+            except Exception:
+                # Filter PyPDF2 cannot decode: never treat the stream as a duplicate
+                h.update(f"opaque:{id(obj)}".encode('ascii'))
+    elif isinstance(obj, ArrayObject):
+        h.update(b'array')
+        for item in obj:
+            h.update(_object_digest(item, memo).encode('ascii'))
+    else:
+        h.update(repr(obj).encode('utf-8'))
+    return h.hexdigest()
+
+def _dedupe_page_resources(reader: PdfReader) -> int:
+    """Point identical fonts, images and graphic states of all pages at one object.
+
+    merge_with_template copies the template resources for every page; after
+    this only the first copy is referenced, so the writer stores it once.
+    """
+    memo: Dict[Tuple[int, int], str] = {}
+    canonical: Dict[str, IndirectObject] = {}
+    replaced = 0
+    
+    for page in reader.pages:
+        resources = page.get('/Resources')
+        if resources is None:
+            continue
+        resources = resources.get_object()
+        for resource_type in DEDUP_RESOURCE_TYPES:
+            group = resources.get(resource_type)
+            if group is None:
+                continue
+            group = group.get_object()
+            for name in list(group.keys()):
+                ref = group.raw_get(name)
+                if not isinstance(ref, IndirectObject):
+                    continue
+                first = canonical.setdefault(_object_digest(ref, memo), ref)
+                if first.idnum != ref.idnum:
+                    group[NameObject(name)] = first
+                    replaced += 1
+    return replaced
+
+def _compress_page_content(writer: PdfWriter, page: PageObject):
+    """Join the page's content streams into one Flate-compressed stream.
+
+    PageObject.compress_content_streams of the pinned PyPDF2 3.0.1 stores the
+    stream as a direct object, which is invalid PDF, so the stream is
+    registered as an indirect object. PdfWriter has no public method for that;
+    optimize_pdf verifies the result, and PdfWriter._add_object is only used
+    where it exists.
+    """
+    contents = page.get('/Contents')
+    if contents is None:
+        return
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, ArrayObject) else [contents]
+    data = b'\n'.join(stream.get_object().get_data() for stream in streams)
+    
+    decoded = DecodedStreamObject()
+    decoded.set_data(data)
+    add_object = getattr(writer, '_add_object', None)
+    if add_object is None:
+        # Newer releases register the joined stream as an indirect object themselves
+        page.compress_content_streams()
+        return
+    page[NameObject('/Contents')] = add_object(decoded.flate_encode())
+
+def _verify_pdf(pdf_path: str, page_count: int) -> bool:
+    """Whether an optimised PDF opens with all pages and readable content streams"""
+    try:
+        reader = PdfReader(pdf_path, strict=True)
+        if len(reader.pages) != page_count:
+            raise ValueError(f"{len(reader.pages)} pages instead of {page_count}")
+        for page in reader.pages:
+            contents = page.get_contents()
+            if contents is not None:
+                contents.get_data()
+    except Exception as e:
+        print(f"Warning: Optimised PDF failed verification, keeping the original: {str(e)}")
+        return False
+    return True
+
+def _linearize(pdf_path: str) -> bool:
+    """Linearise for fast web view with qpdf, if it is installed"""
+    qpdf = shutil.which('qpdf')
+    if not qpdf:
+        return False
+    tmp_path = pdf_path + '.lin'
+    result = subprocess.run([qpdf, '--linearize', pdf_path, tmp_path], capture_output=True)
+    # qpdf exit code 3 means success with warnings
+    if result.returncode in (0, 3) and os.path.exists(tmp_path):
+        os.replace(tmp_path, pdf_path)
+        return True
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return False
+
+def optimize_pdf(pdf_path: str, linearize: bool = PDF_LINEARIZE) -> Dict[str, Any]:
+    """Shrink a generated PDF in place and report the bytes saved.
+
+    - identical resources (template fonts and images) are stored once
+    - content streams are joined and Flate-compressed
+    - optionally linearised for fast web view (needs qpdf)
+
+    Registered TrueType fonts (Cambria/Arial) need no extra step: ReportLab
+    only embeds the subset of glyphs actually used.
+    """
+    original_bytes = os.path.getsize(pdf_path)
+    
+    reader = PdfReader(pdf_path)
+    deduplicated = _dedupe_page_resources(reader)
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    for page in writer.pages:
+        _compress_page_content(writer, page)
+    
+    tmp_path = pdf_path + '.opt'
+    with open(tmp_path, 'wb') as f:
+        writer.write(f)
+    
+    # Keep the original if optimising did not help or the output does not open
+    # (the optimisation relies on PyPDF2 internals, see _compress_page_content)
+    verified = _verify_pdf(tmp_path, len(reader.pages))
+    if verified and os.path.getsize(tmp_path) < original_bytes:
+        os.replace(tmp_path, pdf_path)
+    else:
+        os.remove(tmp_path)
+    
+    linearized = _linearize(pdf_path) if linearize else False
+    optimized_bytes = os.path.getsize(pdf_path)
+    
+    return {
+        'original_bytes': original_bytes,
+        'optimized_bytes': optimized_bytes,
+        'bytes_saved': original_bytes - optimized_bytes,
+        'deduplicated_objects': deduplicated if verified else 0,
+        'linearized': linearized,
+    }
+
+# Chunk size used when streaming generated PDFs to HTTP clients
+PDF_CHUNK_SIZE = 64 * 1024
+
+def iter_pdf_file(pdf_path: str, chunk_size: int = PDF_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a generated PDF in fixed-size chunks.
+
+    Used as the body of streaming HTTP responses so the server never holds
+    more than one chunk of the document in memory.
+    """
+    with open(pdf_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# Cache of rendered Lieferschein page bodies (template + table + rows, without header fields)
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'dzmetall_page_cache'))
+PAGE_CACHE_MAX_FILES = int(os.getenv("PAGE_CACHE_MAX_FILES", 2000))
+PAGE_LAYOUT_VERSION = 1  # Bump when page drawing changes
+
+def lieferschein_page_plan(data: Dict[str, Any], template_path: str) -> List[Dict[str, Any]]:
+    """Paginate the positions and hash the inputs of every page body.
+
+    Each entry lists the positions on the page and a content hash over the
+    template, the customer block (first page) and the laid-out rows including
+    their y coordinates, so any edit or pagination shift changes the hash.
+    Header fields (number, order number, date) are stamped separately and are
+    not part of the hash.
+    """
+    stat = os.stat(template_path)
+    template_id = f"{os.path.abspath(template_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    pages = layout_lieferschein_rows(data.get('positionen', []), LIEFERSCHEIN_FIELDS)
+    
+    plan = []
+    first_index = 0
+    for page_no, rows in enumerate(pages):
+        kunde = data.get('kunde') if page_no == 0 else None
+        payload = json.dumps(
+            {'v': PAGE_LAYOUT_VERSION, 'font': DEFAULT_FONT, 'template': template_id,
+             'kunde': kunde, 'rows': rows},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        plan.append({
+            'page': page_no + 1,
+            'positions': list(range(first_index, first_index + len(rows))),
+            'hash': hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+            'rows': rows,
+            'kunde': kunde,
+        })
+        first_index += len(rows)
+    return plan
+
+def _render_page_body(template_path: str, page: Dict[str, Any], body_path: str) -> bytes:
+    """Render one page body (template + customer/table frame + rows) into the page cache.
+
+    Returns the rendered PDF, so the caller never depends on the cached file
+    surviving a concurrent _prune_page_cache.
+    """
+    overlay_path = tempfile.mktemp(suffix='.pdf')
+    c = canvas.Canvas(overlay_path, pagesize=A4)
+    draw_lieferschein_page_frame(c, LIEFERSCHEIN_FIELDS, page['kunde'])
+    draw_lieferschein_rows(c, LIEFERSCHEIN_FIELDS, page['rows'])
+    c.save()
+    
+    # Write under a temporary name so concurrent renders never see a partial page
+    tmp_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    merge_with_template(template_path, overlay_path, tmp_path)
+    with open(tmp_path, 'rb') as f:
+        body = f.read()
+    os.replace(tmp_path, body_path)
+    return body
+
+def _load_page_body(body_path: str) -> Optional[bytes]:
+    """Cached page body, None if it is not cached (or was just pruned by another request)"""
+    try:
+        with open(body_path, 'rb') as f:
+            body = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(body_path)  # Mark as recently used
+    except OSError:
+        pass
+    return body
+
+def _prune_page_cache():
+    """Keep the page cache below PAGE_CACHE_MAX_FILES, dropping least recently used pages"""
+    try:
+        entries = [e for e in os.scandir(PAGE_CACHE_DIR) if e.name.endswith('.pdf')]
+    except OSError:
+        return
+    if len(entries) <= PAGE_CACHE_MAX_FILES:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - PAGE_CACHE_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def render_lieferschein_incremental(data: Dict[str, Any], template_path: str, output_path: str) -> Dict[str, Any]:
+    """Render a Lieferschein, re-drawing only page bodies whose inputs changed.
+
+    Unchanged page bodies are taken from the page cache; the per-document
+    header fields are stamped onto every page from one small overlay.
+    Returns the page plan (positions and hash per page) and the pages rendered.
+    """
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    plan = lieferschein_page_plan(data, template_path)
+    
+    rendered = []
+    bodies = []
+    for page in plan:
+        body_path = os.path.join(PAGE_CACHE_DIR, f"{page['hash']}.pdf")
+        # Read the cached body in one step: checking for it first and reading it
+        # later could race with _prune_page_cache in another request or process
+        body = _load_page_body(body_path)
+        if body is None:
+            body = _render_page_body(template_path, page, body_path)
+            rendered.append(page['page'])
+        bodies.append(body)
+    
+    # Header fields for all pages in one overlay
+    header = lieferschein_header(data, data.get('lieferschein_nr', ''))
+    header_path = tempfile.mktemp(suffix='.pdf')
+    c = canvas.Canvas(header_path, pagesize=A4)
+    for page_no in range(len(plan)):
+        if page_no > 0:
+            c.showPage()
+        draw_lieferschein_header_fields(c, LIEFERSCHEIN_FIELDS, header)
+    c.save()
+    
+    # Splice cached bodies with the header stamps
+    header_pdf = PdfReader(header_path)
+    output_pdf = PdfWriter()
+    for i, body in enumerate(bodies):
+        body_page = PdfReader(io.BytesIO(body)).pages[0]
+        body_page.merge_page(header_pdf.pages[i])
+        output_pdf.add_page(body_page)
+    
+    with open(output_path, 'wb') as f:
+        output_pdf.write(f)
+    os.remove(header_path)
+    
+    if rendered:
+        _prune_page_cache()
+    
+    return {
+        'pages': [{'page': p['page'], 'positions': p['positions'], 'hash': p['hash']} for p in plan],
+        'rendered_pages': rendered,
+    }
+
 def generate_lieferschein(data: Dict[str, Any]) -> str:
     """Generate Lieferschein PDF"""
+    return generate_lieferschein_with_number(data)[0]
+
+def generate_lieferschein_with_number(data: Dict[str, Any]) -> Tuple[str, str]:
+    """Generate Lieferschein PDF and return (pdf_path, lieferschein_nr).
+
+    The number is allocated here (unless provided in data) so callers get the
+    number actually printed on the document.
+    """
+    lieferschein_nr = data.get('lieferschein_nr') or get_next_lieferschein_number()
+    data = {**data, 'lieferschein_nr': lieferschein_nr}
+    
     template_path = os.path.join(os.path.dirname(__file__), 'ls_vorlage.pdf')
     if not os.path.exists(template_path):
         # Try alternative path
@@ -411,10 +834,9 @@ def generate_lieferschein(data: Dict[str, Any]) -> str:
             create_blank_template(template_path, "LIEFERSCHEIN")
     
     output_path = tempfile.mktemp(suffix='_lieferschein.pdf')
-    overlay_path = create_overlay(data, 'lieferschein')
-    merge_with_template(template_path, overlay_path, output_path)
+    render_lieferschein_incremental(data, template_path, output_path)
     
-    return output_path
+    return output_path, lieferschein_nr
 
 def generate_laufkarte(data: Dict[str, Any]) -> str:
     """Generate Laufkarte PDF"""
@@ -0,0 +1,59 @@
+"""
+Parsing of numbers written in German (1.234,50) or English (1,234.50) notation.
+
+Shared by the position import and the Rechnung generator, so a price is read
+the same way when it is imported and when it is printed. No dependencies
+beyond the standard library: the PDF server imports it as well.
+"""
+
+import math
+from typing import Any, Optional
+
+def _strip_thousands(text: str, separator: str) -> str:
+    groups = text.split(separator)
+    head = groups[0].lstrip('+-')
+    if not head.isdigit() or len(head) > 3 or any(len(g) != 3 or not g.isdigit() for g in groups[1:]):
+        raise ValueError(f"'{text}' is not a number")
+    return text.replace(separator, '')
+
+def normalize_number(value: Any) -> Optional[str]:
+    """Number as plain text with '.' as decimal separator, None for an empty value.
+
+    The separator that comes last is the decimal separator, the other one
+    groups thousands. A single separator followed by exactly three digits
+    (1.234, 2,500) could be either and is rejected with ValueError, as is
+    anything else that is not a number.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"'{value}' is not a number")
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError(f"'{value}' is not a number")
+        return str(value)
+    text = str(value).strip().replace(' ', '').replace('€', '')
+    if not text:
+        return None
+    last_comma, last_dot = text.rfind(','), text.rfind('.')
+    if last_comma >= 0 and last_dot >= 0:
+        decimal = ',' if last_comma > last_dot else '.'
+        integer, fraction = text.rsplit(decimal, 1)
+        if decimal in integer:
+            raise ValueError(f"'{value}' is not a number")
+        text = _strip_thousands(integer, '.' if decimal == ',' else ',') + '.' + fraction
+    elif text.count(',') > 1 or text.count('.') > 1:
+        text = _strip_thousands(text, ',' if ',' in text else '.')
+    elif last_comma >= 0 or last_dot >= 0:
+        integer, fraction = text.replace(',', '.').split('.')
+        head = integer.lstrip('+-')
+        if len(fraction) == 3 and head.isdigit() and len(head) <= 3 and not head.startswith('0'):
+            raise ValueError(f"'{value}' is ambiguous (thousands or decimal separator?)")
+        text = f"{integer}.{fraction}"
+    try:
+        finite = math.isfinite(float(text))
+    except ValueError:
+        finite = False
+    if not finite:
+        raise ValueError(f"'{value}' is not a number")
+    return text
@@ -0,0 +1,111 @@
+"""
+In-memory autocomplete for position fields (Werkstoff, Modellnummer, Beschreibung).
+
+Per field, the distinct values are kept in a list sorted by their lowercase
+form, so all values with a given prefix form one contiguous slice found with
+bisect. Every value carries a usage count; suggestions are the most used
+values of that slice. The index is built once from the positionen table
+(counted first, sorted once) and then updated with every position the backend
+writes.
+"""
+
+import bisect
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+AUTOCOMPLETE_FIELDS = ('werkstoff', 'modellnummer', 'beschreibung')
+# Candidates examined per request; bounds the work for one-letter prefixes
+MAX_SCAN = 5000
+
+class _FieldIndex:
+    def __init__(self):
+        self.keys: List[Tuple[str, str]] = []  # sorted (lowercase, value)
+        self.counts: Dict[str, int] = {}
+
+    def add(self, value: str, count: int = 1):
+        if value not in self.counts:
+            bisect.insort(self.keys, (value.lower(), value))
+            self.counts[value] = 0
+        self.counts[value] += count
+
+    def add_counts(self, counts: Dict[str, int]):
+        """Merge many values at once: one sort instead of an insort per value"""
+        new_keys = [(value.lower(), value) for value in counts if value not in self.counts]
+        for value, count in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        if new_keys:
+            self.keys = sorted(self.keys + new_keys) if self.keys else sorted(new_keys)
+
+    def suggest(self, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        needle = prefix.lower()
+        start = bisect.bisect_left(self.keys, (needle, ''))
+        candidates = []
+        for lowered, value in self.keys[start:start + MAX_SCAN]:
+            if not lowered.startswith(needle):
+                break
+            candidates.append(value)
+        top = heapq.nlargest(limit, candidates, key=lambda v: (self.counts[v], -len(v)))
+        return [{"value": value, "count": self.counts[value]} for value in top]
+
+class AutocompleteIndex:
+    """Prefix index with usage counts for the AUTOCOMPLETE_FIELDS of positions"""
+
+    def __init__(self, fields: Iterable[str] = AUTOCOMPLETE_FIELDS):
+        self.fields = tuple(fields)
+        self._indexes = {field: _FieldIndex() for field in self.fields}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def add_positions(self, positions: Iterable[Dict[str, Any]]):
+        """Count the field values of written positions.
+
+        Edits only add: a replaced value keeps its count, which merely makes
+        it rank a little higher than it should until the next restart.
+        """
+        with self._lock:
+            for position in positions:
+                for field in self.fields:
+                    value = position.get(field)
+                    if value is None:
+                        continue
+                    value = str(value).strip()
+                    if value:
+                        self._indexes[field].add(value)
+
+    def build(self, positions: Iterable[Dict[str, Any]]):
+        """Bulk load (initial build): count first, then sort each field once.
+
+        add_positions inserts value by value and is meant for live updates;
+        for a full table it would be quadratic.
+        """
+        counts = {field: Counter() for field in self.fields}
+        for position in positions:
+            for field in self.fields:
+                value = position.get(field)
+                if value is None:
+                    continue
+                value = str(value).strip()
+                if value:
+                    counts[field][value] += 1
+        with self._lock:
+            for field in self.fields:
+                self._indexes[field].add_counts(counts[field])
+
+    def suggest(self, field: str, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most used values of field starting with prefix (case-insensitive)"""
+        if field not in self._indexes:
+            raise ValueError(f"Unknown field: {field}")
+        with self._lock:
+            return self._indexes[field].suggest(prefix.strip(), limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                **{field: len(index.keys) for field, index in self._indexes.items()}
+            }
+
+# Process-wide index used by the backend routes
+AUTOCOMPLETE = AutocompleteIndex()
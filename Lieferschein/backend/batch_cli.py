@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Offline batch jobs for backfills: bulk extraction of scans and bulk rendering.
+
+    python batch_cli.py extract SCANS_DIR [SCANS_DIR ...] [--recursive] [--store]
+    python batch_cli.py render --from BL-2024-0001 --to BL-2024-0999 --out DIR [--type laufkarte ...]
+    python batch_cli.py render --orders BL-1 BL-2 --out DIR
+
+extract runs app.ocr.process_image on every scan (same file types as the hot
+folder) and, with --store, writes orders and positions to Supabase. Positions
+are upserted on (bestellnummer, pos_nr), so re-extracting a scan replaces its
+positions instead of duplicating them. render loads the orders and their
+positions from Supabase and renders them with pdf_service.render_document
+(the lieferschein_generator functions plus optimisation and archiving) into
+--out. A Lieferschein is reprinted under the number it was issued with (from
+document_history); orders without one fail unless --allocate-numbers is given.
+
+The tasks run on a multiprocessing pool (--workers). Every finished task is
+appended to the JSONL results log (--log), which is also the checkpoint: a
+rerun with the same log skips the tasks that already succeeded, so an
+interrupted backfill is resumed by running the same command again. Progress
+with throughput and ETA is written to stderr.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import asyncio
+import argparse
+import multiprocessing
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(current_dir, '..'))
+sys.path.insert(0, os.path.join(current_dir, '../Vorlagen'))
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(current_dir, '../../.env'))
+
+DOCUMENT_TYPES = ('lieferschein', 'laufkarte', 'rechnung')
+PAGE_SIZE = 1000
+PROGRESS_INTERVAL = 0.5  # seconds between progress lines
+
+# One Supabase client per worker process, created on first use
+_client: Optional[httpx.Client] = None
+
+def supabase() -> Tuple[httpx.Client, str]:
+    global _client
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
+    if _client is None:
+        _client = httpx.Client(timeout=30, headers={
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json"
+        })
+    return _client, url
+
+# --- Checkpoint / results log ---
+
+def load_checkpoint(log_path: str) -> Set[str]:
+    """Keys of the tasks that already succeeded according to the results log"""
+    done = set()
+    if not os.path.exists(log_path):
+        return done
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # last line of an interrupted run
+            if record.get('status') == 'ok':
+                done.add(record['key'])
+            else:
+                done.discard(record.get('key'))
+    return done
+
+class Progress:
+    """Progress line on stderr: done/total, throughput and ETA"""
+
+    def __init__(self, total: int, skipped: int = 0, unit: str = 'tasks'):
+        self.total = total
+        self.skipped = skipped
+        self.unit = unit
+        self.ok = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._printed = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.failed
+
+    def update(self, record: Dict[str, Any]):
+        if record['status'] == 'ok':
+            self.ok += 1
+        else:
+            self.failed += 1
+        now = time.monotonic()
+        if now - self._printed >= PROGRESS_INTERVAL or self.done == self.total:
+            self._printed = now
+            self.print(now)
+
+    def print(self, now: Optional[float] = None):
+        elapsed = max((now or time.monotonic()) - self.started, 1e-6)
+        rate = self.done / elapsed
+        remaining = self.total - self.done
+        eta = format_duration(remaining / rate) if rate > 0 else '--:--'
+        percent = 100.0 * self.done / self.total if self.total else 100.0
+        sys.stderr.write(
+            f"\r[{self.done}/{self.total}] {percent:5.1f}%  {rate:.2f} {self.unit}/s  "
+            f"ETA {eta}  ok={self.ok} failed={self.failed}"
+        )
+        sys.stderr.flush()
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return (f"{self.ok} ok, {self.failed} failed, {self.skipped} skipped (already done) "
+                f"in {format_duration(elapsed)}")
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+# --- Pool ---
+
+def _init_worker():
+    # Ctrl+C is handled by the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _run_task(job: Tuple[Callable[..., Dict[str, Any]], str, Tuple]) -> Dict[str, Any]:
+    func, key, args = job
+    started = time.monotonic()
+    record = {"key": key}
+    try:
+        record["result"] = func(*args)
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = str(e)
+    record["duration_ms"] = round((time.monotonic() - started) * 1000)
+    record["at"] = datetime.now().isoformat()
+    return record
+
+def run_batch(jobs: List[Tuple[Callable[..., Dict[str, Any]], str, Tuple]], log_path: str,
+              workers: int, unit: str) -> int:
+    """Run the jobs not yet done according to the log; returns the number of failures"""
+    done = load_checkpoint(log_path)
+    pending = [job for job in jobs if job[1] not in done]
+    progress = Progress(len(pending), skipped=len(jobs) - len(pending), unit=unit)
+    print(f"{len(jobs)} tasks, {progress.skipped} already done, {len(pending)} to run on {workers} workers",
+          file=sys.stderr)
+    if not pending:
+        return 0
+
+    pool = multiprocessing.Pool(workers, initializer=_init_worker)
+    try:
+        with open(log_path, 'a', encoding='utf-8') as log:
+            for record in pool.imap_unordered(_run_task, pending):
+                log.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                log.flush()
+                progress.update(record)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print(f"\nInterrupted - run the same command again to resume from {log_path}", file=sys.stderr)
+        raise SystemExit(130)
+    finally:
+        pool.join()
+    print(f"\n{progress.summary()}; results in {log_path}", file=sys.stderr)
+    return progress.failed
+
+# --- extract ---
+
+def iter_scan_files(directories: Iterable[str], recursive: bool) -> Iterator[str]:
+    from hotfolder import is_candidate
+    for directory in directories:
+        if recursive:
+            for root, dirs, files in os.walk(directory):
+                dirs.sort()
+                for name in sorted(files):
+                    if is_candidate(name):
+                        yield os.path.abspath(os.path.join(root, name))
+        else:
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path) and is_candidate(name):
+                    yield os.path.abspath(path)
+
+def extract_file(path: str, store: bool) -> Dict[str, Any]:
+    from app.ocr import process_image
+    with open(path, 'rb') as f:
+        content = f.read()
+    extracted_data = asyncio.run(process_image(content, os.path.basename(path)))
+    if not extracted_data:
+        raise ValueError("No order number (BL-) or position items (FL-) found in the document")
+    if store:
+        store_extracted_data(extracted_data)
+    return extracted_data
+
+def store_extracted_data(extracted_data: Dict[str, Any]):
+    """Write order and positions of an extraction result (idempotent, unlike /api/extract)"""
+    bestellnummer = extracted_data.get("bestellnummer")
+    if not bestellnummer:
+        return
+    client, url = supabase()
+    response = client.post(
+        f"{url}/rest/v1/bestellungen?on_conflict=bestellnummer",
+        headers={"Prefer": "resolution=ignore-duplicates,return=minimal"},
+        json=[{"bestellnummer": bestellnummer}]
+    )
+    if response.status_code not in (200, 201):
+        raise RuntimeError(f"Failed to create order: {response.text}")
+
+    positions = [{**pos, "bestellnummer": bestellnummer} for pos in extracted_data.get("positionen") or []]
+    if not positions:
+        return
+    # A bulk upsert needs the same keys in every row and may not touch a row twice
+    columns = sorted({column for pos in positions for column in pos})
+    positions = list({
+        (pos["bestellnummer"], pos.get("pos_nr")): {column: pos.get(column) for column in columns}
+        for pos in positions
+    }.values())
+    response = client.post(
+        f"{url}/rest/v1/positionen?on_conflict=bestellnummer,pos_nr",
+        headers={"Prefer": "resolution=merge-duplicates,return=minimal"},
+        json=positions
+    )
+    if response.status_code not in (200, 201):
+        raise RuntimeError(f"Failed to create positions: {response.text}")
+
+def command_extract(args) -> int:
+    jobs = [(extract_file, path, (path, args.store)) for path in iter_scan_files(args.directories, args.recursive)]
+    return run_batch(jobs, args.log or 'batch_extract.jsonl', args.workers, 'files')
+
+# --- render ---
+
+def _fetch_pages(table: str, params: List[Tuple[str, str]], order_column: str) -> Iterator[List[Dict[str, Any]]]:
+    """Keyset-paged select (PostgREST caps page sizes)"""
+    client, url = supabase()
+    last = None
+    while True:
+        page_params = params + [("order", f"{order_column}.asc"), ("limit", str(PAGE_SIZE))]
+        if last is not None:
+            page_params.append((order_column, f"gt.{last}"))
+        response = client.get(f"{url}/rest/v1/{table}", params=page_params)
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to load {table}: {response.text}")
+        page = response.json()
+        yield page
+        if len(page) < PAGE_SIZE:
+            break
+        last = page[-1][order_column]
+
+def order_selection(order_from: Optional[str], order_to: Optional[str], orders: Optional[List[str]]) -> List[Tuple[str, str]]:
+    """PostgREST filter for the selected orders"""
+    if orders:
+        return [("bestellnummer", f"in.({','.join(json.dumps(o) for o in orders)})")]
+    selection = []
+    if order_from:
+        selection.append(("bestellnummer", f"gte.{order_from}"))
+    if order_to:
+        selection.append(("bestellnummer", f"lte.{order_to}"))
+    return selection
+
+def load_orders(selection: List[Tuple[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Positions (ordered by pos_nr, like /api/positions) of the selected orders"""
+    result: Dict[str, List[Dict[str, Any]]] = {}
+    for page in _fetch_pages("bestellungen", selection + [("select", "bestellnummer")], "bestellnummer"):
+        for order in page:
+            result[order["bestellnummer"]] = []
+    for page in _fetch_pages("positionen", selection + [("select", "*")], "id"):
+        for position in page:
+            if position.get("bestellnummer") in result:
+                result[position["bestellnummer"]].append(position)
+    for positions in result.values():
+        positions.sort(key=lambda p: str(p.get("pos_nr") or ''))
+    return result
+
+def load_issued_numbers(selection: List[Tuple[str, str]]) -> Dict[str, str]:
+    """Number of the latest Lieferschein issued per order, from document_history"""
+    from pdf_service import history_document_data
+    numbers = {}
+    params = selection + [
+        ("document_type", "eq.lieferschein"),
+        ("select", "id,bestellnummer,document_type,metadata,lieferschein_nr:document_data->>lieferschein_nr")
+    ]
+    for page in _fetch_pages("document_history", params, "id"):
+        for history in page:
+            # Pages are ordered by id, so the latest entry wins
+            document_data = {"lieferschein_nr": history.pop("lieferschein_nr", None)}
+            number = history_document_data({**history, "document_data": document_data}).get("lieferschein_nr")
+            if number:
+                numbers[history["bestellnummer"]] = number
+    return numbers
+
+def render_order_document(doc_type: str, doc_data: Dict[str, Any], out_dir: str,
+                          allocate_numbers: bool = False) -> Dict[str, Any]:
+    from pdf_service import render_document
+    if doc_type == 'lieferschein' and not doc_data.get('lieferschein_nr') and not allocate_numbers:
+        # A reprint must not burn numbers of the live counter or issue the document twice
+        raise ValueError("No Lieferschein issued for this order yet; use --allocate-numbers to allocate a new number")
+    result = render_document(doc_type, doc_data)
+    # Stable name: a resumed or repeated run replaces the file instead of adding one
+    target = os.path.join(out_dir, f"{doc_type}_{doc_data['bestellnummer']}.pdf")
+    shutil.move(result.pdf_path, target)
+    return {
+        "bestellnummer": doc_data["bestellnummer"],
+        "document_type": doc_type,
+        "document_number": result.document_number,
+        "path": target,
+        "bytes": os.path.getsize(target),
+        "file_path": result.file_path
+    }
+
+def command_render(args) -> int:
+    from pdf_service import normalize_order_data
+    if not (args.order_from or args.order_to or args.orders):
+        raise SystemExit("render needs --from/--to or --orders")
+    os.makedirs(args.out, exist_ok=True)
+    doc_types = args.types or ['laufkarte']
+    selection = order_selection(args.order_from, args.order_to, args.orders)
+    orders = load_orders(selection)
+    issued_numbers = load_issued_numbers(selection) if 'lieferschein' in doc_types else {}
+    jobs = []
+    for bestellnummer, positions in orders.items():
+        doc_data = normalize_order_data({
+            'bestellnummer': bestellnummer,
+            'datum': args.datum,
+            'positionen': positions
+        })
+        for doc_type in doc_types:
+            data = doc_data
+            if doc_type == 'lieferschein' and bestellnummer in issued_numbers:
+                # Reprint under the number the order's Lieferschein was issued with
+                data = {**doc_data, 'lieferschein_nr': issued_numbers[bestellnummer]}
+            jobs.append((render_order_document, f"{doc_type}:{bestellnummer}",
+                         (doc_type, data, args.out, args.allocate_numbers)))
+    return run_batch(jobs, args.log or os.path.join(args.out, 'batch_render.jsonl'), args.workers, 'documents')
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Batch extraction and rendering for backfills")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--log', help="JSONL results log / checkpoint (rerun with the same log to resume)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract = commands.add_parser('extract', help="OCR scans with process_image")
+    extract.add_argument('directories', nargs='+')
+    extract.add_argument('--recursive', action='store_true', help="include subdirectories")
+    extract.add_argument('--store', action='store_true', help="write orders and positions to Supabase")
+    extract.set_defaults(handler=command_extract)
+
+    render = commands.add_parser('render', help="render documents for a range of orders")
+    render.add_argument('--from', dest='order_from', help="first bestellnummer (inclusive)")
+    render.add_argument('--to', dest='order_to', help="last bestellnummer (inclusive)")
+    render.add_argument('--orders', nargs='+', help="explicit order numbers")
+    render.add_argument('--type', dest='types', action='append', choices=DOCUMENT_TYPES,
+                        help="document type, repeatable (default: laufkarte)")
+    render.add_argument('--datum', help="document date (default: today)")
+    render.add_argument('--out', required=True, help="output directory")
+    render.add_argument('--allocate-numbers', action='store_true',
+                        help="allocate new Lieferschein numbers for orders without an issued one")
+    render.set_defaults(handler=command_render)
+
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    failed = args.handler(args)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
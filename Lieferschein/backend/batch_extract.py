@@ -0,0 +1,216 @@
+"""
+Batch extraction for POST /api/extract/batch: many scans, or ZIP archives of
+scans, through the OCR pipeline of /api/extract.
+
+process_image does its work with blocking calls (Gemini request, Tesseract,
+pdf2image), so documents awaited side by side on the event loop would still
+run one after another. Every document therefore runs process_image on its own
+thread of OCR_POOL, with a private event loop. EXTRACT_BATCH_CONCURRENCY bounds
+how many documents are extracted, and held in memory, at the same time, so a
+stack of scans takes about as long as its slowest documents instead of the sum
+of all of them.
+
+Results are cached by the SHA-256 of the file content: a scan that is part of
+a batch twice, or is uploaded again later, is extracted only once.
+"""
+
+import os
+import copy
+import time
+import asyncio
+import hashlib
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from starlette.concurrency import iterate_in_threadpool
+
+import app.ocr
+from hotfolder import is_candidate
+
+BATCH_CONCURRENCY = max(1, int(os.getenv("EXTRACT_BATCH_CONCURRENCY", 4)))
+MAX_DOCUMENT_BYTES = int(os.getenv("EXTRACT_MAX_DOCUMENT_MB", 50)) * 1024 * 1024
+EXTRACTION_CACHE_SIZE = 256
+
+OCR_POOL = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="ocr")
+
+NO_DATA_ERROR = "No order number (BL-) or position items (FL-) found in the document"
+
+# (name, content, reason the document is skipped)
+Document = Tuple[str, Optional[bytes], Optional[str]]
+
+def process_image_blocking(content: bytes, filename: str) -> Optional[Dict[str, Any]]:
+    """app.ocr.process_image on a private event loop (for a worker thread)"""
+    return asyncio.run(app.ocr.process_image(content, filename))
+
+async def process_image_in_pool(content: bytes, filename: str) -> Optional[Dict[str, Any]]:
+    """Extract one document on OCR_POOL without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(OCR_POOL, process_image_blocking, content, filename)
+
+class ExtractionCache:
+    """Extraction results by content hash; concurrent requests for the same content share one run"""
+
+    def __init__(self, max_entries: int = EXTRACTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def extract(self, content: bytes, filename: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """(extracted data or None, whether it came from the cache)"""
+        digest = hashlib.sha256(content).hexdigest()
+        if digest in self._results:
+            self._results.move_to_end(digest)
+            return copy.deepcopy(self._results[digest]), True
+        if digest in self._inflight:
+            result = await asyncio.shield(self._inflight[digest])
+            return copy.deepcopy(result), True
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Waiters retrieve the exception; without waiters it must not be reported as unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[digest] = future
+        try:
+            result = await process_image_in_pool(content, filename)
+        except BaseException as e:
+            self._inflight.pop(digest, None)
+            # Waiters get the original error, not an empty result
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Extraction cancelled"))
+            raise
+        # Empty extractions are not cached: they may be a passing Gemini error
+        if result:
+            self._results[digest] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        self._inflight.pop(digest, None)
+        future.set_result(result)
+        return copy.deepcopy(result), False
+
+    def clear(self):
+        self._results.clear()
+
+# Process-wide cache used by the batch endpoint
+EXTRACTION_CACHE = ExtractionCache()
+
+def iter_zip_documents(fileobj, archive_name: str) -> Iterator[Document]:
+    """Scans of a ZIP archive, decompressed one member at a time"""
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+            name = f"{archive_name}/{info.filename}"
+            if not is_candidate(os.path.basename(info.filename)):
+                yield name, None, "unsupported file type"
+                continue
+            if info.file_size > MAX_DOCUMENT_BYTES:
+                yield name, None, "file too large"
+                continue
+            with archive.open(info) as member:
+                # Never trust the size in the header
+                content = member.read(MAX_DOCUMENT_BYTES + 1)
+            if len(content) > MAX_DOCUMENT_BYTES:
+                yield name, None, "file too large"
+                continue
+            yield name, content, None
+
+async def iter_upload_documents(files) -> AsyncIterator[Document]:
+    """Documents of uploaded files (UploadFile); ZIP archives are expanded"""
+    for upload in files:
+        name = upload.filename or 'upload'
+        if name.lower().endswith('.zip'):
+            try:
+                async for document in iterate_in_threadpool(iter_zip_documents(upload.file, name)):
+                    yield document
+            except zipfile.BadZipFile:
+                yield name, None, "not a valid ZIP archive"
+        elif is_candidate(name):
+            content = await upload.read()
+            if len(content) > MAX_DOCUMENT_BYTES:
+                yield name, None, "file too large"
+            else:
+                yield name, content, None
+        else:
+            yield name, None, "unsupported file type"
+
+async def extract_documents(documents: AsyncIterator[Document],
+                            concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Extract documents concurrently and yield one result each, in the order they finish"""
+    semaphore = asyncio.Semaphore(concurrency)
+    finished: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    async def run(index: int, name: str, content: bytes):
+        started = time.monotonic()
+        result = {"type": "document", "index": index, "file": name}
+        try:
+            data, cached = await EXTRACTION_CACHE.extract(content, os.path.basename(name))
+            result["cached"] = cached
+            if data:
+                result.update(
+                    status="ok",
+                    bestellnummer=data.get("bestellnummer"),
+                    positions=len(data.get("positionen") or []),
+                    data=data
+                )
+            else:
+                result.update(status="failed", error=NO_DATA_ERROR)
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        finally:
+            semaphore.release()
+        result["duration_ms"] = round((time.monotonic() - started) * 1000)
+        finished.put_nowait(result)
+
+    async def feed():
+        index = 0
+        try:
+            async for name, content, skipped in documents:
+                if skipped:
+                    finished.put_nowait({"type": "document", "index": index, "file": name,
+                                         "status": "skipped", "error": skipped})
+                else:
+                    # Wait for a free slot before the next document is read
+                    await semaphore.acquire()
+                    task = asyncio.get_running_loop().create_task(run(index, name, content))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                index += 1
+        except Exception as e:
+            finished.put_nowait({"type": "error", "error": f"Could not read uploads: {str(e)}"})
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finished.put_nowait(None)
+
+    feeder = asyncio.get_running_loop().create_task(feed())
+    try:
+        while True:
+            result = await finished.get()
+            if result is None:
+                break
+            yield result
+    finally:
+        # Client went away: stop reading uploads and drop pending documents
+        feeder.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+def extracted_positions(extracted: List[Dict[str, Any]], columns: List[str]) -> List[Dict[str, Any]]:
+    """Positions of several extraction results as rows for one bulk upsert.
+
+    Every row gets the same columns (PostgREST bulk requirement) and a
+    (bestellnummer, pos_nr) pair appears only once, the last scan winning.
+    """
+    rows = {}
+    for data in extracted:
+        bestellnummer = data.get("bestellnummer")
+        if not bestellnummer:
+            continue
+        for pos in data.get("positionen") or []:
+            row = {column: pos.get(column) for column in columns}
+            row["bestellnummer"] = bestellnummer
+            # Positions without pos_nr never conflict; keep each of them
+            key = (bestellnummer, row["pos_nr"]) if row.get("pos_nr") else (bestellnummer, None, len(rows))
+            rows[key] = row
+    return list(rows.values())
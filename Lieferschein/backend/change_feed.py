@@ -0,0 +1,140 @@
+"""
+Change feed for orders, positions and document history.
+
+Every write that passes through the backend is published as a small event
+with an increasing sequence number. Clients poll GET /api/changes?since=<cursor>
+or keep GET /api/changes/stream (Server-Sent Events) open and patch their
+state with the deltas instead of reloading full lists.
+
+The feed lives in this process: a cursor is "<feed id>:<sequence>" and a
+cursor from another process (restart, other worker) or one that has fallen
+out of the buffer is answered with reset=true, telling the client to reload
+once and continue from the returned cursor.
+
+So the feed only works with a single server process. With several workers
+(WEB_CONCURRENCY > 1) clients miss the changes made through other workers
+and every reconnect to another worker resets them; warn_if_multi_worker
+says so loudly at startup.
+"""
+
+import os
+import uuid
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+CHANGE_BUFFER_SIZE = int(os.getenv("CHANGE_BUFFER_SIZE", 5000))
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+class Subscription(asyncio.Queue):
+    """Event queue of one stream; closed when the client fell too far behind"""
+
+    def __init__(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        super().__init__(maxsize=maxsize)
+        self.closed = False
+
+class ChangeFeed:
+    def __init__(self, buffer_size: int = CHANGE_BUFFER_SIZE):
+        self.feed_id = uuid.uuid4().hex[:12]
+        self._events: deque = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def cursor(self, seq: Optional[int] = None) -> str:
+        return f"{self.feed_id}:{self._seq if seq is None else seq}"
+
+    def publish(self, entity: str, op: str, key: Dict[str, Any], data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Record a change (entity: order/position/history, op: upsert/delete) and notify subscribers"""
+        with self._lock:
+            self._seq += 1
+            event = {
+                "seq": self._seq,
+                "cursor": self.cursor(self._seq),
+                "entity": entity,
+                "op": op,
+                "key": key,
+                "data": data,
+                "at": datetime.now().isoformat()
+            }
+            self._events.append(event)
+            subscribers = list(self._subscribers)
+        for queue in subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A stalled client gets no more events: its stream ends and the
+                # EventSource reconnects with Last-Event-ID to catch up from the buffer
+                queue.closed = True
+                self.unsubscribe(queue)
+        return event
+
+    def since(self, cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], bool]:
+        """Events after cursor and whether the client must reload instead (reset)"""
+        with self._lock:
+            if not cursor:
+                return [], True
+            feed_id, _, seq = cursor.partition(':')
+            if feed_id != self.feed_id or not seq.isdigit():
+                return [], True
+            seq = int(seq)
+            oldest = self._events[0]["seq"] if self._events else self._seq + 1
+            if seq < oldest - 1:
+                return [], True
+            return [event for event in self._events if event["seq"] > seq], False
+
+    def subscribe(self) -> Subscription:
+        queue = Subscription()
+        with self._lock:
+            self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: Subscription):
+        with self._lock:
+            self._subscribers.discard(queue)
+
+# Process-wide feed used by the backend routes
+CHANGE_FEED = ChangeFeed()
+
+def worker_count() -> int:
+    """Server worker processes as configured for uvicorn/gunicorn (WEB_CONCURRENCY)"""
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    except ValueError:
+        return 1
+
+def warn_if_multi_worker() -> bool:
+    """Log loudly when the in-process feed runs in more than one worker; True if it does"""
+    workers = worker_count()
+    if workers <= 1:
+        return False
+    print("=" * 72)
+    print(f"WARNING: WEB_CONCURRENCY={workers}, but the change feed lives in each worker process.")
+    print("/api/changes clients miss changes made through other workers and are reset")
+    print("whenever they reconnect to another worker. Run the backend with one worker")
+    print("to use the change feed.")
+    print("=" * 72)
+    return True
+
+def publish_positions(positions: List[Dict[str, Any]], op: str = "upsert"):
+    for position in positions:
+        CHANGE_FEED.publish(
+            "position", op,
+            {"bestellnummer": position.get("bestellnummer"), "pos_nr": position.get("pos_nr")},
+            position if op != "delete" else None
+        )
+
+def publish_history(rows: List[Dict[str, Any]]):
+    """History rows without their (possibly large) document_data"""
+    for row in rows:
+        CHANGE_FEED.publish(
+            "history", "upsert",
+            {"id": row.get("id"), "bestellnummer": row.get("bestellnummer")},
+            {k: v for k, v in row.items() if k != "document_data"}
+        )
@@ -0,0 +1,22 @@
+-- Aggregated document_history counts for GET /api/document-history/stats
+-- Counts per document type and day or week, computed in the database instead of in the browser.
+CREATE OR REPLACE FUNCTION document_history_stats(
+    p_from TIMESTAMP WITH TIME ZONE,
+    p_to TIMESTAMP WITH TIME ZONE,
+    p_bucket TEXT DEFAULT 'day'
+)
+RETURNS TABLE (bucket DATE, document_type VARCHAR, count BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT date_trunc(p_bucket, h.generated_at AT TIME ZONE 'UTC')::date AS bucket,
+           h.document_type,
+           COUNT(*) AS count
+    FROM document_history h
+    WHERE h.generated_at >= p_from
+      AND h.generated_at < p_to
+    GROUP BY 1, 2
+    ORDER BY 1, 2;
+$$;
+
+COMMENT ON FUNCTION document_history_stats(TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TEXT) IS 'Generated documents per type and day/week (UTC) in [p_from, p_to)';
@@ -0,0 +1,39 @@
+-- Deduplicated document_history snapshots
+-- document_data is stored once per distinct content and referenced by its hash.
+-- Run once after create_document_history_table.sql; safe to run again.
+
+CREATE TABLE IF NOT EXISTS document_snapshots (
+    hash CHAR(64) PRIMARY KEY,
+    document_data JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE document_history
+    ADD COLUMN IF NOT EXISTS snapshot_hash CHAR(64) REFERENCES document_snapshots(hash);
+
+CREATE INDEX IF NOT EXISTS idx_document_history_snapshot_hash ON document_history(snapshot_hash);
+
+ALTER TABLE document_snapshots ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Enable all operations for document_snapshots" ON document_snapshots;
+CREATE POLICY "Enable all operations for document_snapshots" ON document_snapshots
+    FOR ALL
+    USING (true)
+    WITH CHECK (true);
+
+-- Migrate existing rows: move every distinct document_data into document_snapshots
+-- (hash = sha256 of the jsonb text, the same hash the backend computes)
+INSERT INTO document_snapshots (hash, document_data)
+SELECT DISTINCT encode(sha256(convert_to(document_data::text, 'UTF8')), 'hex'), document_data
+FROM document_history
+WHERE document_data IS NOT NULL AND snapshot_hash IS NULL
+ON CONFLICT (hash) DO NOTHING;
+
+UPDATE document_history
+SET snapshot_hash = encode(sha256(convert_to(document_data::text, 'UTF8')), 'hex'),
+    document_data = NULL
+WHERE document_data IS NOT NULL AND snapshot_hash IS NULL;
+
+COMMENT ON TABLE document_snapshots IS 'Distinct document_data snapshots of document_history, addressed by content hash';
+COMMENT ON COLUMN document_snapshots.hash IS 'SHA-256 of document_data::text';
+COMMENT ON COLUMN document_history.snapshot_hash IS 'Snapshot of the order data at generation time (document_snapshots.hash)';
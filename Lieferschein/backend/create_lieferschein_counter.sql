@@ -0,0 +1,41 @@
+-- Create lieferschein_counter table and allocation RPC for multi-worker number leasing
+-- Used when LIEFERSCHEIN_COUNTER_BACKEND=supabase (see lieferschein_counter.py)
+CREATE TABLE IF NOT EXISTS lieferschein_counter (
+    year INTEGER PRIMARY KEY,
+    last_number INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Continue the sequence of the counter file (Vorlagen/.lieferschein_counter.json,
+-- last_number 965 when this script was written; files without "year" are 2025).
+--
+-- MIGRATION: numbers issued after that are only in the counter file. Before
+-- setting LIEFERSCHEIN_COUNTER_BACKEND=supabase, stop all PDF workers and copy
+-- the file's current "year" and "last_number", otherwise issued numbers are
+-- handed out again (the statement below with those values):
+INSERT INTO lieferschein_counter (year, last_number) VALUES (2025, 965)
+    ON CONFLICT (year) DO UPDATE
+        SET last_number = GREATEST(lieferschein_counter.last_number, EXCLUDED.last_number);
+
+-- Reserve p_count numbers for p_year and return the last reserved number.
+-- The row lock taken by the upsert serialises concurrent callers; a new year starts at 0001.
+CREATE OR REPLACE FUNCTION allocate_lieferschein_numbers(p_year INTEGER, p_count INTEGER DEFAULT 1)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_last INTEGER;
+BEGIN
+    INSERT INTO lieferschein_counter (year, last_number)
+    VALUES (p_year, p_count)
+    ON CONFLICT (year) DO UPDATE
+        SET last_number = lieferschein_counter.last_number + EXCLUDED.last_number,
+            updated_at = NOW()
+    RETURNING last_number INTO v_last;
+
+    RETURN v_last;
+END;
+$$;
+
+COMMENT ON TABLE lieferschein_counter IS 'Last allocated Lieferschein number per year';
+COMMENT ON FUNCTION allocate_lieferschein_numbers(INTEGER, INTEGER) IS 'Atomically reserves a block of Lieferschein numbers';
@@ -0,0 +1,7 @@
+-- Unique key for positionen (bestellnummer, pos_nr)
+-- update_positions_batch already treats this pair as the key of a position; the
+-- constraint lets POST /api/import write with bulk upserts (on_conflict=bestellnummer,pos_nr).
+-- Fails if duplicates exist; find them with:
+--   SELECT bestellnummer, pos_nr, COUNT(*) FROM positionen GROUP BY 1, 2 HAVING COUNT(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_positionen_bestellnummer_pos_nr
+    ON positionen (bestellnummer, pos_nr);
@@ -0,0 +1,70 @@
+-- Full-text and fuzzy search over positionen for GET /api/search
+-- tsvector for words in Beschreibung/Vorgang, trigrams for identifiers (FL- Auftrag, Modellnummer)
+-- and typos. Safe to run again.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Search keys as immutable functions of the row: expression indexes instead of
+-- generated columns, so select=* responses and position updates stay unchanged
+CREATE OR REPLACE FUNCTION positionen_search_text(p positionen)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT lower(
+        coalesce(p.bestellnummer::text, '') || ' ' || coalesce(p.auftrag::text, '') || ' ' ||
+        coalesce(p.modellnummer::text, '') || ' ' || coalesce(p.beschreibung::text, '') || ' ' ||
+        coalesce(p.vorgang::text, '') || ' ' || coalesce(p.werkstoff::text, '')
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION positionen_search_vector(p positionen)
+RETURNS TSVECTOR
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT to_tsvector('german'::regconfig,
+        coalesce(p.auftrag::text, '') || ' ' || coalesce(p.modellnummer::text, '') || ' ' ||
+        coalesce(p.beschreibung::text, '') || ' ' || coalesce(p.vorgang::text, '') || ' ' ||
+        coalesce(p.werkstoff::text, '')
+    );
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_positionen_search_vector ON positionen USING GIN (positionen_search_vector(positionen));
+CREATE INDEX IF NOT EXISTS idx_positionen_search_text_trgm ON positionen USING GIN (positionen_search_text(positionen) gin_trgm_ops);
+
+-- Ranked hits: exact identifier match > full-text rank > trigram word similarity.
+-- Every WHERE branch is served by one of the two GIN indexes.
+CREATE OR REPLACE FUNCTION search_positions(p_query TEXT, p_limit INTEGER DEFAULT 20)
+RETURNS TABLE (
+    id BIGINT,
+    bestellnummer TEXT,
+    pos_nr TEXT,
+    auftrag TEXT,
+    beschreibung TEXT,
+    modellnummer TEXT,
+    werkstoff TEXT,
+    rank REAL
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('german', p_query) AS tsq,
+               lower(trim(p_query)) AS term,
+               '%' || replace(replace(replace(lower(trim(p_query)), '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+    )
+    SELECT p.id::bigint, p.bestellnummer::text, p.pos_nr::text, p.auftrag::text, p.beschreibung::text,
+           p.modellnummer::text, p.werkstoff::text,
+           (CASE WHEN lower(p.auftrag) = q.term OR lower(p.modellnummer) = q.term
+                      OR lower(p.bestellnummer) = q.term THEN 2 ELSE 0 END
+            + ts_rank(positionen_search_vector(p), q.tsq)
+            + word_similarity(q.term, positionen_search_text(p)))::real AS rank
+    FROM positionen p, q
+    WHERE positionen_search_vector(p) @@ q.tsq
+       OR positionen_search_text(p) LIKE q.pattern
+       OR q.term <% positionen_search_text(p)
+    ORDER BY rank DESC, p.bestellnummer, p.pos_nr
+    LIMIT p_limit;
+$$;
+
+COMMENT ON FUNCTION search_positions(TEXT, INTEGER) IS 'Ranked full-text/fuzzy search over positionen (GET /api/search)';
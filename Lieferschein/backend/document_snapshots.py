@@ -0,0 +1,78 @@
+"""
+Content-addressed document_history snapshots.
+
+document_data is stored once per distinct content in document_snapshots and
+referenced from document_history.snapshot_hash (see
+create_document_snapshots.sql). The hash is the SHA-256 of the snapshot in
+Postgres' jsonb text form, so hashes computed here match the ones the
+migration computes with sha256(document_data::text) for existing rows. (Exotic
+numbers such as 1e+20 print differently; the worst case is one duplicate
+snapshot, never a wrong one.)
+"""
+
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Hashes this process has already stored; skips re-uploading repeated snapshots
+KNOWN_HASHES_MAX = 2048
+_known_hashes: "OrderedDict[str, None]" = OrderedDict()
+_known_lock = threading.Lock()
+
+def _jsonb_order(value: Any) -> Any:
+    """Order object keys like jsonb does: shorter keys first, then bytewise"""
+    if isinstance(value, dict):
+        return {
+            key: _jsonb_order(value[key])
+            for key in sorted(value, key=lambda k: (len(str(k).encode('utf-8')), str(k).encode('utf-8')))
+        }
+    if isinstance(value, (list, tuple)):
+        return [_jsonb_order(item) for item in value]
+    return value
+
+def jsonb_text(document_data: Any) -> str:
+    """Text form of a value as Postgres prints it for jsonb::text"""
+    return json.dumps(_jsonb_order(document_data), ensure_ascii=False, separators=(', ', ': '))
+
+def snapshot_hash(document_data: Any) -> str:
+    return hashlib.sha256(jsonb_text(document_data).encode('utf-8')).hexdigest()
+
+def split_snapshots(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Replace document_data of history rows by a snapshot_hash reference.
+
+    Returns the rewritten rows and the snapshots that still have to be
+    stored (those this process has not stored before). Every row gets a
+    snapshot_hash key so the rows stay valid for a PostgREST bulk insert.
+    """
+    history_rows = []
+    snapshots = {}
+    for row in rows:
+        document_data = row.get('document_data')
+        digest = snapshot_hash(document_data) if document_data is not None else None
+        history_rows.append({**row, 'document_data': None, 'snapshot_hash': digest})
+        if digest and not is_known(digest):
+            snapshots[digest] = {'hash': digest, 'document_data': document_data}
+    return history_rows, list(snapshots.values())
+
+def is_known(digest: str) -> bool:
+    with _known_lock:
+        if digest in _known_hashes:
+            _known_hashes.move_to_end(digest)
+            return True
+        return False
+
+def mark_known(digests: List[str]):
+    with _known_lock:
+        for digest in digests:
+            _known_hashes[digest] = None
+            _known_hashes.move_to_end(digest)
+        while len(_known_hashes) > KNOWN_HASHES_MAX:
+            _known_hashes.popitem(last=False)
+
+def needs_snapshot(history: Dict[str, Any]) -> Optional[str]:
+    """snapshot_hash of a history row whose document_data still has to be loaded"""
+    if history.get('document_data') is None:
+        return history.get('snapshot_hash')
+    return None
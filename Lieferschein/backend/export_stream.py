@@ -0,0 +1,134 @@
+"""
+Streaming exports of orders and positions (CSV, JSON Lines, Parquet).
+
+Rows arrive page by page (see the /api/export route, which pages through
+Supabase with keyset pagination); each page is encoded and yielded before
+the next one is requested, so memory stays bounded by one page whatever the
+size of the export. The columns are the fields of the pydantic model of the
+exported table.
+"""
+
+import io
+import csv
+import json
+import typing
+from typing import Any, AsyncIterator, Dict, List, Type
+
+from pydantic import BaseModel
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: Parquet export is unavailable without pyarrow
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+def parquet_available() -> bool:
+    return pa is not None
+
+def export_columns(model: Type[BaseModel]) -> List[str]:
+    return list(model.model_fields)
+
+def _base_type(annotation: Any) -> Any:
+    # Optional[X] -> X
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    return args[0] if args else annotation
+
+def _coerce(value: Any, annotation: Any) -> Any:
+    if value is None or value == '':
+        return None if annotation is not str else value
+    base = _base_type(annotation)
+    try:
+        if base in (int, float):
+            return base(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value) if base is str else value
+
+def export_row(model: Type[BaseModel], row: Dict[str, Any]) -> Dict[str, Any]:
+    """A database row reduced to the model's columns, each value converted to the column type.
+
+    Values are converted leniently instead of validated, so one odd row (a
+    numeric pos_nr, an empty preis) never aborts a running export.
+    """
+    return {name: _coerce(row.get(name), field.annotation) for name, field in model.model_fields.items()}
+
+class _Sink(io.RawIOBase):
+    """Write-only file object collecting bytes until drained (for ParquetWriter)"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+async def iter_csv(pages: AsyncIterator[List[Dict[str, Any]]], model: Type[BaseModel]) -> AsyncIterator[bytes]:
+    columns = export_columns(model)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, delimiter=';')
+    # BOM so Excel opens the UTF-8 file with the right encoding
+    buffer.write('\ufeff')
+    writer.writeheader()
+    async for page in pages:
+        writer.writerows(export_row(model, row) for row in page)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+async def iter_jsonl(pages: AsyncIterator[List[Dict[str, Any]]], model: Type[BaseModel]) -> AsyncIterator[bytes]:
+    async for page in pages:
+        yield ''.join(
+            json.dumps(export_row(model, row), ensure_ascii=False, default=str) + '\n'
+            for row in page
+        ).encode('utf-8')
+
+def _arrow_type(annotation: Any):
+    base = _base_type(annotation)
+    if base is bool:
+        return pa.bool_()
+    if base is int:
+        return pa.int64()
+    if base is float:
+        return pa.float64()
+    return pa.string()
+
+def parquet_schema(model: Type[BaseModel]):
+    return pa.schema([(name, _arrow_type(field.annotation)) for name, field in model.model_fields.items()])
+
+async def iter_parquet(pages: AsyncIterator[List[Dict[str, Any]]], model: Type[BaseModel]) -> AsyncIterator[bytes]:
+    """One Parquet row group per page"""
+    if not parquet_available():
+        raise RuntimeError("Parquet export requires pyarrow")
+    schema = parquet_schema(model)
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for page in pages:
+            writer.write_table(pa.Table.from_pylist([export_row(model, row) for row in page], schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+ENCODERS = {'csv': iter_csv, 'jsonl': iter_jsonl, 'parquet': iter_parquet}
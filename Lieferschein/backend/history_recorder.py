@@ -0,0 +1,272 @@
+"""
+Background document-history recorder for the PDF server.
+
+History events are put on an in-process queue and a daemon thread flushes them
+in batches to the backend's bulk endpoint (one PostgREST insert per batch).
+Batches that fail with a network error or a 5xx response are retried with
+exponential backoff and finally appended to a local JSONL spool file, which the
+worker replays at start and then every SPOOL_RETRY_INTERVAL seconds. Events
+the backend rejects (4xx) are never retried: they go to the dead-letter file
+next to the spool, so one bad row cannot block the spool; so do spool lines
+that cannot be parsed (a line cut short by a crash).
+
+Several server processes may share one spool file. Appends and the move of
+the spool to a replay file happen under a file lock, and each replay file is
+locked by the process replaying it, so no event is replayed twice.
+"""
+
+import os
+import glob
+import json
+import time
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows - local development only
+    fcntl = None
+
+SPOOL_FILE = os.getenv(
+    "HISTORY_SPOOL_FILE",
+    os.path.join(os.path.dirname(__file__), '.document_history_spool.jsonl')
+)
+SPOOL_RETRY_INTERVAL = float(os.getenv("HISTORY_SPOOL_RETRY_INTERVAL", 60))
+
+class HistoryRecorder:
+    """Queue document-history events and flush them in batches"""
+
+    def __init__(self, endpoint: str, batch_size: int = 50, flush_interval: float = 2.0,
+                 max_retries: int = 5, backoff: float = 0.5, timeout: float = 10.0,
+                 spool_file: str = SPOOL_FILE, spool_retry_interval: float = SPOOL_RETRY_INTERVAL):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.spool_file = spool_file
+        self.dead_letter_file = spool_file + ".dead"
+        self.spool_retry_interval = spool_retry_interval
+
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._session = requests.Session()
+        self._session.headers.update({"Content-Type": "application/json"})
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self._stats = {
+            "recorded": 0,
+            "flushed": 0,
+            "batches": 0,
+            "retries": 0,
+            "spooled": 0,
+            "dead_lettered": 0,
+            "last_flush_ms": None,
+            "max_flush_ms": None,
+            "last_error": None,
+        }
+
+    def record(self, event: Dict[str, Any]):
+        """Queue one history event; never blocks on the backend"""
+        self._ensure_started()
+        self._queue.put(event)
+        with self._lock:
+            self._stats["recorded"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, flush latency and counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["spool_pending"] = os.path.exists(self.spool_file) or bool(self._replay_files())
+        return stats
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker and flush what is left in the queue"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="history-recorder", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _replay_files(self) -> List[str]:
+        # spool.replay (older versions) and spool.replay.<pid>.<time>
+        return sorted(glob.glob(glob.escape(self.spool_file) + ".replay*"))
+
+    def _run(self):
+        # Replay events that could not be delivered before the last shutdown
+        self._replay_spool()
+        last_replay = time.monotonic()
+
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            # Retry spooled events while running, not only at the next start
+            if time.monotonic() - last_replay >= self.spool_retry_interval and not self._stop.is_set():
+                self._replay_spool()
+                last_replay = time.monotonic()
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Collect up to batch_size events, waiting at most flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Dict[str, Any]], spool: bool = True) -> bool:
+        """Deliver a batch; False if it failed transiently (spooled unless spool=False)"""
+        started = time.monotonic()
+        delay = self.backoff
+
+        for attempt in range(self.max_retries):
+            try:
+                response = self._session.post(self.endpoint, json=batch, timeout=self.timeout)
+                if response.status_code in [200, 201]:
+                    self._record_flush(len(batch), started)
+                    return True
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if 400 <= response.status_code < 500 and response.status_code not in [408, 429]:
+                    # Rejected, not unavailable: retrying the same rows cannot succeed
+                    self._reject(batch, error)
+                    return True
+            except requests.RequestException as e:
+                error = str(e)
+
+            with self._lock:
+                self._stats["last_error"] = error
+                if attempt < self.max_retries - 1:
+                    self._stats["retries"] += 1
+            if attempt < self.max_retries - 1:
+                print(f"Warning: History flush failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+
+        if spool:
+            print(f"Warning: Failed to record {len(batch)} document history entries, spooling to {self.spool_file}")
+            self._spool(batch)
+        return False
+
+    def _reject(self, batch: List[Dict[str, Any]], error: str):
+        """Dead-letter the events of a rejected batch; the valid ones are sent one by one"""
+        with self._lock:
+            self._stats["last_error"] = error
+        if len(batch) > 1:
+            for event in batch:
+                self._flush([event])
+            return
+        print(f"Warning: Document history entry rejected ({error}), writing it to {self.dead_letter_file}")
+        self._dead_letter({"error": error, "event": batch[0]})
+
+    def _dead_letter(self, entry: Dict[str, Any]):
+        try:
+            with self._spool_lock(), open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+            with self._lock:
+                self._stats["dead_lettered"] += 1
+        except OSError as e:
+            print(f"Warning: Could not write history dead-letter file: {str(e)}")
+
+    def _record_flush(self, count: int, started: float):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._stats["flushed"] += count
+            self._stats["batches"] += 1
+            self._stats["last_flush_ms"] = round(elapsed_ms, 1)
+            self._stats["max_flush_ms"] = round(max(elapsed_ms, self._stats["max_flush_ms"] or 0), 1)
+
+    @contextmanager
+    def _spool_lock(self):
+        """Exclusive lock on the spool, shared by all server processes"""
+        with open(self.spool_file + ".lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _spool(self, batch: List[Dict[str, Any]]):
+        try:
+            with self._spool_lock(), open(self.spool_file, 'a', encoding='utf-8') as f:
+                for event in batch:
+                    f.write(json.dumps(event, default=str) + "\n")
+            with self._lock:
+                self._stats["spooled"] += len(batch)
+        except OSError as e:
+            print(f"Warning: Could not write history spool file: {str(e)}")
+
+    def _replay_spool(self):
+        # Move the spool aside so batches failing meanwhile are spooled again cleanly
+        try:
+            with self._spool_lock():
+                if os.path.exists(self.spool_file):
+                    os.replace(self.spool_file, f"{self.spool_file}.replay.{os.getpid()}.{time.time_ns()}")
+        except OSError as e:
+            print(f"Warning: Could not replay history spool file: {str(e)}")
+        # Replay files left behind by a process that stopped mid-replay are replayed as well
+        for replay_path in self._replay_files():
+            self._replay_file(replay_path)
+
+    def _replay_file(self, replay_path: str):
+        try:
+            f = open(replay_path, 'r', encoding='utf-8', errors='replace')
+        except FileNotFoundError:
+            return  # Finished by another process
+        except OSError as e:
+            print(f"Warning: Could not replay history spool file: {str(e)}")
+            return
+        with f:
+            if fcntl:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # Another process is replaying it
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    return  # Finished and removed before we got the lock
+
+            events = []
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError as e:
+                    # A line cut short by a crash or otherwise corrupt: keep it, but do not block the rest
+                    self._dead_letter({"error": f"Unparseable spool line: {str(e)}", "raw": line.rstrip("\n")})
+
+            print(f"Replaying {len(events)} spooled document history entries")
+            for start in range(0, len(events), self.batch_size):
+                if not self._flush(events[start:start + self.batch_size], spool=False):
+                    # Backend still unavailable: keep the rest for the next attempt
+                    self._spool(events[start:])
+                    break
+            # Only now are the events delivered, dead-lettered or back in the spool
+            try:
+                os.remove(replay_path)
+            except OSError as e:
+                print(f"Warning: Could not remove history replay file: {str(e)}")
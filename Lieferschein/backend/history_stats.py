@@ -0,0 +1,108 @@
+"""
+Helpers for GET /api/document-history/stats.
+
+Counts are computed by Supabase, either with the document_history_stats RPC
+(create_document_history_stats.sql) or, if that is not installed, with one
+"Prefer: count=exact" HEAD request per type and bucket. Results are kept in a
+short-lived in-process cache so a dashboard refreshing every few seconds
+does not hit the database each time.
+"""
+
+import os
+import time
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", 60))
+BUCKETS = ('day', 'week')
+# Allowed by the document_type CHECK constraint of document_history
+DOCUMENT_TYPES = ('lieferschein', 'laufkarte', 'rechnung')
+# Upper bound for the HEAD fallback: types x buckets requests
+MAX_FALLBACK_BUCKETS = 120
+
+def parse_date(value: Optional[str], default: Optional[date]) -> Optional[date]:
+    """Parse YYYY-MM-DD (ValueError on anything else)"""
+    if not value:
+        return default
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def bucket_start(day: date, bucket: str) -> date:
+    """First day of the bucket containing day (weeks start on Monday, like date_trunc)"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+def iter_buckets(date_from: date, date_to: date, bucket: str) -> Iterable[Tuple[date, date]]:
+    """Yield (start, end) of every bucket overlapping [date_from, date_to], end exclusive"""
+    step = timedelta(days=7 if bucket == 'week' else 1)
+    start = bucket_start(date_from, bucket)
+    while start <= date_to:
+        yield start, start + step
+        start += step
+
+def parse_content_range_total(content_range: Optional[str]) -> int:
+    """Total of a PostgREST Content-Range header such as "0-24/315" or "*/0" """
+    if not content_range or '/' not in content_range:
+        return 0
+    total = content_range.rsplit('/', 1)[1]
+    return int(total) if total.isdigit() else 0
+
+def build_stats(rows: List[Dict[str, Any]], date_from: date, date_to: date, bucket: str,
+                document_types: Iterable[str]) -> Dict[str, Any]:
+    """Shape (bucket, document_type, count) rows into the stats response.
+
+    Every bucket of the range is listed, empty ones with zero counts.
+    """
+    document_types = list(document_types)
+    series = {
+        start.isoformat(): {t: 0 for t in document_types}
+        for start, _ in iter_buckets(date_from, date_to, bucket)
+    }
+    by_type = {t: 0 for t in document_types}
+    for row in rows:
+        key = str(row['bucket'])[:10]
+        doc_type = row['document_type']
+        count = int(row['count'])
+        series.setdefault(key, {t: 0 for t in document_types})
+        series[key][doc_type] = series[key].get(doc_type, 0) + count
+        by_type[doc_type] = by_type.get(doc_type, 0) + count
+
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "bucket": bucket,
+        "total": sum(by_type.values()),
+        "by_type": by_type,
+        "series": [{"bucket": key, **counts} for key, counts in sorted(series.items())]
+    }
+
+class TTLCache:
+    """Tiny thread-safe cache whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl: float = STATS_CACHE_TTL, max_entries: int = 64):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            self._entries.pop(key, None)
+            return None
+
+    def put(self, key: Any, value: Any):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[key] = (now + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+STATS_CACHE = TTLCache()
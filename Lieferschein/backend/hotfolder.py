@@ -0,0 +1,289 @@
+"""
+Hot folder ingestion for scanner drop directories.
+
+The network scanner writes PDFs into shared folders; every new file is
+handed to the same pipeline as an upload to /api/extract (see
+ingest_scanned_file in simple_supabase_server) and then moved to the
+processed/ or failed/ subfolder of its directory. Each outcome is appended
+to hotfolder_status.jsonl in that directory.
+
+New files are noticed with inotify (inotify_simple, optional) or, without
+it, by scanning the directories every HOTFOLDER_POLL_INTERVAL seconds. A
+file is only picked up once its size and mtime have not changed for
+HOTFOLDER_SETTLE_SECONDS, so a scan still being written (SMB copies write in
+pieces) is never read half-way. At most HOTFOLDER_WORKERS files are processed
+at the same time; the OCR itself runs on the thread pool of batch_extract, so
+it never blocks the server's event loop.
+
+Every server process starts a watcher, but only one of them watches a given
+directory: it holds an exclusive lock on .hotfolder.lock in that directory.
+The others stand by and take the directory over when its owner exits.
+
+Storing and moving are recorded separately. A file that was stored but could
+not be moved is remembered (by size and mtime) and not ingested again by this
+process; after a restart it would be, which only repeats the OCR, because
+positions are upserted.
+"""
+
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # Optional: the directories are polled without inotify_simple
+    INotify = None
+    inotify_flags = None
+
+try:
+    import fcntl
+except ImportError:  # Windows - local development only
+    fcntl = None
+
+HOTFOLDER_DIRS = [d.strip() for d in os.getenv("HOTFOLDER_DIRS", "").split(os.pathsep) if d.strip()]
+HOTFOLDER_WORKERS = int(os.getenv("HOTFOLDER_WORKERS", 2))
+HOTFOLDER_SETTLE_SECONDS = float(os.getenv("HOTFOLDER_SETTLE_SECONDS", 3))
+HOTFOLDER_POLL_INTERVAL = float(os.getenv("HOTFOLDER_POLL_INTERVAL", 2))
+
+HOTFOLDER_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.tif', '.tiff')
+PROCESSED_DIR = 'processed'
+FAILED_DIR = 'failed'
+STATUS_FILE = 'hotfolder_status.jsonl'
+LOCK_FILE = '.hotfolder.lock'
+RECENT_RESULTS = 50
+
+# handler(filename, content) -> summary dict; raises on failure
+IngestHandler = Callable[[str, bytes], Awaitable[Dict[str, Any]]]
+
+def inotify_available() -> bool:
+    return INotify is not None
+
+def is_candidate(name: str) -> bool:
+    # Skip hidden/temporary files (scanners and Samba write ".~name" or "name.tmp" first)
+    return not name.startswith(('.', '~')) and name.lower().endswith(HOTFOLDER_EXTENSIONS)
+
+def _signature(path: str) -> Optional[Tuple[int, float]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+def claim_directory(directory: str):
+    """Open file holding the exclusive lock on a hot folder, None if another process has it"""
+    lock_file = open(os.path.join(directory, LOCK_FILE), 'a')
+    if fcntl:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+def move_to(path: str, folder: str) -> str:
+    """Move a file into a subfolder of its directory without overwriting an earlier file"""
+    target_dir = os.path.join(os.path.dirname(path), folder)
+    os.makedirs(target_dir, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(target_dir, name)
+    if os.path.exists(target):
+        target = os.path.join(target_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{name}")
+    os.replace(path, target)
+    return target
+
+class HotfolderWatcher:
+    def __init__(self, directories: List[str], handler: IngestHandler,
+                 workers: int = HOTFOLDER_WORKERS,
+                 settle_seconds: float = HOTFOLDER_SETTLE_SECONDS,
+                 poll_interval: float = HOTFOLDER_POLL_INTERVAL):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.mode = 'inotify' if inotify_available() else 'polling'
+        # path -> (size, mtime, time the signature was first seen)
+        self._pending: Dict[str, Tuple[int, float, float]] = {}
+        self._busy = set()  # queued or being processed
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._inotify = None
+        self._watches: Dict[int, str] = {}
+        # directory -> open lock file, for the directories this process watches
+        self._claimed: Dict[str, Any] = {}
+        # path -> (size, mtime) of files handled but not moved out of the inbox
+        self._unmoved: Dict[str, Tuple[int, float]] = {}
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.recent: deque = deque(maxlen=RECENT_RESULTS)
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        """Start watching (inside the running event loop)"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        if self.mode == 'inotify':
+            self._inotify = INotify()
+            loop.add_reader(self._inotify.fd, self._read_events)
+        self._claim_directories()
+        self._tasks = [loop.create_task(self._settle_loop())]
+        self._tasks += [loop.create_task(self._worker()) for _ in range(self.workers)]
+        standby = [d for d in self.directories if d not in self._claimed]
+        print(f"Hot folder watcher started ({self.mode}, {self.workers} workers): {', '.join(self._claimed) or '-'}"
+              + (f"; standing by for {', '.join(standby)} (watched by another process)" if standby else ""))
+
+    async def stop(self):
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for lock_file in self._claimed.values():
+            lock_file.close()
+        self._claimed = {}
+        self._watches = {}
+
+    def _claim_directories(self):
+        """Take over every directory no other process watches"""
+        for directory in self.directories:
+            if directory in self._claimed:
+                continue
+            try:
+                os.makedirs(directory, exist_ok=True)
+                lock_file = claim_directory(directory)
+            except OSError as e:
+                print(f"Warning: Hot folder {directory} not usable: {str(e)}")
+                continue
+            if lock_file is None:
+                continue
+            self._claimed[directory] = lock_file
+            for folder in (PROCESSED_DIR, FAILED_DIR):
+                os.makedirs(os.path.join(directory, folder), exist_ok=True)
+            if self._inotify is not None:
+                watch_flags = inotify_flags.CREATE | inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+                self._watches[self._inotify.add_watch(directory, watch_flags)] = directory
+            # Files dropped while no process watched the directory
+            self.scan(directory)
+
+    def _notice(self, path: str):
+        if path not in self._busy and path not in self._pending:
+            signature = _signature(path)
+            if signature and self._unmoved.get(path) != signature:
+                self._pending[path] = (*signature, time.monotonic())
+
+    def scan(self, directory: str):
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_candidate(entry.name):
+                        self._notice(entry.path)
+        except FileNotFoundError:
+            print(f"Warning: Hot folder {directory} does not exist")
+
+    def _read_events(self):
+        for event in self._inotify.read(timeout=0):
+            directory = self._watches.get(event.wd)
+            if directory and event.name and is_candidate(event.name):
+                self._notice(os.path.join(directory, event.name))
+
+    async def _settle_loop(self):
+        tick = min(self.poll_interval, max(self.settle_seconds / 2, 0.1))
+        last_scan = 0.0
+        while True:
+            now = time.monotonic()
+            if now - last_scan >= self.poll_interval:
+                if len(self._claimed) < len(self.directories):
+                    self._claim_directories()
+                if self.mode == 'polling':
+                    for directory in self._claimed:
+                        self.scan(directory)
+                last_scan = now
+            for path, (size, mtime, since) in list(self._pending.items()):
+                signature = _signature(path)
+                if signature is None:
+                    # Removed or renamed before it settled
+                    del self._pending[path]
+                elif signature != (size, mtime):
+                    self._pending[path] = (*signature, now)
+                elif now - since >= self.settle_seconds and size > 0:
+                    del self._pending[path]
+                    self._busy.add(path)
+                    self._queue.put_nowait(path)
+            await asyncio.sleep(tick)
+
+    async def _worker(self):
+        while True:
+            path = await self._queue.get()
+            self.active += 1
+            try:
+                await self._ingest(path)
+            finally:
+                self.active -= 1
+                self._busy.discard(path)
+
+    async def _ingest(self, path: str):
+        started = time.monotonic()
+        record = {"file": os.path.basename(path), "directory": os.path.dirname(path)}
+        signature = _signature(path)
+        try:
+            content = await asyncio.get_running_loop().run_in_executor(None, _read_file, path)
+            summary = await self.handler(os.path.basename(path), content)
+            record.update(summary or {})
+            record["status"] = "processed"
+            self.processed += 1
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(getattr(e, 'detail', None) or e)
+            self.failed += 1
+            print(f"Hot folder: {path} failed: {record['error']}")
+        # The outcome above stands even if the file cannot be moved afterwards
+        try:
+            record["moved_to"] = move_to(path, PROCESSED_DIR if record["status"] == "processed" else FAILED_DIR)
+            self._unmoved.pop(path, None)
+        except OSError as move_error:
+            record["move_error"] = str(move_error)
+            if signature:
+                # Still in the inbox: do not ingest this version of the file again
+                self._unmoved[path] = signature
+            print(f"Hot folder: could not move {path}: {move_error}")
+        record["duration_ms"] = round((time.monotonic() - started) * 1000)
+        record["at"] = datetime.now().isoformat()
+        self.recent.append(record)
+        self._write_status(record)
+
+    def _write_status(self, record: Dict[str, Any]):
+        try:
+            with open(os.path.join(record["directory"], STATUS_FILE), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        except OSError as e:
+            print(f"Warning: Could not write hot folder status: {str(e)}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "mode": self.mode,
+            "directories": self.directories,
+            "watched_directories": list(self._claimed),
+            "workers": self.workers,
+            "pending": len(self._pending),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "active": self.active,
+            "processed": self.processed,
+            "failed": self.failed,
+            "recent": list(self.recent)
+        }
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
@@ -1,16 +1,13 @@
 import os
 import tempfile
 from datetime import datetime
-from typing import Dict, List, Any
+from html import escape
+from string import Template
+from typing import Dict, Any, Iterator
 
-def generate_laufkarte_html(data: Dict[str, Any]) -> str:
-    """Generate Laufkarte HTML with dynamic data"""
-    
-    # Get current date
-    datum = data.get('datum', datetime.now().strftime('%d.%m.%Y'))
-    
-    # Start building HTML
-    html = '''<!DOCTYPE html>
+# Templates are built once at import time; rendering only escapes the values,
+# substitutes them and yields the pieces, so large orders stay linear.
+_PAGE_HEAD = Template('''<!DOCTYPE html>
 <html lang="de">
 <head>
     <meta charset="UTF-8">
@@ -118,7 +115,7 @@ def generate_laufkarte_html(data: Dict[str, Any]) -> str:
     <div class="page">
         <div class="header clearfix">
             <div class="company">DZ Metall</div>
-            <div class="date">''' + datum + '''</div>
+            <div class="date">$datum</div>
         </div>
         
         <h1>Laufkarte</h1>
@@ -134,61 +131,71 @@ def generate_laufkarte_html(data: Dict[str, Any]) -> str:
                     <th style="width: 20%;">Modellnummer</th>
                 </tr>
             </thead>
-            <tbody>'''
-    
-    # Add positions
-    positions = data.get('positionen', [])
-    for i, pos in enumerate(positions):
-        pos_number = i + 1
-        auftrag = pos.get('auftrag', '')
-        beschreibung = pos.get('beschreibung', '')
-        vorgang = pos.get('vorgang', '')
-        fv = pos.get('fv', '')
-        menge = pos.get('menge', '')
-        werkstoff = pos.get('werkstoff', '')
-        modellnummer = pos.get('modellnummer', '')
-        
-        # Format menge as string with comma
-        if menge:
-            menge_str = str(menge).replace('.', ',')
-        else:
-            menge_str = ''
-        
-        # Combine beschreibung with vorgang if available
-        if vorgang:
-            full_beschreibung = f"{beschreibung}<br>{vorgang}"
-        else:
-            full_beschreibung = beschreibung
-        
-        html += f'''
+            <tbody>''')
+
+_ROW = Template('''
                 <tr>
-                    <td>{pos_number}){auftrag}</td>
-                    <td>{full_beschreibung}</td>
-                    <td class="center">{fv}</td>
-                    <td class="center">{menge_str}</td>
-                    <td>{werkstoff}</td>
-                    <td>{modellnummer}</td>
-                </tr>'''
-    
-    html += '''
+                    <td>$pos_number)$auftrag</td>
+                    <td>$beschreibung</td>
+                    <td class="center">$fv</td>
+                    <td class="center">$menge</td>
+                    <td>$werkstoff</td>
+                    <td>$modellnummer</td>
+                </tr>''')
+
+_PAGE_TAIL = '''
             </tbody>
         </table>
     </div>
 </body>
 </html>'''
+
+def _text(value: Any) -> str:
+    """Escape a value for HTML; None and missing values are empty"""
+    return escape('' if value is None else str(value))
+
+def render_laufkarte_row(pos_number: int, pos: Dict[str, Any]) -> str:
+    """Render one table row of the Laufkarte"""
+    menge = pos.get('menge', '')
+    # Format menge as string with comma
+    menge_str = str(menge).replace('.', ',') if menge else ''
+    
+    # Combine beschreibung with vorgang if available
+    beschreibung = _text(pos.get('beschreibung', ''))
+    vorgang = pos.get('vorgang', '')
+    if vorgang:
+        beschreibung = f"{beschreibung}<br>{_text(vorgang)}"
+    
+    return _ROW.substitute(
+        pos_number=pos_number,
+        auftrag=_text(pos.get('auftrag', '')),
+        beschreibung=beschreibung,
+        fv=_text(pos.get('fv', '')),
+        menge=_text(menge_str),
+        werkstoff=_text(pos.get('werkstoff', '')),
+        modellnummer=_text(pos.get('modellnummer', ''))
+    )
+
+def iter_laufkarte_html(data: Dict[str, Any]) -> Iterator[str]:
+    """Yield the Laufkarte HTML piece by piece (head, one chunk per row, tail)"""
+    datum = data.get('datum') or datetime.now().strftime('%d.%m.%Y')
     
-    return html
+    yield _PAGE_HEAD.substitute(datum=_text(datum))
+    for i, pos in enumerate(data.get('positionen', []) or []):
+        yield render_laufkarte_row(i + 1, pos)
+    yield _PAGE_TAIL
+
+def generate_laufkarte_html(data: Dict[str, Any]) -> str:
+    """Generate Laufkarte HTML with dynamic data"""
+    return ''.join(iter_laufkarte_html(data))
 
 def generate_laufkarte_pdf_from_html(data: Dict[str, Any]) -> str:
     """Generate Laufkarte PDF from HTML"""
-    # Generate HTML
-    html_content = generate_laufkarte_html(data)
-    
     # Save to temporary HTML file
-    html_path = tempfile.mktemp(suffix='.html')
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    fd, html_path = tempfile.mkstemp(suffix='.html')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.writelines(iter_laufkarte_html(data))
     
     # For now, just return the HTML file
     # PDF conversion libraries (pdfkit, weasyprint) can be added later if needed
-    return html_path
\ No newline at end of file
+    return html_path
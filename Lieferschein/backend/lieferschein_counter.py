@@ -1,57 +1,167 @@
 """
 Lieferschein counter management
-Maintains a persistent counter for Lieferschein numbers
+Maintains a persistent counter for Lieferschein numbers (DZ<year>-XXXX)
+
+Numbers are allocated in blocks ("leases") so several worker processes can
+hand out numbers without collisions and without I/O on every document:
+
+- file backend (default): the counter file is updated under an exclusive
+  file lock and replaced atomically
+- supabase backend (LIEFERSCHEIN_COUNTER_BACKEND=supabase): blocks come from
+  the allocate_lieferschein_numbers RPC (see create_lieferschein_counter.sql)
+
+Unused numbers of a lease are lost when a worker exits; set
+LIEFERSCHEIN_LEASE_SIZE=1 for gap-free numbering. Both backends start every
+year at 0001, except 2025, which continues the sequence from 0901.
 """
 
 import os
 import json
-from typing import Optional
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - local development only
+    fcntl = None
 
 COUNTER_FILE = os.path.join(os.path.dirname(__file__), '.lieferschein_counter.json')
 START_NUMBER = 900  # Starting from DZ2025-0900
+COUNTER_BACKEND = os.getenv("LIEFERSCHEIN_COUNTER_BACKEND", "file")
+LEASE_SIZE = max(1, int(os.getenv("LIEFERSCHEIN_LEASE_SIZE", 10)))
+# Counter files without a "year" key were written in 2025, before year tracking
+LEGACY_COUNTER_YEAR = 2025
+
+# Per-process lease: numbers next..last of year are reserved for this worker
+_lease = {"pid": None, "year": None, "next": 0, "last": -1}
+_lease_lock = threading.Lock()
+
+def format_lieferschein_number(year: int, number: int) -> str:
+    """Format a Lieferschein number, e.g. DZ2025-0901"""
+    return f"DZ{year}-{number:04d}"
+
+def first_number(year: int) -> int:
+    """Counter value a year starts from: every year starts at 0001, except
+    LEGACY_COUNTER_YEAR, which continues the sequence issued before this counter"""
+    return START_NUMBER if year == LEGACY_COUNTER_YEAR else 0
+
+def _read_counter() -> Tuple[Optional[int], Optional[int]]:
+    """Read (year, last_number) from the counter file, (None, None) if there is none.
+
+    An unreadable or corrupt file raises RuntimeError: starting over would
+    issue numbers that already exist, so an operator has to fix the file.
+    """
+    if not os.path.exists(COUNTER_FILE):
+        return None, None
+    try:
+        with open(COUNTER_FILE, 'r') as f:
+            data = json.load(f)
+        year, last_number = data.get('year', LEGACY_COUNTER_YEAR), data['last_number']
+        if not isinstance(year, int) or not isinstance(last_number, int):
+            raise ValueError("year and last_number must be integers")
+        return year, last_number
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        raise RuntimeError(f"Lieferschein counter file {COUNTER_FILE} is unreadable ({e!r}); "
+                           f"fix it before issuing numbers")
+
+def _write_counter(year: int, last_number: int):
+    """Write the counter file atomically (temp file + rename)"""
+    directory = os.path.dirname(COUNTER_FILE)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.lieferschein_counter.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'year': year, 'last_number': last_number}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, COUNTER_FILE)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def _counter_lock():
+    """Exclusive lock on the counter file, shared by all worker processes"""
+    with open(COUNTER_FILE + '.lock', 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _allocate_block_file(year: int, count: int) -> int:
+    """Reserve count numbers in the counter file, return the last one"""
+    with _counter_lock():
+        stored_year, last_number = _read_counter()
+        if stored_year != year:
+            last_number = first_number(year)  # No counter yet, or a new year
+        last_number += count
+        _write_counter(year, last_number)
+        return last_number
+
+def _allocate_block_supabase(year: int, count: int) -> int:
+    """Reserve count numbers via the PostgREST RPC, return the last one"""
+    import requests
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    response = requests.post(
+        f"{supabase_url}/rest/v1/rpc/allocate_lieferschein_numbers",
+        headers={
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}",
+            "Content-Type": "application/json"
+        },
+        json={"p_year": year, "p_count": count},
+        timeout=10
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to allocate Lieferschein numbers: {response.text}")
+    return int(response.json())
+
+def _allocate_block(year: int, count: int) -> int:
+    if COUNTER_BACKEND == "supabase":
+        return _allocate_block_supabase(year, count)
+    return _allocate_block_file(year, count)
+
+def allocate_lieferschein_number() -> Tuple[int, int]:
+    """Allocate the next number from this worker's lease, return (year, number)"""
+    year = datetime.now().year
+    with _lease_lock:
+        # A forked worker must not reuse the lease of its parent; a new year drops the old lease
+        if _lease["pid"] != os.getpid() or _lease["year"] != year or _lease["next"] > _lease["last"]:
+            last = _allocate_block(year, LEASE_SIZE)
+            _lease.update(pid=os.getpid(), year=year, next=last - LEASE_SIZE + 1, last=last)
+        number = _lease["next"]
+        _lease["next"] += 1
+    return year, number
 
 def get_next_lieferschein_number() -> str:
     """Get the next Lieferschein number in sequence"""
-    # Read current counter
-    current_number = START_NUMBER
-    
-    if os.path.exists(COUNTER_FILE):
-        try:
-            with open(COUNTER_FILE, 'r') as f:
-                data = json.load(f)
-                current_number = data.get('last_number', START_NUMBER)
-        except:
-            pass
-    
-    # Increment for next number
-    next_number = current_number + 1
-    
-    # Save new counter
-    try:
-        with open(COUNTER_FILE, 'w') as f:
-            json.dump({'last_number': next_number}, f)
-    except:
-        pass
-    
-    return f"DZ2025-{next_number:04d}"
+    year, number = allocate_lieferschein_number()
+    return format_lieferschein_number(year, number)
 
 def get_current_number() -> int:
-    """Get the current counter number without incrementing"""
-    current_number = START_NUMBER
-    
-    if os.path.exists(COUNTER_FILE):
-        try:
-            with open(COUNTER_FILE, 'r') as f:
-                data = json.load(f)
-                current_number = data.get('last_number', START_NUMBER)
-        except:
-            pass
-    
-    return current_number
+    """Get the last reserved counter number without incrementing.
+
+    With leasing this is the end of the most recent block, not necessarily the
+    number printed on the last document; use the number returned by the
+    generator instead.
+    """
+    _, last_number = _read_counter()
+    return first_number(datetime.now().year) if last_number is None else last_number
 
 def reset_counter(start_from: Optional[int] = None):
     """Reset the counter to a specific number or back to start"""
-    reset_to = (start_from - 1) if start_from else (START_NUMBER - 1)
-    
-    with open(COUNTER_FILE, 'w') as f:
-        json.dump({'last_number': reset_to}, f)
\ No newline at end of file
+    year = datetime.now().year
+    reset_to = (start_from - 1) if start_from else first_number(year)
+
+    with _lease_lock:
+        _lease.update(pid=None, year=None, next=0, last=-1)
+    with _counter_lock():
+        _write_counter(year, reset_to)
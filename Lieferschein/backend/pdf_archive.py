@@ -0,0 +1,104 @@
+"""
+Durable archive of generated PDFs.
+
+Every generated document is stored once under the SHA-256 of its bytes
+(<hash[:2]>/<hash>.pdf below PDF_ARCHIVE_DIR). That relative path is recorded
+in document_history.file_path, so a historic document can be downloaded again
+without re-rendering it. Point PDF_ARCHIVE_DIR at a persistent disk in
+production; the render cache and temp files do not survive a redeploy.
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+from typing import Iterator, Optional, Tuple
+
+PDF_ARCHIVE = os.getenv("PDF_ARCHIVE", "true").lower() == "true"
+PDF_ARCHIVE_DIR = os.getenv("PDF_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_archive'))
+
+CHUNK_SIZE = 64 * 1024
+
+_ARCHIVE_PATH = re.compile(r'^[0-9a-f]{2}/([0-9a-f]{64})\.pdf$')
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def archive_pdf(pdf_path: str) -> str:
+    """Store a PDF in the archive and return its archive path (relative to PDF_ARCHIVE_DIR)"""
+    digest = file_digest(pdf_path)
+    file_path = f"{digest[:2]}/{digest}.pdf"
+    target = os.path.join(PDF_ARCHIVE_DIR, file_path)
+    if os.path.exists(target):
+        return file_path
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.pdf.tmp')
+    os.close(fd)
+    try:
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, target)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_path
+
+def resolve(file_path: Optional[str]) -> Optional[str]:
+    """Absolute path of an archived PDF, or None if it is not (or no longer) archived"""
+    if not file_path or not _ARCHIVE_PATH.match(file_path):
+        return None
+    path = os.path.join(PDF_ARCHIVE_DIR, file_path)
+    return path if os.path.exists(path) else None
+
+def archive_etag(file_path: str) -> Optional[str]:
+    """Strong ETag of an archived PDF: its content hash"""
+    match = _ARCHIVE_PATH.match(file_path or '')
+    return f'"{match.group(1)}"' if match else None
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into (start, end) inclusive.
+
+    Returns None for a missing, malformed or multi-range header (the whole
+    file is sent) and raises ValueError if the range cannot be satisfied.
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', range_header)
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last n bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(0, size - length), size - 1
+
+    if start >= size:
+        raise ValueError(f"Range starts beyond end of file ({size} bytes)")
+    return start, end
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield bytes start..end (inclusive) of a file"""
+    remaining = end - start + 1
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
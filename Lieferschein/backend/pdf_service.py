@@ -0,0 +1,222 @@
+"""
+PDF generation service shared by the FastAPI backend, the unified Render app
+and the Flask PDF server.
+
+Rendering is CPU-bound and blocking (ReportLab/PyPDF2), so async callers run it
+on RENDER_POOL via render_document_async instead of blocking the event loop.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Iterable, NamedTuple, Optional, Tuple
+
+try:
+    from lieferschein_generator import (
+        generate_lieferschein_with_number, generate_laufkarte, generate_rechnung, iter_pdf_file,
+        optimize_pdf, PDF_OPTIMIZE
+    )
+except ImportError:
+    from Vorlagen.lieferschein_generator import (
+        generate_lieferschein_with_number, generate_laufkarte, generate_rechnung, iter_pdf_file,
+        optimize_pdf, PDF_OPTIMIZE
+    )
+from render_cache import RENDER_CACHE
+from pdf_archive import archive_pdf, PDF_ARCHIVE, resolve as resolve_archive_path
+from zip_stream import iter_zip
+
+DOCUMENT_TYPES = ('lieferschein', 'laufkarte', 'rechnung')
+
+# Thread pool for blocking PDF rendering
+RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+RENDER_POOL = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="pdf-render")
+
+class RenderResult(NamedTuple):
+    """A generated document"""
+    pdf_path: str
+    document_number: str
+    # Report of optimize_pdf (bytes saved etc.), None if optimisation is disabled
+    optimization: Optional[Dict[str, Any]] = None
+    # Path of the PDF in the archive (document_history.file_path), None if not archived
+    file_path: Optional[str] = None
+
+def render_document(doc_type: str, doc_data: Dict[str, Any]) -> RenderResult:
+    """Render, optimise and archive a document"""
+    if doc_type == 'lieferschein':
+        # The generator returns the number it allocated and printed
+        pdf_path, document_number = generate_lieferschein_with_number(doc_data)
+    elif doc_type == 'laufkarte':
+        pdf_path = generate_laufkarte(doc_data)
+        # Laufkarte uses the order number
+        document_number = doc_data.get('bestellnummer', '')
+    elif doc_type == 'rechnung':
+        pdf_path = generate_rechnung(doc_data)
+        # Rechnung uses RE- prefix
+        document_number = f"RE-{doc_data.get('bestellnummer', '')}"
+    else:
+        raise ValueError(f"Unknown docType: {doc_type}")
+
+    optimization = None
+    if PDF_OPTIMIZE:
+        try:
+            optimization = optimize_pdf(pdf_path)
+        except Exception as e:
+            # An unoptimised document is still a valid document
+            print(f"Warning: PDF optimisation failed for {doc_type}: {str(e)}")
+
+    file_path = None
+    if PDF_ARCHIVE:
+        try:
+            file_path = archive_pdf(pdf_path)
+        except Exception as e:
+            # The download still works, only the durable copy is missing
+            print(f"Warning: Archiving {doc_type} PDF failed: {str(e)}")
+
+    return RenderResult(pdf_path, document_number, optimization, file_path)
+
+def is_cacheable(doc_type: str, doc_data: Dict[str, Any]) -> bool:
+    """A Lieferschein without a fixed number allocates a new one, so it is never cached"""
+    return doc_type != 'lieferschein' or bool(doc_data.get('lieferschein_nr'))
+
+def render_document_cached(doc_type: str, doc_data: Dict[str, Any]) -> RenderResult:
+    """Like render_document, but serve unchanged documents from the render cache"""
+    if not is_cacheable(doc_type, doc_data):
+        return render_document(doc_type, doc_data)
+    
+    cached = RENDER_CACHE.get(doc_type, doc_data)
+    if cached:
+        return RenderResult(*cached)
+    
+    result = render_document(doc_type, doc_data)
+    cached_path = RENDER_CACHE.put(doc_type, doc_data, result.pdf_path, result.document_number,
+                                   result.optimization, result.file_path)
+    return result._replace(pdf_path=cached_path)
+
+async def render_document_async(doc_type: str, doc_data: Dict[str, Any]) -> RenderResult:
+    """Run render_document_cached on the render pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(RENDER_POOL, render_document_cached, doc_type, doc_data)
+
+def history_document_data(history: Dict[str, Any]) -> Dict[str, Any]:
+    """Document data of a history entry, ready to render the same document again.
+
+    A Lieferschein keeps the number it was issued with instead of allocating
+    a new one.
+    """
+    doc_data = dict(history.get('document_data') or {})
+    document_number = (history.get('metadata') or {}).get('document_number')
+    if history.get('document_type') == 'lieferschein' and not doc_data.get('lieferschein_nr') and document_number:
+        doc_data['lieferschein_nr'] = document_number
+    return doc_data
+
+async def history_pdf_path(history: Dict[str, Any]) -> str:
+    """Path of the PDF of a history entry: archived copy, original file or a fresh render"""
+    pdf_path, _ = await history_pdf_source(history)
+    return pdf_path
+
+async def history_pdf_source(history: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """Like history_pdf_path, plus a stable key if the PDF is the one originally issued.
+
+    The key is None for a fresh render, which may differ from the original
+    (e.g. a missing datum falls back to today).
+    """
+    archived_path = resolve_archive_path(history.get('file_path'))
+    if archived_path:
+        # Archive paths are content hashes
+        return archived_path, f"archive:{history['file_path']}"
+    
+    pdf_path = (history.get('metadata') or {}).get('pdf_path')
+    if pdf_path and os.path.exists(pdf_path):
+        return pdf_path, f"history:{history['id']}" if history.get('id') else None
+    
+    result = await regenerate_history_document(history)
+    return result.pdf_path, None
+
+async def regenerate_history_document(history: Dict[str, Any]) -> RenderResult:
+    """Render a history entry again from its snapshot, through the render cache.
+
+    Raises ValueError if the entry cannot be reproduced (unknown type, or a
+    Lieferschein whose number was never recorded).
+    """
+    doc_type = history.get('document_type')
+    doc_data = history_document_data(history)
+    if doc_type not in DOCUMENT_TYPES:
+        raise ValueError(f"Unknown docType: {doc_type}")
+    if not is_cacheable(doc_type, doc_data):
+        raise ValueError("Lieferschein without a document number cannot be re-rendered")
+    
+    return await render_document_async(doc_type, doc_data)
+
+def normalize_order_data(doc_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalise order data once so several documents can be rendered from it.
+
+    The date defaults to today and loses any time part, positions become a
+    list and missing (None) values become empty strings, which every
+    generator treats as "not set".
+    """
+    datum = str(doc_data.get('datum') or datetime.now().strftime('%d.%m.%Y'))
+    if ', ' in datum:
+        datum = datum.split(',')[0].strip()
+    
+    return {
+        **doc_data,
+        'datum': datum,
+        'positionen': [
+            {k: ('' if v is None else v) for k, v in pos.items()}
+            for pos in doc_data.get('positionen', []) or []
+        ],
+    }
+
+async def render_bundle(doc_data: Dict[str, Any], doc_types: Iterable[str] = DOCUMENT_TYPES) -> List[Dict[str, Any]]:
+    """Render several documents of one order concurrently on the render pool"""
+    order_data = normalize_order_data(doc_data)
+    doc_types = list(doc_types)
+    results = await asyncio.gather(*(render_document_async(t, order_data) for t in doc_types))
+    
+    return [
+        {'doc_type': doc_type, 'result': result, 'data': order_data}
+        for doc_type, result in zip(doc_types, results)
+    ]
+
+def iter_bundle_zip(bundle: List[Dict[str, Any]]):
+    """Stream a rendered bundle as a ZIP archive"""
+    return iter_zip(
+        (download_name(item['doc_type'], item['data']), item['result'].pdf_path)
+        for item in bundle
+    )
+
+def build_history_record(doc_type: str, doc_data: Dict[str, Any], result: RenderResult,
+                         generated_by: str) -> Dict[str, Any]:
+    """Build the document_history row for a generated document"""
+    metadata = {
+        "pdf_path": result.pdf_path,
+        "timestamp": datetime.now().isoformat(),
+        "document_number": result.document_number
+    }
+    if result.optimization:
+        metadata["optimization"] = result.optimization
+    
+    return {
+        "bestellnummer": doc_data.get("bestellnummer", ""),
+        "document_type": doc_type,
+        "generated_by": generated_by,
+        "document_data": doc_data,
+        "file_path": result.file_path,
+        "metadata": metadata
+    }
+
+def pdf_response_headers(doc_type: str, doc_data: Dict[str, Any], result: RenderResult) -> Dict[str, str]:
+    """HTTP headers for a generated PDF, including the optimisation report"""
+    response_headers = {
+        'Content-Disposition': f'attachment; filename="{download_name(doc_type, doc_data)}"',
+        'X-Document-Number': result.document_number
+    }
+    if result.optimization:
+        response_headers['X-PDF-Original-Bytes'] = str(result.optimization['original_bytes'])
+        response_headers['X-PDF-Bytes-Saved'] = str(result.optimization['bytes_saved'])
+    return response_headers
+
+def download_name(doc_type: str, doc_data: Dict[str, Any]) -> str:
+    """File name offered to the browser for a generated document"""
+    return f'{doc_type}_{doc_data.get("bestellnummer", "unknown")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
@@ -0,0 +1,172 @@
+"""
+Import of position lists from CSV and Excel (XLSX) files.
+
+Rows are parsed lazily (csv.reader over the upload stream, openpyxl in
+read-only mode), mapped onto the Position fields by their column headers,
+validated and handed out in chunks, so a 10k-line file is never held in
+memory as a whole and can be written with a handful of bulk upserts.
+"""
+
+import io
+import csv
+import json
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from number_format import normalize_number
+
+try:
+    from openpyxl import load_workbook
+except ImportError:  # Optional: only CSV can be imported without openpyxl
+    load_workbook = None
+
+IMPORT_CHUNK_SIZE = 500
+
+# Header names (lowercase) recognised for each Position field
+DEFAULT_COLUMN_MAPPING = {
+    'bestellnummer': 'bestellnummer', 'bestellung': 'bestellnummer', 'bl': 'bestellnummer',
+    'pos': 'pos_nr', 'pos.': 'pos_nr', 'pos_nr': 'pos_nr', 'pos-nr': 'pos_nr', 'position': 'pos_nr',
+    'auftrag': 'auftrag', 'auftragsnummer': 'auftrag', 'fl': 'auftrag',
+    'beschreibung': 'beschreibung', 'bezeichnung': 'beschreibung', 'text': 'beschreibung',
+    'vorgang': 'vorgang',
+    'preis': 'preis', 'ep': 'preis', 'einzelpreis': 'preis',
+    'menge': 'menge', 'stk': 'menge', 'stück': 'menge', 'anzahl': 'menge',
+    'modellnummer': 'modellnummer', 'modell': 'modellnummer', 'modell-nr': 'modellnummer',
+    'fv': 'fv',
+    'werkstoff': 'werkstoff', 'material': 'werkstoff',
+}
+
+# Fields set by the database, never imported
+SKIPPED_FIELDS = ('id', 'created_at')
+
+def xlsx_available() -> bool:
+    return load_workbook is not None
+
+def parse_mapping(mapping: Optional[str]) -> Dict[str, str]:
+    """Column mapping: defaults plus a JSON object {"Header in file": "position_field"}"""
+    result = dict(DEFAULT_COLUMN_MAPPING)
+    if mapping:
+        custom = json.loads(mapping)
+        if not isinstance(custom, dict):
+            raise ValueError("mapping must be a JSON object")
+        result.update({str(k).strip().lower(): v for k, v in custom.items()})
+    return result
+
+class _SemicolonDialect(csv.excel):
+    # German Excel default
+    delimiter = ';'
+
+def _iter_csv(stream) -> Iterator[List[Any]]:
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = _SemicolonDialect
+    yield from csv.reader(text, dialect)
+
+def _iter_xlsx(stream) -> Iterator[List[Any]]:
+    if not xlsx_available():
+        raise RuntimeError("Excel import requires openpyxl")
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+def iter_table_rows(stream, filename: str) -> Iterator[List[Any]]:
+    """Raw rows of a CSV or XLSX upload, header row first"""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return _iter_xlsx(stream)
+    return _iter_csv(stream)
+
+def parse_number(value: Any) -> Optional[float]:
+    """Number from a cell in German (1.234,50) or English (1,234.50) notation.
+
+    The separator that comes last is the decimal separator, the other one
+    groups thousands. A single separator followed by exactly three digits
+    (1.234, 2,500) could be either and is rejected.
+    """
+    text = normalize_number(value)
+    return None if text is None else float(text)
+
+@lru_cache(maxsize=4096)
+def _vorgang_for(text: str) -> Optional[str]:
+    # Spreadsheets repeat the same descriptions; classify each distinct text once
+    from app.ocr import determine_vorgang
+    return determine_vorgang(text)
+
+def build_position(values: Dict[str, Any], model: Type[BaseModel],
+                   default_bestellnummer: Optional[str]) -> Dict[str, Any]:
+    """Validate one mapped row and return it as a positionen row (ValueError if invalid)"""
+    row = {}
+    for name, field in model.model_fields.items():
+        if name in SKIPPED_FIELDS:
+            continue
+        value = values.get(name)
+        if name in ('preis', 'menge'):
+            try:
+                row[name] = parse_number(value)
+            except ValueError as e:
+                raise ValueError(f"{name}: {str(e)}")
+        elif value is None or str(value).strip() == '':
+            row[name] = None
+        elif isinstance(value, float) and value.is_integer():
+            # Excel stores 10 as 10.0
+            row[name] = str(int(value))
+        else:
+            row[name] = str(value).strip()
+
+    row['bestellnummer'] = row.get('bestellnummer') or default_bestellnummer
+    if not row['bestellnummer']:
+        raise ValueError("bestellnummer missing")
+    if not row.get('pos_nr'):
+        raise ValueError("pos_nr missing")
+
+    # A vorgang from the file is kept; otherwise classify beschreibung like the OCR path
+    if not row.get('vorgang') and row.get('beschreibung'):
+        row['vorgang'] = _vorgang_for(row['beschreibung'])
+
+    try:
+        model(**row)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+    return row
+
+def iter_position_chunks(stream, filename: str, mapping: Dict[str, str], model: Type[BaseModel],
+                         default_bestellnummer: Optional[str] = None,
+                         chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Yield (valid positions, errors) per chunk of input rows.
+
+    Errors carry the 1-based line number of the row in the file.
+    """
+    rows = iter_table_rows(stream, filename)
+    header = next(rows, None)
+    if not header:
+        raise ValueError("File is empty")
+    fields = [mapping.get(str(h).strip().lower()) if h is not None else None for h in header]
+    if 'pos_nr' not in fields:
+        raise ValueError(f"No pos_nr column found in header: {header}")
+
+    positions, errors = [], []
+    for line_no, cells in enumerate(rows, start=2):
+        if not any(cell not in (None, '') for cell in cells):
+            continue  # blank line
+        values = {field: cell for field, cell in zip(fields, cells) if field}
+        try:
+            positions.append(build_position(values, model, default_bestellnummer))
+        except ValueError as e:
+            errors.append({"row": line_no, "error": str(e)})
+        if len(positions) + len(errors) >= chunk_size:
+            yield _dedupe(positions), errors
+            positions, errors = [], []
+    if positions or errors:
+        yield _dedupe(positions), errors
+
+def _dedupe(positions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Last row wins per (bestellnummer, pos_nr); one upsert may not touch a row twice"""
+    return list({(p['bestellnummer'], p['pos_nr']): p for p in positions}.values())
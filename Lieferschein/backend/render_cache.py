@@ -0,0 +1,158 @@
+"""
+Rendered-document cache.
+
+Generated PDFs are stored under a content hash of exactly the inputs the
+generators print (see cache_key), so a request with unchanged data is served
+from disk without rendering. Entries are also indexed by bestellnummer so all
+documents of an order can be dropped when its positions change.
+
+The PDF files are shared through CACHE_DIR, but the index, the LRU order and
+invalidation live in each process: the Flask pdf_server has its own cache and
+never sees the backend's speculative renders or invalidations.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, List
+
+CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'dzmetall_render_cache'))
+CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", 500))
+
+# Bump when the generators' output changes so stale renders are not served
+RENDER_VERSION = 4
+
+# Position fields printed on any of the documents
+POSITION_FIELDS = ('pos_nr', 'auftrag', 'beschreibung', 'vorgang', 'fv', 'menge',
+                   'werkstoff', 'modellnummer', 'preis')
+# Printed only after conversion to a number, so 2 and 2.0 render the same
+NUMERIC_FIELDS = ('menge', 'preis')
+# Document fields the generators read; missing ones are left out of the key
+DOCUMENT_FIELDS = ('bestellnummer', 'kunde', 'lieferschein_nr')
+
+def _normalize_position(pos: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for field in POSITION_FIELDS:
+        # A missing field is not the same as None: the generators print '' for
+        # the one and 'None' for the other, so only present fields are hashed
+        if field not in pos:
+            continue
+        value = pos[field]
+        if field in NUMERIC_FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        normalized[field] = value
+    return normalized
+
+def normalize_document_data(doc_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce document data to the fields that influence the rendered PDF.
+
+    Values are kept exactly as the generators read them (data.get(field,
+    default)); only database bookkeeping such as id or created_at is dropped
+    and menge/preis are compared as floats, so positions loaded from Supabase
+    and positions sent by the browser hash identically.
+    """
+    normalized = {field: doc_data[field] for field in DOCUMENT_FIELDS if field in doc_data}
+    # Generators fall back to today's date only when datum is missing, so the key must too
+    normalized['datum'] = doc_data['datum'] if 'datum' in doc_data else datetime.now().strftime('%d.%m.%Y')
+    normalized['positionen'] = [_normalize_position(pos) for pos in doc_data.get('positionen') or []]
+    return normalized
+
+def cache_key(doc_type: str, doc_data: Dict[str, Any]) -> str:
+    """Content hash identifying a rendered document"""
+    payload = json.dumps(
+        {'v': RENDER_VERSION, 'type': doc_type, 'data': normalize_document_data(doc_data)},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class RenderCache:
+    """LRU cache of rendered PDFs on disk"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_entries: int = CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_order: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, doc_type: str, doc_data: Dict[str, Any]) -> Optional[Tuple[str, str, Optional[Dict[str, Any]], Optional[str]]]:
+        """Return (pdf_path, document_number, optimization, file_path) of a cached render, or None"""
+        key = cache_key(doc_type, doc_data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and os.path.exists(entry['path']):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['path'], entry['document_number'], entry['optimization'], entry['file_path']
+            self.misses += 1
+        return None
+
+    def put(self, doc_type: str, doc_data: Dict[str, Any], pdf_path: str, document_number: str,
+            optimization: Optional[Dict[str, Any]] = None, file_path: Optional[str] = None) -> str:
+        """Move a freshly rendered PDF into the cache and return its cached path"""
+        key = cache_key(doc_type, doc_data)
+        cached_path = self.path_for(key)
+        shutil.move(pdf_path, cached_path)
+
+        bestellnummer = str(doc_data.get('bestellnummer', '') or '')
+        evicted = []
+        with self._lock:
+            self._entries[key] = {
+                'path': cached_path,
+                'document_number': document_number,
+                'optimization': optimization,
+                'file_path': file_path,
+                'bestellnummer': bestellnummer,
+            }
+            self._entries.move_to_end(key)
+            self._by_order.setdefault(bestellnummer, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._pop(next(iter(self._entries))))
+        self._remove_files(evicted)
+        return cached_path
+
+    def invalidate(self, bestellnummer: str) -> int:
+        """Drop every cached document of an order, return the number removed"""
+        with self._lock:
+            keys = list(self._by_order.get(bestellnummer, ()))
+            removed = [self._pop(key) for key in keys]
+        self._remove_files(removed)
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _pop(self, key: str) -> Optional[str]:
+        entry = self._entries.pop(key, None)
+        if not entry:
+            return None
+        keys = self._by_order.get(entry['bestellnummer'])
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self._by_order[entry['bestellnummer']]
+        return entry['path']
+
+    def _remove_files(self, paths: List[Optional[str]]):
+        # Files still being streamed stay readable through their open handle
+        for path in paths:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+# Process-wide cache shared by all PDF routes
+RENDER_CACHE = RenderCache()
@@ -1,11 +1,12 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import httpx
+import asyncio
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 from app.ocr import process_image
 import uvicorn
@@ -35,6 +36,15 @@ print(f"Files in parent dir: {os.listdir(parent_dir) if os.path.exists(parent_di
 vorlagen_dir = os.path.join(current_dir, '../Vorlagen')
 print(f"Files in Vorlagen dir: {os.listdir(vorlagen_dir) if os.path.exists(vorlagen_dir) else 'N/A'}")
 
+import speculative_render
+from autocomplete import AUTOCOMPLETE, AUTOCOMPLETE_FIELDS
+from change_feed import CHANGE_FEED, publish_positions, publish_history, warn_if_multi_worker
+from document_snapshots import split_snapshots, mark_known, needs_snapshot
+from history_stats import (
+    STATS_CACHE, BUCKETS, DOCUMENT_TYPES, MAX_FALLBACK_BUCKETS,
+    build_stats, iter_buckets, parse_date, parse_content_range_total
+)
+
 # Supabase configuration - MUST be set as environment variables
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -107,6 +117,17 @@ headers = {
     "Content-Type": "application/json"
 }
 
+async def load_order_positions(bestellnummer: str) -> List[Dict[str, Any]]:
+    """Load the positions of an order in the order used by /api/positions"""
+    async with httpx.AsyncClient() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/positionen?bestellnummer=eq.{bestellnummer}&order=pos_nr.asc&select=*",
+            headers=headers
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        return response.json()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -214,6 +235,201 @@ async def get_positions(bestellnummer: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+SEARCH_FIELDS = ('bestellnummer', 'auftrag', 'modellnummer', 'beschreibung', 'werkstoff')
+
+@app.get("/api/search")
+async def search_positions(q: str, limit: int = 20):
+    """Ranked search over all positions by Auftrag, Modellnummer, Bestellnummer or description words"""
+    term = q.strip()
+    if len(term) < 2:
+        raise HTTPException(status_code=400, detail="q must have at least 2 characters")
+    limit = max(1, min(limit, 100))
+    started = datetime.now()
+    
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/search_positions",
+                headers=headers,
+                json={"p_query": term, "p_limit": limit}
+            )
+            if response.status_code == 200:
+                hits = response.json()
+            elif response.status_code == 404:
+                # search_positions not installed (create_search_index.sql): substring match, ranked here
+                hits = await search_positions_fallback(client, term, limit)
+            else:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching positions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "query": term,
+        "hits": hits,
+        "took_ms": round((datetime.now() - started).total_seconds() * 1000, 1)
+    }
+
+async def search_positions_fallback(client: httpx.AsyncClient, term: str, limit: int) -> List[Dict[str, Any]]:
+    """ILIKE search through PostgREST, ranked by exact > prefix > substring match"""
+    # Quoted values keep PostgREST's or=() syntax intact; * is the ILIKE wildcard
+    value = term.replace('"', '').replace('\\', '').replace('*', '')
+    condition = ','.join(f'{field}.ilike."*{value}*"' for field in SEARCH_FIELDS)
+    response = await client.get(
+        f"{SUPABASE_URL}/rest/v1/positionen",
+        headers=headers,
+        params={
+            "select": "id,bestellnummer,pos_nr,auftrag,beschreibung,modellnummer,werkstoff",
+            "or": f"({condition})",
+            "limit": str(limit * 5)
+        }
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    
+    needle = value.lower()
+    def rank(row: Dict[str, Any]) -> float:
+        best = 0.0
+        for field in SEARCH_FIELDS:
+            text = str(row.get(field) or '').lower()
+            if text == needle:
+                best = max(best, 3.0)
+            elif text.startswith(needle):
+                best = max(best, 2.0)
+            elif needle in text:
+                best = max(best, 1.0)
+        return best
+    
+    hits = [{**row, "rank": rank(row)} for row in response.json()]
+    hits.sort(key=lambda hit: (-hit["rank"], str(hit.get("bestellnummer")), str(hit.get("pos_nr"))))
+    return hits[:limit]
+
+AUTOCOMPLETE_PAGE_SIZE = 1000
+autocomplete_task: Optional[asyncio.Task] = None
+
+async def load_autocomplete_index():
+    """Fill the autocomplete index from all positions (keyset-paged, PostgREST caps page sizes)"""
+    last_id = 0
+    rows: List[Dict[str, Any]] = []
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            while True:
+                response = await client.get(
+                    f"{SUPABASE_URL}/rest/v1/positionen",
+                    headers=headers,
+                    params={
+                        "select": "id," + ",".join(AUTOCOMPLETE_FIELDS),
+                        "id": f"gt.{last_id}",
+                        "order": "id.asc",
+                        "limit": str(AUTOCOMPLETE_PAGE_SIZE)
+                    }
+                )
+                if response.status_code != 200:
+                    raise RuntimeError(response.text)
+                page = response.json()
+                rows.extend(page)
+                if len(page) < AUTOCOMPLETE_PAGE_SIZE:
+                    break
+                last_id = page[-1]["id"]
+        # Sorting a large table takes a while; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, AUTOCOMPLETE.build, rows)
+        AUTOCOMPLETE.loaded = True
+        print(f"Autocomplete index built from {len(rows)} positions: {AUTOCOMPLETE.stats()}")
+    except Exception as e:
+        print(f"Warning: Could not build autocomplete index: {str(e)}")
+
+def start_autocomplete_index():
+    """Build the autocomplete index in the background (once per process)"""
+    global autocomplete_task
+    if autocomplete_task is None or (autocomplete_task.done() and not AUTOCOMPLETE.loaded):
+        autocomplete_task = asyncio.get_running_loop().create_task(load_autocomplete_index())
+
+@app.on_event("startup")
+async def build_autocomplete_index():
+    start_autocomplete_index()
+
+@app.get("/api/autocomplete")
+async def autocomplete(field: str, q: str = "", limit: int = 10):
+    """Most used values of a position field starting with q"""
+    if field not in AUTOCOMPLETE_FIELDS:
+        raise HTTPException(status_code=400, detail=f"field must be one of: {', '.join(AUTOCOMPLETE_FIELDS)}")
+    # Mounted apps get no startup event, so the first request starts the build
+    start_autocomplete_index()
+    
+    return {
+        "field": field,
+        "suggestions": AUTOCOMPLETE.suggest(field, q, max(1, min(limit, 50))),
+        "complete": AUTOCOMPLETE.loaded
+    }
+
+EXPORT_PAGE_SIZE = 1000
+# Table, keyset column and column schema per exportable entity
+EXPORT_ENTITIES = {
+    'positions': ('positionen', 'id', Position),
+    'orders': ('bestellungen', 'bestellnummer', Order),
+}
+
+@app.get("/api/export")
+async def export_data(
+    format: str = "csv",
+    entity: str = "positions",
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    bestellnummer: Optional[str] = None
+):
+    """Stream orders or positions as CSV, JSON Lines or Parquet, optionally filtered by created_at date"""
+    from export_stream import EXPORT_FORMATS, ENCODERS, parquet_available
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if entity not in EXPORT_ENTITIES:
+        raise HTTPException(status_code=400, detail=f"entity must be one of: {', '.join(EXPORT_ENTITIES)}")
+    if format == 'parquet' and not parquet_available():
+        raise HTTPException(status_code=503, detail="Parquet export requires pyarrow")
+    try:
+        start = parse_date(date_from, None)
+        end = parse_date(date_to, None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to must be dates in YYYY-MM-DD format")
+    
+    table, key, model = EXPORT_ENTITIES[entity]
+    filters = []
+    if start:
+        filters.append(("created_at", f"gte.{start.isoformat()}T00:00:00Z"))
+    if end:
+        filters.append(("created_at", f"lt.{(end + timedelta(days=1)).isoformat()}T00:00:00Z"))
+    if bestellnummer:
+        filters.append(("bestellnummer", f"eq.{bestellnummer}"))
+    
+    async def pages():
+        """Keyset pagination: only one page is held in memory at a time"""
+        last = None
+        async with httpx.AsyncClient(timeout=60) as client:
+            while True:
+                params = [("select", "*"), ("order", f"{key}.asc"), ("limit", str(EXPORT_PAGE_SIZE)), *filters]
+                if last is not None:
+                    params.append((key, f"gt.{last}"))
+                response = await client.get(f"{SUPABASE_URL}/rest/v1/{table}", headers=headers, params=params)
+                if response.status_code != 200:
+                    # Headers are already sent; abort the stream so the client sees a broken download
+                    raise RuntimeError(f"Export of {table} failed: {response.text}")
+                page = response.json()
+                if page:
+                    yield page
+                if len(page) < EXPORT_PAGE_SIZE:
+                    break
+                last = page[-1][key]
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"{entity}_{date_from or 'alle'}_{date_to or datetime.now().strftime('%Y-%m-%d')}.{extension}"
+    return StreamingResponse(
+        ENCODERS[format](pages(), model),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @app.put("/api/positions/batch")
 async def update_positions_batch(positions: List[Dict[str, Any]]):
     """Update multiple position records using bestellnummer and pos_nr as composite key"""
@@ -221,6 +437,8 @@ async def update_positions_batch(positions: List[Dict[str, Any]]):
         print(f"Received {len(positions)} positions")  # Debug log
         async with httpx.AsyncClient() as client:
             results = []
+            # New or changed field values for the autocomplete index
+            autocomplete_values = []
             
             for i, position in enumerate(positions):
                 try:
@@ -261,6 +479,9 @@ async def update_positions_batch(positions: List[Dict[str, Any]]):
                             
                             if update_response.status_code in [200, 204]:
                                 results.append({"bestellnummer": bestellnummer, "pos_nr": pos_nr, "status": "updated"})
+                                autocomplete_values.append({
+                                    k: v for k, v in update_data.items() if v != existing[0].get(k)
+                                })
                                 continue
                             else:
                                 print(f"Update failed: {update_response.status_code}, {update_response.text}")
@@ -287,6 +508,7 @@ async def update_positions_batch(positions: List[Dict[str, Any]]):
                                 )
                             
                             results.append({"bestellnummer": bestellnummer, "pos_nr": pos_nr, "status": "created"})
+                            autocomplete_values.append(create_data)
                         
                 except KeyError as e:
                     print(f"KeyError processing position {i+1}: {str(e)}")
@@ -297,6 +519,17 @@ async def update_positions_batch(positions: List[Dict[str, Any]]):
                     print(f"Position data: {position}")
                     raise
             
+            # Edited orders: drop speculative and cached renders
+            for bestellnummer in {r["bestellnummer"] for r in results}:
+                speculative_render.invalidate(bestellnummer)
+            AUTOCOMPLETE.add_positions(autocomplete_values)
+            written = {(r["bestellnummer"], r["pos_nr"]) for r in results}
+            publish_positions([
+                {k: v for k, v in position.items() if k not in ['id', 'created_at']}
+                for position in positions
+                if (position.get('bestellnummer'), position.get('pos_nr')) in written
+            ])
+            
             print(f"Successfully processed {len(results)} positions")
             return {"updated": len(results), "results": results}
             
@@ -308,6 +541,162 @@ async def update_positions_batch(positions: List[Dict[str, Any]]):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+MAX_IMPORT_ERRORS = 1000
+
+@app.post("/api/import")
+async def import_positions(
+    file: UploadFile = File(...),
+    mapping: Optional[str] = Form(None),
+    bestellnummer: Optional[str] = Form(None),
+    dry_run: bool = Form(False)
+):
+    """Import positions from a CSV or XLSX file with chunked bulk upserts.
+
+    mapping is an optional JSON object {"Column header": "position_field"};
+    bestellnummer is used for rows without one; dry_run only validates.
+    """
+    from position_import import parse_mapping, iter_position_chunks, xlsx_available
+    from starlette.concurrency import iterate_in_threadpool
+    
+    filename = file.filename or ''
+    if filename.lower().endswith(('.xlsx', '.xlsm')) and not xlsx_available():
+        raise HTTPException(status_code=503, detail="Excel import requires openpyxl")
+    try:
+        column_mapping = parse_mapping(mapping)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid mapping: {str(e)}")
+    
+    imported = 0
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+    orders = set()
+    started = datetime.now()
+    
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            # Parsing and validation run in a worker thread, one chunk at a time
+            chunks = iterate_in_threadpool(
+                iter_position_chunks(file.file, filename, column_mapping, Position, bestellnummer)
+            )
+            async for positions, chunk_errors in chunks:
+                error_count += len(chunk_errors)
+                errors.extend(chunk_errors[:MAX_IMPORT_ERRORS - len(errors)])
+                if not positions or dry_run:
+                    imported += len(positions)
+                    continue
+                
+                new_orders = {p['bestellnummer'] for p in positions} - orders
+                if new_orders:
+                    order_response = await client.post(
+                        f"{SUPABASE_URL}/rest/v1/bestellungen?on_conflict=bestellnummer",
+                        headers={**headers, "Prefer": "resolution=ignore-duplicates,return=minimal"},
+                        json=[{"bestellnummer": b} for b in sorted(new_orders)]
+                    )
+                    if order_response.status_code not in [200, 201, 204]:
+                        raise HTTPException(
+                            status_code=order_response.status_code,
+                            detail=f"Failed to create orders: {order_response.text}"
+                        )
+                    orders |= new_orders
+                
+                response = await client.post(
+                    f"{SUPABASE_URL}/rest/v1/positionen?on_conflict=bestellnummer,pos_nr",
+                    headers={**headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+                    json=positions
+                )
+                if response.status_code not in [200, 201, 204]:
+                    # Earlier chunks are committed; report how far the import got
+                    raise HTTPException(
+                        status_code=response.status_code,
+                        detail={
+                            "error": f"Failed to write positions: {response.text}",
+                            "hint": "Bulk upserts need the unique key from create_positionen_unique_key.sql",
+                            "imported": imported
+                        }
+                    )
+                imported += len(positions)
+                AUTOCOMPLETE.add_positions(positions)
+                publish_positions(positions)
+    except HTTPException:
+        raise
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error importing positions: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    for order in orders:
+        speculative_render.invalidate(order)
+    
+    print(f"Imported {imported} positions from {filename} ({error_count} errors) in {(datetime.now() - started).total_seconds():.2f}s")
+    return {
+        "imported": imported,
+        "failed": error_count,
+        "dry_run": dry_run,
+        "orders": sorted(orders),
+        "errors": errors
+    }
+
+@app.on_event("startup")
+async def check_change_feed_workers():
+    warn_if_multi_worker()
+
+@app.get("/api/changes")
+async def get_changes(since: Optional[str] = None):
+    """Changes to orders, positions and document history after a cursor"""
+    events, reset = CHANGE_FEED.since(since)
+    return {"cursor": CHANGE_FEED.cursor(), "reset": reset, "changes": events}
+
+@app.get("/api/changes/stream")
+async def stream_changes(request: Request, since: Optional[str] = None):
+    """Server-Sent Events: missed changes after since (or Last-Event-ID), then live changes"""
+    since = request.headers.get('last-event-id') or since
+    queue = CHANGE_FEED.subscribe()
+    backlog, reset = CHANGE_FEED.since(since)
+    # Everything up to here is in the backlog; queued events up to this number are duplicates
+    last_seq = CHANGE_FEED.seq
+    
+    def format_event(event: Dict[str, Any]) -> str:
+        return f"id: {event['cursor']}\nevent: change\ndata: {json.dumps(event, default=str)}\n\n"
+    
+    async def events():
+        try:
+            if since and reset:
+                yield f"event: reset\ndata: {json.dumps({'cursor': CHANGE_FEED.cursor()})}\n\n"
+            for event in backlog:
+                yield format_event(event)
+            while True:
+                # closed: this client fell behind and was dropped; ending the response makes it reconnect
+                if queue.closed or await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                if event['seq'] > last_seq:
+                    yield format_event(event)
+        finally:
+            CHANGE_FEED.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+async def store_extracted_data(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Write the order and positions of an extraction result (shared by /api/extract and the hot folder).
+
+    Positions are upserted on (bestellnummer, pos_nr), so storing the same
+    scan again updates its positions instead of adding a second copy.
+    """
+    async with httpx.AsyncClient() as client:
+        return await store_extracted_batch(client, [extracted_data])
+
 @app.post("/api/extract")
 async def extract_from_image(file: UploadFile = File(...)):
     """Extract data from uploaded delivery note image"""
@@ -336,51 +725,7 @@ async def extract_from_image(file: UploadFile = File(...)):
             }
             raise HTTPException(status_code=422, detail=error_detail)
         
-        # Insert order if bestellnummer exists
-        if extracted_data.get("bestellnummer"):
-            async with httpx.AsyncClient() as client:
-                # Check if order already exists
-                check_response = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/bestellungen?bestellnummer=eq.{extracted_data['bestellnummer']}",
-                    headers=headers
-                )
-                
-                if check_response.status_code == 200 and not check_response.json():
-                    # Order doesn't exist, create it
-                    order_data = {"bestellnummer": extracted_data["bestellnummer"]}
-                    order_response = await client.post(
-                        f"{SUPABASE_URL}/rest/v1/bestellungen",
-                        headers=headers,
-                        json=order_data
-                    )
-                    
-                    if order_response.status_code not in [200, 201]:
-                        raise HTTPException(
-                            status_code=order_response.status_code,
-                            detail=f"Failed to create order: {order_response.text}"
-                        )
-                
-                # Insert positions
-                if extracted_data.get("positionen"):
-                    positions_data = [
-                        {**pos, "bestellnummer": extracted_data["bestellnummer"]}
-                        for pos in extracted_data["positionen"]
-                    ]
-                    
-                    # Debug: Print what we're sending
-                    print(f"Sending positions to database: {json.dumps(positions_data, indent=2)}")
-                    
-                    positions_response = await client.post(
-                        f"{SUPABASE_URL}/rest/v1/positionen",
-                        headers=headers,
-                        json=positions_data
-                    )
-                    
-                    if positions_response.status_code not in [200, 201]:
-                        raise HTTPException(
-                            status_code=positions_response.status_code,
-                            detail=f"Failed to create positions: {positions_response.text}"
-                        )
+        await store_extracted_data(extracted_data)
         
         return extracted_data
     except HTTPException:
@@ -390,6 +735,154 @@ async def extract_from_image(file: UploadFile = File(...)):
         # Only wrap non-HTTP exceptions
         raise HTTPException(status_code=500, detail=str(e))
 
+EXTRACT_BATCH_CHUNK = 500  # positions per bulk upsert
+
+@app.post("/api/extract/batch")
+async def extract_batch(files: List[UploadFile] = File(...)):
+    """Extract many scans (or ZIP archives of scans) at once.
+
+    Streams NDJSON: one "document" line per scan as soon as it is extracted,
+    a "stored" line per bulk write of orders and positions, and a final
+    "summary" line.
+    """
+    from batch_extract import iter_upload_documents, extract_documents
+    
+    def line(item: Dict[str, Any]) -> bytes:
+        return (json.dumps(item, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    
+    async def results():
+        summary = {"type": "summary", "documents": 0, "ok": 0, "failed": 0, "skipped": 0, "cached": 0,
+                   "orders": set(), "positions_stored": 0, "store_errors": 0}
+        started = datetime.now()
+        pending: List[Dict[str, Any]] = []
+        pending_files: List[str] = []
+        
+        async def flush(client: httpx.AsyncClient) -> Dict[str, Any]:
+            files_in_chunk = list(pending_files)
+            try:
+                stored = await store_extracted_batch(client, pending)
+                summary["orders"].update(stored["orders"])
+                summary["positions_stored"] += stored["positions"]
+                return {"type": "stored", "status": "ok", "files": files_in_chunk, **stored}
+            except Exception as e:
+                summary["store_errors"] += 1
+                print(f"Error storing extracted batch: {str(e)}")
+                return {"type": "stored", "status": "failed", "files": files_in_chunk,
+                        "error": getattr(e, "detail", None) or str(e)}
+            finally:
+                pending.clear()
+                pending_files.clear()
+        
+        async with httpx.AsyncClient(timeout=60) as client:
+            async for result in extract_documents(iter_upload_documents(files)):
+                if result["type"] == "document":
+                    summary["documents"] += 1
+                    summary[result["status"]] += 1
+                    summary["cached"] += bool(result.get("cached"))
+                yield line(result)
+                
+                if result.get("status") == "ok" and result.get("bestellnummer"):
+                    pending.append(result["data"])
+                    pending_files.append(result["file"])
+                    if sum(len(d.get("positionen") or []) for d in pending) >= EXTRACT_BATCH_CHUNK:
+                        yield line(await flush(client))
+            if pending:
+                yield line(await flush(client))
+        
+        summary["orders"] = sorted(summary["orders"])
+        summary["duration_ms"] = round((datetime.now() - started).total_seconds() * 1000)
+        print(f"Batch extraction: {summary['ok']}/{summary['documents']} documents, "
+              f"{summary['positions_stored']} positions in {summary['duration_ms']} ms")
+        yield line(summary)
+    
+    return StreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+async def store_extracted_batch(client: httpx.AsyncClient, extracted: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Write the orders and positions of several extraction results with one bulk upsert each"""
+    from batch_extract import extracted_positions
+    
+    orders = sorted({data["bestellnummer"] for data in extracted if data.get("bestellnummer")})
+    columns = [name for name in Position.model_fields if name not in ("id", "created_at")]
+    positions = extracted_positions(extracted, columns)
+    if not orders:
+        return {"orders": [], "positions": 0}
+    
+    order_response = await client.post(
+        f"{SUPABASE_URL}/rest/v1/bestellungen?on_conflict=bestellnummer",
+        headers={**headers, "Prefer": "resolution=ignore-duplicates,return=minimal"},
+        json=[{"bestellnummer": b} for b in orders]
+    )
+    if order_response.status_code not in [200, 201, 204]:
+        raise HTTPException(status_code=order_response.status_code,
+                            detail=f"Failed to create orders: {order_response.text}")
+    for bestellnummer in orders:
+        CHANGE_FEED.publish("order", "upsert", {"bestellnummer": bestellnummer}, {"bestellnummer": bestellnummer})
+    
+    if positions:
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/positionen?on_conflict=bestellnummer,pos_nr",
+            headers={**headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+            json=positions
+        )
+        if response.status_code not in [200, 201, 204]:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail={
+                    "error": f"Failed to create positions: {response.text}",
+                    "hint": "Bulk upserts need the unique key from create_positionen_unique_key.sql"
+                }
+            )
+        AUTOCOMPLETE.add_positions(positions)
+        publish_positions(positions)
+    
+    for bestellnummer in orders:
+        # Existing positions may have been replaced: drop cached renders, then pre-render again
+        speculative_render.invalidate(bestellnummer)
+        speculative_render.schedule_laufkarte(
+            bestellnummer, lambda b=bestellnummer: load_order_positions(b)
+        )
+    return {"orders": orders, "positions": len(positions)}
+
+hotfolder_watcher = None
+
+async def ingest_scanned_file(filename: str, content: bytes) -> Dict[str, Any]:
+    """Hot folder handler: same pipeline as /api/extract for a file from a scanner folder"""
+    from batch_extract import process_image_in_pool
+    
+    print(f"Hot folder: processing {filename}, size: {len(content)} bytes")
+    # process_image blocks (pdf2image, Gemini, Tesseract): run it on the OCR pool, not on the event loop
+    extracted_data = await process_image_in_pool(content, filename)
+    if not extracted_data:
+        raise ValueError("No order number (BL-) or position items (FL-) found in the document")
+    await store_extracted_data(extracted_data)
+    return {
+        "bestellnummer": extracted_data.get("bestellnummer"),
+        "positions": len(extracted_data.get("positionen") or [])
+    }
+
+def start_hotfolder_watcher():
+    """Watch the HOTFOLDER_DIRS (once per process, only when configured)"""
+    global hotfolder_watcher
+    from hotfolder import HotfolderWatcher, HOTFOLDER_DIRS
+    if hotfolder_watcher is None and HOTFOLDER_DIRS:
+        hotfolder_watcher = HotfolderWatcher(HOTFOLDER_DIRS, ingest_scanned_file)
+        hotfolder_watcher.start()
+
+@app.on_event("startup")
+async def start_hotfolder():
+    start_hotfolder_watcher()
+
+@app.get("/api/hotfolder/status")
+async def get_hotfolder_status():
+    """State of the scanner hot folder watcher and its latest results"""
+    if hotfolder_watcher is None:
+        return {"running": False, "detail": "Hot folder not configured (HOTFOLDER_DIRS)"}
+    return hotfolder_watcher.status()
+
 @app.delete("/api/orders/{bestellnummer}")
 async def delete_order(bestellnummer: str):
     """Delete an order and all its positions"""
@@ -419,6 +912,10 @@ async def delete_order(bestellnummer: str):
                     detail=f"Failed to delete order: {order_response.text}"
                 )
             
+            speculative_render.invalidate(bestellnummer)
+            # One event covers the order and all of its positions
+            CHANGE_FEED.publish("order", "delete", {"bestellnummer": bestellnummer})
+            
             return {"message": f"Order {bestellnummer} and its positions deleted successfully"}
     except HTTPException:
         raise
@@ -450,38 +947,150 @@ async def create_document_history(request: Request):
         # Create history object
         history = DocumentHistory(**data)
         
-        async with httpx.AsyncClient() as client:
-            # Prepare data for insertion
-            history_data = {
+        return await insert_document_history({
+            "bestellnummer": history.bestellnummer,
+            "document_type": history.document_type,
+            "generated_by": history.generated_by,
+            "document_data": history.document_data,
+            "file_path": history.file_path,
+            "metadata": history.metadata
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def insert_document_history(history_data: Dict[str, Any]) -> Any:
+    """Insert one document_history row into Supabase and return the response body"""
+    history_data = (await store_snapshots([history_data]))[0]
+    # Remove None values
+    history_data = {k: v for k, v in history_data.items() if v is not None}
+    
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/document_history",
+            headers={**headers, "Prefer": "return=representation"},
+            json=history_data
+        )
+        
+        if response.status_code not in [200, 201]:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to create document history: {response.text}"
+            )
+        
+        # New entries change the counts
+        STATS_CACHE.clear()
+        publish_history(response.json())
+        return response.json()
+
+@app.post("/api/document-history/bulk")
+async def create_document_history_bulk(entries: List[Dict[str, Any]]):
+    """Record several document generation events with a single insert"""
+    try:
+        rows = []
+        for i, data in enumerate(entries):
+            if not data.get('bestellnummer') or not data.get('document_type'):
+                raise HTTPException(status_code=400, detail=f"Entry {i}: bestellnummer and document_type are required")
+            history = DocumentHistory(**data)
+            rows.append({
                 "bestellnummer": history.bestellnummer,
                 "document_type": history.document_type,
                 "generated_by": history.generated_by,
                 "document_data": history.document_data,
                 "file_path": history.file_path,
                 "metadata": history.metadata
-            }
-            
-            # Remove None values
-            history_data = {k: v for k, v in history_data.items() if v is not None}
-            
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/document_history",
-                headers=headers,
-                json=history_data
-            )
-            
-            if response.status_code not in [200, 201]:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Failed to create document history: {response.text}"
-                )
-            
-            return response.json()
+            })
+        
+        if not rows:
+            return []
+        
+        return await insert_document_history_bulk(rows)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def insert_document_history_bulk(rows: List[Dict[str, Any]]) -> Any:
+    """Insert many document_history rows in one PostgREST request"""
+    rows = await store_snapshots(rows)
+    # PostgREST bulk inserts require identical keys in every object, so None values are kept
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/document_history",
+            headers={**headers, "Prefer": "return=representation"},
+            json=rows
+        )
+        
+        if response.status_code not in [200, 201]:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to create document history: {response.text}"
+            )
+        
+        # New entries change the counts
+        STATS_CACHE.clear()
+        publish_history(response.json())
+        return response.json()
+
+# False once Supabase reports that document_snapshots does not exist (migration not run)
+snapshots_enabled = True
+
+async def store_snapshots(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Move document_data of history rows into document_snapshots.
+
+    Returns the rows to insert: with a snapshot_hash reference instead of the
+    data, or unchanged if the snapshot table is not available.
+    """
+    global snapshots_enabled
+    if not snapshots_enabled:
+        return rows
+    
+    history_rows, snapshots = split_snapshots(rows)
+    if snapshots:
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{SUPABASE_URL}/rest/v1/document_snapshots?on_conflict=hash",
+                    headers={**headers, "Prefer": "resolution=ignore-duplicates,return=minimal"},
+                    json=snapshots
+                )
+        except httpx.HTTPError as e:
+            print(f"Warning: Could not store document snapshots: {str(e)}")
+            return rows
+        
+        if response.status_code == 404:
+            print("Warning: document_snapshots table missing, storing document_data inline "
+                  "(run create_document_snapshots.sql)")
+            snapshots_enabled = False
+            return rows
+        if response.status_code not in [200, 201, 204]:
+            print(f"Warning: Could not store document snapshots: {response.text}")
+            return rows
+        mark_known([snapshot['hash'] for snapshot in snapshots])
+    
+    return history_rows
+
+async def attach_snapshot(history: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill document_data of a history row from its snapshot"""
+    digest = needs_snapshot(history)
+    if not digest:
+        return history
+    
+    async with httpx.AsyncClient() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/document_snapshots?hash=eq.{digest}&select=document_data",
+            headers=headers
+        )
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to fetch document snapshot: {response.text}"
+            )
+        snapshot = response.json()
+    
+    return {**history, 'document_data': snapshot[0]['document_data'] if snapshot else None}
+
 @app.get("/api/document-history")
 async def get_document_history(bestellnummer: Optional[str] = None):
     """Get document history, optionally filtered by order number"""
@@ -521,31 +1130,335 @@ async def get_document_history(bestellnummer: Optional[str] = None):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Declared before /api/document-history/{history_id} so "stats" is not taken for an id
+@app.get("/api/document-history/stats")
+async def get_document_history_stats(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    bucket: str = "day"
+):
+    """Number of generated documents per type and day/week (default: last 30 days)"""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(BUCKETS)}")
+    try:
+        today = datetime.utcnow().date()
+        end = parse_date(date_to, today)
+        start = parse_date(date_from, end - timedelta(days=29))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to must be dates in YYYY-MM-DD format")
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    
+    cache_key = (start, end, bucket)
+    cached = STATS_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        rows = await fetch_history_counts(start, end, bucket)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error computing document history stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    stats = build_stats(rows, start, end, bucket, DOCUMENT_TYPES)
+    STATS_CACHE.put(cache_key, stats)
+    return stats
+
+ARCHIVE_PAGE_SIZE = 100
+# Re-renders of documents missing from the PDF archive running at the same time
+ARCHIVE_RENDER_CONCURRENCY = int(os.getenv("ARCHIVE_RENDER_CONCURRENCY", 2))
+
+# Declared before /api/document-history/{history_id} so "archive" is not taken for an id
+@app.get("/api/document-history/archive")
+async def download_document_archive(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    type: Optional[str] = None
+):
+    """ZIP of every generated document in a date range (default: last 30 days) with a manifest.csv"""
+    from pdf_service import history_pdf_path
+    from pdf_archive import resolve as resolve_archive_path
+    from zip_stream import aiter_zip
+    import csv
+    
+    if type and type not in DOCUMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"type must be one of: {', '.join(DOCUMENT_TYPES)}")
+    try:
+        today = datetime.utcnow().date()
+        end = parse_date(date_to, today)
+        start = parse_date(date_from, end - timedelta(days=29))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to must be dates in YYYY-MM-DD format")
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    
+    filters = [
+        ("generated_at", f"gte.{start.isoformat()}T00:00:00Z"),
+        ("generated_at", f"lt.{(end + timedelta(days=1)).isoformat()}T00:00:00Z"),
+    ]
+    if type:
+        filters.append(("document_type", f"eq.{type}"))
+    render_slots = asyncio.Semaphore(ARCHIVE_RENDER_CONCURRENCY)
+    manifest = []
+    
+    async def history_pages():
+        """Keyset pagination over the matching history rows"""
+        last_id = 0
+        async with httpx.AsyncClient(timeout=60) as client:
+            while True:
+                response = await client.get(
+                    f"{SUPABASE_URL}/rest/v1/document_history",
+                    headers=headers,
+                    params=[("select", "*"), ("order", "id.asc"), ("limit", str(ARCHIVE_PAGE_SIZE)),
+                            ("id", f"gt.{last_id}"), *filters]
+                )
+                if response.status_code != 200:
+                    # Headers are already sent; abort the stream so the client sees a broken download
+                    raise RuntimeError(f"Failed to fetch document history: {response.text}")
+                page = response.json()
+                if page:
+                    yield page
+                if len(page) < ARCHIVE_PAGE_SIZE:
+                    break
+                last_id = page[-1]["id"]
+    
+    async def locate(history: Dict[str, Any]):
+        """(pdf path, source) of a history row: the archived copy or a bounded re-render"""
+        archived_path = resolve_archive_path(history.get('file_path'))
+        if archived_path:
+            return archived_path, "archive"
+        try:
+            async with render_slots:
+                return await history_pdf_path(await attach_snapshot(history)), "rendered"
+        except Exception as e:
+            return None, f"missing: {str(e)}"
+    
+    async def members():
+        async for page in history_pages():
+            # Locate one page at a time; re-renders of the page run concurrently up to the limit
+            located = await asyncio.gather(*(locate(history) for history in page))
+            for history, (pdf_path, source) in zip(page, located):
+                metadata = history.get('metadata') or {}
+                name = (
+                    f"{history.get('document_type')}/{str(history.get('generated_at', ''))[:10]}_"
+                    f"{history.get('bestellnummer')}_{history.get('id')}.pdf"
+                ).replace(' ', '_')
+                manifest.append([
+                    history.get('id'), history.get('bestellnummer'), history.get('document_type'),
+                    metadata.get('document_number', ''), history.get('generated_at'),
+                    name if pdf_path else '', source
+                ])
+                if pdf_path:
+                    yield name, pdf_path
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        writer.writerow(['id', 'bestellnummer', 'document_type', 'document_number', 'generated_at', 'file', 'source'])
+        writer.writerows(manifest)
+        yield 'manifest.csv', buffer.getvalue().encode('utf-8-sig')
+    
+    filename = f"dokumente_{start.isoformat()}_{end.isoformat()}{'_' + type if type else ''}.zip"
+    return StreamingResponse(
+        aiter_zip(members()),
+        media_type='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+async def fetch_history_counts(start, end, bucket: str) -> List[Dict[str, Any]]:
+    """(bucket, document_type, count) rows for [start, end], counted by Supabase"""
+    range_from = f"{start.isoformat()}T00:00:00Z"
+    range_to = f"{(end + timedelta(days=1)).isoformat()}T00:00:00Z"
+    
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/document_history_stats",
+            headers=headers,
+            json={"p_from": range_from, "p_to": range_to, "p_bucket": bucket}
+        )
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code != 404:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to compute document history stats: {response.text}"
+            )
+        
+        # RPC not installed: one exact count per type and bucket (HEAD, no rows transferred)
+        buckets = list(iter_buckets(start, end, bucket))
+        if len(buckets) * len(DOCUMENT_TYPES) > MAX_FALLBACK_BUCKETS:
+            raise HTTPException(
+                status_code=400,
+                detail="Range too large without the document_history_stats RPC (run create_document_history_stats.sql)"
+            )
+        
+        async def count(doc_type: str, bucket_from, bucket_to) -> Dict[str, Any]:
+            lower = max(bucket_from, start)
+            upper = min(bucket_to, end + timedelta(days=1))
+            head = await client.head(
+                f"{SUPABASE_URL}/rest/v1/document_history",
+                headers={**headers, "Prefer": "count=exact", "Range": "0-0"},
+                params=[
+                    ("select", "id"),
+                    ("document_type", f"eq.{doc_type}"),
+                    ("generated_at", f"gte.{lower.isoformat()}T00:00:00Z"),
+                    ("generated_at", f"lt.{upper.isoformat()}T00:00:00Z"),
+                ]
+            )
+            if head.status_code not in [200, 206]:
+                raise HTTPException(status_code=head.status_code, detail="Failed to count document history")
+            return {
+                "bucket": bucket_from.isoformat(),
+                "document_type": doc_type,
+                "count": parse_content_range_total(head.headers.get("content-range"))
+            }
+        
+        return await asyncio.gather(*(
+            count(doc_type, bucket_from, bucket_to)
+            for bucket_from, bucket_to in buckets
+            for doc_type in DOCUMENT_TYPES
+        ))
+
 @app.get("/api/document-history/{history_id}")
 async def get_document_history_by_id(history_id: int):
     """Get a specific document history record"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/document_history?id=eq.{history_id}",
-                headers=headers
+        return await fetch_document_history(history_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def fetch_document_history(history_id: int) -> Dict[str, Any]:
+    """Load one document history record, 404 if it does not exist"""
+    async with httpx.AsyncClient() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/document_history?id=eq.{history_id}",
+            headers=headers
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to fetch document history: {response.text}"
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Failed to fetch document history: {response.text}"
-                )
-            
-            history = response.json()
-            if not history:
-                raise HTTPException(status_code=404, detail="Document history not found")
-            
-            return history[0]
+        
+        history = response.json()
+        if not history:
+            raise HTTPException(status_code=404, detail="Document history not found")
+    
+    return await attach_snapshot(history[0])
+
+@app.get("/api/document-history/{history_id}/pdf")
+async def get_document_history_pdf(history_id: int, request: Request):
+    """Download the PDF of a history entry (ETag and single byte ranges supported)"""
+    from pdf_service import history_pdf_path, download_name, RENDER_POOL
+    from pdf_archive import archive_etag, file_digest, parse_range, iter_file_range, resolve
+    
+    try:
+        history = await fetch_document_history(history_id)
+        pdf_path = await history_pdf_path(history)
+        if resolve(history.get('file_path')) == pdf_path:
+            etag = archive_etag(history['file_path'])
+        else:
+            loop = asyncio.get_running_loop()
+            etag = f'"{await loop.run_in_executor(RENDER_POOL, file_digest, pdf_path)}"'
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
+        print(f"Error loading history PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    response_headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=86400',
+        'Content-Disposition': f'attachment; filename="{download_name(history.get("document_type", "dokument"), history)}"'
+    }
+    
+    if etag in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=response_headers)
+    
+    size = os.path.getsize(pdf_path)
+    # If-Range: only honour the range if the client still has this version
+    if_range = request.headers.get('if-range')
+    range_header = request.headers.get('range') if not if_range or if_range == etag else None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**response_headers, 'Content-Range': f'bytes */{size}'})
+    
+    if byte_range is None:
+        # FileResponse lets the server use zero-copy transfer where it supports it
+        return FileResponse(pdf_path, media_type='application/pdf', headers=response_headers)
+    
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(pdf_path, start, end),
+        status_code=206,
+        media_type='application/pdf',
+        headers={
+            **response_headers,
+            'Content-Range': f'bytes {start}-{end}/{size}',
+            'Content-Length': str(end - start + 1)
+        }
+    )
+
+@app.post("/api/document-history/{history_id}/regenerate")
+async def regenerate_document_history(history_id: int):
+    """Render a historic document again from its stored snapshot"""
+    from pdf_service import regenerate_history_document, history_document_data, pdf_response_headers, iter_pdf_file
+    
+    try:
+        history = await fetch_document_history(history_id)
+        result = await regenerate_history_document(history)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Error regenerating document: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        iter_pdf_file(result.pdf_path),
+        media_type='application/pdf',
+        headers=pdf_response_headers(history['document_type'], history_document_data(history), result)
+    )
+
+@app.get("/api/document-history/{history_id}/thumbnail")
+async def get_document_history_thumbnail(history_id: int, dpi: Optional[int] = None):
+    """PNG preview of page 1 of a generated document"""
+    from pdf_service import history_pdf_source, RENDER_POOL
+    from thumbnails import render_thumbnail, thumbnails_available
+    
+    if not thumbnails_available():
+        raise HTTPException(status_code=503, detail="Thumbnail rendering not available")
+    
+    try:
+        history = await fetch_document_history(history_id)
+        pdf_path, source_key = await history_pdf_source(history)
+        loop = asyncio.get_running_loop()
+        png_path = await loop.run_in_executor(RENDER_POOL, render_thumbnail, pdf_path, dpi, source_key)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Error rendering thumbnail: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # The issued PDF never changes, so its thumbnail can be cached for good; a
+    # re-render may differ from the original, so browsers revalidate it
+    cache_control = 'public, max-age=31536000, immutable' if source_key else 'no-cache'
+    return FileResponse(
+        png_path,
+        media_type='image/png',
+        headers={'Cache-Control': cache_control}
+    )
 
 @app.delete("/api/document-history/{history_id}")
 async def delete_document_history(history_id: int):
@@ -563,6 +1476,8 @@ async def delete_document_history(history_id: int):
                     detail=f"Failed to delete document history: {response.text}"
                 )
             
+            STATS_CACHE.clear()
+            CHANGE_FEED.publish("history", "delete", {"id": history_id})
             return {"message": f"Document history {history_id} deleted successfully"}
     except HTTPException:
         raise
@@ -577,30 +1492,10 @@ async def generate_pdf(request: Request):
     try:
         # Try to import PDF generation functions
         try:
-            # First try direct import
-            from lieferschein_generator import generate_lieferschein, generate_laufkarte, generate_rechnung
-            from lieferschein_counter import get_current_number
-            print("Successfully imported PDF modules (direct)")
-        except ImportError as e1:
-            print(f"Direct import failed: {e1}")
-            try:
-                # Try import from Vorlagen
-                from Vorlagen.lieferschein_generator import generate_lieferschein, generate_laufkarte, generate_rechnung
-                from Vorlagen.lieferschein_counter import get_current_number
-                print("Successfully imported PDF modules (from Vorlagen)")
-            except ImportError as e2:
-                print(f"Vorlagen import failed: {e2}")
-                # List available files for debugging
-                current = os.path.dirname(os.path.abspath(__file__))
-                print(f"Current directory: {current}")
-                print(f"Files in current: {os.listdir(current) if os.path.exists(current) else 'N/A'}")
-                parent = os.path.join(current, '..')
-                print(f"Files in parent: {os.listdir(parent) if os.path.exists(parent) else 'N/A'}")
-                vorlagen = os.path.join(parent, 'Vorlagen')
-                print(f"Vorlagen exists: {os.path.exists(vorlagen)}")
-                if os.path.exists(vorlagen):
-                    print(f"Files in Vorlagen: {os.listdir(vorlagen)}")
-                raise HTTPException(status_code=500, detail="PDF generation modules not available")
+            from pdf_service import render_document_async, pdf_response_headers, iter_pdf_file, DOCUMENT_TYPES
+        except ImportError as e:
+            print(f"PDF service import failed: {e}")
+            raise HTTPException(status_code=500, detail="PDF generation modules not available")
         
         # Parse request body
         body = await request.body()
@@ -610,36 +1505,24 @@ async def generate_pdf(request: Request):
         
         if not doc_type:
             raise HTTPException(status_code=400, detail="docType is required")
-        
-        # Generate PDF based on type
-        document_number = None
-        if doc_type == 'lieferschein':
-            pdf_path = generate_lieferschein(doc_data)
-            document_number = f"DZ{datetime.now().year}-{get_current_number():04d}"
-        elif doc_type == 'laufkarte':
-            pdf_path = generate_laufkarte(doc_data)
-            document_number = doc_data.get('bestellnummer', '')
-        elif doc_type == 'rechnung':
-            pdf_path = generate_rechnung(doc_data)
-            document_number = f"RE-{doc_data.get('bestellnummer', '')}"
-        else:
+        if doc_type not in DOCUMENT_TYPES:
             raise HTTPException(status_code=400, detail=f"Unknown docType: {doc_type}")
         
-        # Read the PDF file
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_content = pdf_file.read()
+        # Render on the PDF pool so the event loop stays responsive
+        result = await render_document_async(doc_type, doc_data)
         
-        # Return PDF as response
+        # Stream the PDF file in chunks instead of reading it into memory
         return StreamingResponse(
-            io.BytesIO(pdf_content),
+            iter_pdf_file(result.pdf_path),
             media_type='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename="{doc_type}_{doc_data.get("bestellnummer", "unknown")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-            }
+            headers=pdf_response_headers(doc_type, doc_data, result)
         )
         
     except HTTPException:
         raise
+    except ValueError as e:
+        # Invalid document data, e.g. a price that is not a number
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         import traceback
@@ -647,6 +1530,98 @@ async def generate_pdf(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Bundle endpoint: several documents of one order in one request
+@app.post("/generate-bundle")
+async def generate_bundle(request: Request):
+    """Generate Lieferschein, Laufkarte and Rechnung of one order as a ZIP archive"""
+    try:
+        from pdf_service import render_bundle, iter_bundle_zip, build_history_record, DOCUMENT_TYPES
+        from starlette.background import BackgroundTask
+        
+        body = await request.body()
+        data = json.loads(body)
+        doc_data = data.get('data', {})
+        doc_types = data.get('docTypes') or list(DOCUMENT_TYPES)
+        generated_by = data.get('generatedBy', 'bundle')
+        
+        unknown = [t for t in doc_types if t not in DOCUMENT_TYPES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown docType: {', '.join(unknown)}")
+        
+        bundle = await render_bundle(doc_data, doc_types)
+        
+        # All history entries of the bundle in one insert, after the response is sent
+        history_rows = [
+            build_history_record(item['doc_type'], item['data'], item['result'], generated_by)
+            for item in bundle
+        ]
+        
+        return StreamingResponse(
+            iter_bundle_zip(bundle),
+            media_type='application/zip',
+            headers={
+                'Content-Disposition': f'attachment; filename="dokumente_{doc_data.get("bestellnummer", "unknown")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"',
+                'X-Document-Numbers': ','.join(item['result'].document_number for item in bundle),
+                'X-PDF-Bytes-Saved': str(sum((item['result'].optimization or {}).get('bytes_saved', 0) for item in bundle))
+            },
+            background=BackgroundTask(record_history_bulk, history_rows)
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Invalid document data, e.g. a price that is not a number
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error generating bundle: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def record_history_bulk(rows: List[Dict[str, Any]]):
+    """Background task: store history rows, never failing the response"""
+    try:
+        await insert_document_history_bulk(rows)
+    except Exception as e:
+        print(f"Warning: Error recording document history: {str(e)}")
+
+
+# Laufkarte preview: HTML straight to the browser, no PDF render
+@app.post("/preview-laufkarte")
+async def preview_laufkarte(request: Request):
+    """Preview the Laufkarte of the posted order data as HTML"""
+    from laufkarte_html_generator import iter_laufkarte_html
+    
+    try:
+        data = json.loads(await request.body())
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    
+    return StreamingResponse(
+        iter_laufkarte_html(data.get('data', {})),
+        media_type='text/html; charset=utf-8'
+    )
+
+@app.get("/api/laufkarte/{bestellnummer}/preview")
+async def preview_laufkarte_for_order(bestellnummer: str, datum: Optional[str] = None):
+    """Preview the Laufkarte of a stored order as HTML"""
+    from laufkarte_html_generator import iter_laufkarte_html
+    
+    try:
+        positions = await load_order_positions(bestellnummer)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not positions:
+        raise HTTPException(status_code=404, detail=f"No positions found for order {bestellnummer}")
+    
+    return StreamingResponse(
+        iter_laufkarte_html({'bestellnummer': bestellnummer, 'datum': datum, 'positionen': positions}),
+        media_type='text/html; charset=utf-8'
+    )
+
+
 # Debug endpoint to check document history table
 @app.get("/api/debug/document-history")
 async def debug_document_history():
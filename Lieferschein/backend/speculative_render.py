@@ -0,0 +1,69 @@
+"""
+Speculative Laufkarte pre-rendering (opt-in via SPECULATIVE_LAUFKARTE=true).
+
+Almost every extraction is followed by a Laufkarte download for the same
+order. After /api/extract has stored the positions, a low-priority render is
+queued into the render cache, so the later /generate-pdf call is a cache hit.
+Editing the positions cancels the pending render and drops cached documents.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Callable, Awaitable
+
+from render_cache import RENDER_CACHE
+
+SPECULATIVE_LAUFKARTE = os.getenv("SPECULATIVE_LAUFKARTE", "false").lower() == "true"
+# Give the extraction response and the user's first clicks a head start
+SPECULATIVE_DELAY = float(os.getenv("SPECULATIVE_DELAY", 2.0))
+
+# Single worker so speculative renders never compete with real requests for the render pool
+SPECULATIVE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-speculative")
+
+_pending: Dict[str, asyncio.Task] = {}
+
+def schedule_laufkarte(bestellnummer: str, load_positions: Callable[[], Awaitable[List[Dict[str, Any]]]]):
+    """Queue a speculative Laufkarte render for an order (no-op unless enabled)"""
+    if not SPECULATIVE_LAUFKARTE or not bestellnummer:
+        return
+    cancel(bestellnummer)
+    task = asyncio.get_running_loop().create_task(_prerender(bestellnummer, load_positions))
+    _pending[bestellnummer] = task
+    task.add_done_callback(lambda t: _pending.pop(bestellnummer, None) if _pending.get(bestellnummer) is t else None)
+
+def cancel(bestellnummer: str):
+    """Cancel a pending speculative render without touching the cache"""
+    task = _pending.pop(bestellnummer, None)
+    if task and not task.done():
+        task.cancel()
+
+def invalidate(bestellnummer: str):
+    """Positions of an order changed: cancel pending renders and drop cached documents.
+
+    A render that is already running finishes, but it is stored under the
+    hash of the old data and can never be served for the edited positions.
+    """
+    cancel(bestellnummer)
+    RENDER_CACHE.invalidate(bestellnummer)
+
+async def _prerender(bestellnummer: str, load_positions: Callable[[], Awaitable[List[Dict[str, Any]]]]):
+    try:
+        await asyncio.sleep(SPECULATIVE_DELAY)
+        from pdf_service import render_document_cached
+
+        # Same payload the browser sends: positions as stored, today's date
+        positions = await load_positions()
+        doc_data = {
+            'bestellnummer': bestellnummer,
+            'datum': datetime.now().strftime('%d.%m.%Y'),
+            'positionen': positions
+        }
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(SPECULATIVE_POOL, render_document_cached, 'laufkarte', doc_data)
+        print(f"Speculative Laufkarte ready for {bestellnummer}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Warning: Speculative Laufkarte render failed for {bestellnummer}: {str(e)}")
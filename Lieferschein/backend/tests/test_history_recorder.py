@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+import requests
+
+from history_recorder import HistoryRecorder
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeBackend:
+    """Stands in for the bulk endpoint; status(batch) decides the answer"""
+
+    def __init__(self, status=lambda batch: 201):
+        self.status = status
+        self.delivered = []
+
+    def post(self, url, json=None, timeout=None):
+        status = self.status(json)
+        if status is None:
+            raise requests.ConnectionError("backend down")
+        if status in (200, 201):
+            self.delivered.extend(json)
+        return FakeResponse(status, "rejected" if status >= 400 else "")
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / "history_spool.jsonl")
+
+
+def recorder(spool, backend, **kwargs):
+    r = HistoryRecorder("http://backend/history", spool_file=spool, batch_size=2,
+                        max_retries=2, backoff=0, **kwargs)
+    r._session = backend
+    return r
+
+
+def lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_transient_failure_spools_the_batch(spool):
+    r = recorder(spool, FakeBackend(lambda batch: None))
+    assert r._flush([{"n": 1}, {"n": 2}]) is False
+    assert lines(spool) == [{"n": 1}, {"n": 2}]
+    assert r.metrics()["spooled"] == 2
+    assert r.metrics()["spool_pending"] is True
+
+
+def test_replay_delivers_spooled_events_and_removes_the_files(spool):
+    with open(spool, 'w') as f:
+        f.write('{"n": 1}\n{"n": 2}\n{"n": 3}\n')
+    backend = FakeBackend()
+    r = recorder(spool, backend)
+    r._replay_spool()
+    assert backend.delivered == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert not os.path.exists(spool)
+    assert r._replay_files() == []
+    assert r.metrics()["spool_pending"] is False
+
+
+def test_corrupt_line_is_dead_lettered_and_the_rest_replayed(spool):
+    # A replay file left behind by a crash, with a half-written last line
+    with open(spool + ".replay", 'w') as f:
+        f.write('{"n": 1}\nnot json\n{"n": 2}\n{"n": 3')
+    backend = FakeBackend()
+    r = recorder(spool, backend)
+    r._replay_spool()
+    assert backend.delivered == [{"n": 1}, {"n": 2}]
+    assert [entry["raw"] for entry in lines(r.dead_letter_file)] == ["not json", '{"n": 3']
+    assert r._replay_files() == []
+
+    # Later replays are no longer blocked by it
+    with open(spool, 'w') as f:
+        f.write('{"n": 4}\n')
+    r._replay_spool()
+    assert backend.delivered[-1] == {"n": 4}
+
+
+def test_backend_still_down_keeps_the_rest_in_the_spool(spool):
+    with open(spool, 'w') as f:
+        f.write('{"n": 1}\n{"n": 2}\n{"n": 3}\n')
+    r = recorder(spool, FakeBackend(lambda batch: None))
+    r._replay_spool()
+    assert lines(spool) == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert r._replay_files() == []
+
+
+def test_rejected_events_are_dead_lettered_one_by_one(spool):
+    backend = FakeBackend(lambda batch: 400 if any(e.get("bad") for e in batch) else 201)
+    r = recorder(spool, backend)
+    assert r._flush([{"n": 1}, {"n": 2, "bad": True}]) is True
+    assert backend.delivered == [{"n": 1}]
+    assert [entry["event"] for entry in lines(r.dead_letter_file)] == [{"n": 2, "bad": True}]
+    assert r.metrics()["dead_lettered"] == 1
+    assert not os.path.exists(spool)
+
+
+def test_replay_file_locked_by_another_process_is_skipped(spool):
+    fcntl = pytest.importorskip("fcntl")
+    replay_path = spool + ".replay.1.1"
+    with open(replay_path, 'w') as f:
+        f.write('{"n": 1}\n')
+    backend = FakeBackend()
+    r = recorder(spool, backend)
+    with open(replay_path) as other:
+        fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+        r._replay_spool()
+    assert backend.delivered == []
+    assert os.path.exists(replay_path)
+
+    r._replay_spool()
+    assert backend.delivered == [{"n": 1}]
+    assert not os.path.exists(replay_path)
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from PyPDF2 import PdfReader
+
+import lieferschein_generator as generator
+
+TEMPLATE = os.path.join(os.path.dirname(generator.__file__), 'ls_vorlage.pdf')
+
+
+@pytest.fixture(autouse=True)
+def page_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "pages"
+    monkeypatch.setattr(generator, "PAGE_CACHE_DIR", str(cache_dir))
+    return cache_dir
+
+
+def order(count=40, **changes):
+    positions = [{"pos_nr": str(i), "auftrag": f"FL-{i}", "beschreibung": "Gussteil", "menge": 1}
+                 for i in range(count)]
+    for index, fields in changes.items():
+        positions[int(index.lstrip('p'))].update(fields)
+    return {"lieferschein_nr": "DZ2026-0001", "bestellnummer": "BL-1", "datum": "01.01.2026",
+            "positionen": positions}
+
+
+def test_page_plan_covers_every_position_once():
+    plan = generator.lieferschein_page_plan(order(), TEMPLATE)
+    assert len(plan) > 1
+    assert [i for page in plan for i in page["positions"]] == list(range(40))
+
+
+def test_header_fields_do_not_change_page_hashes():
+    first = generator.lieferschein_page_plan(order(), TEMPLATE)
+    other = generator.lieferschein_page_plan(
+        {**order(), "lieferschein_nr": "DZ2026-0002", "datum": "02.01.2026"}, TEMPLATE)
+    assert [p["hash"] for p in first] == [p["hash"] for p in other]
+
+
+def test_edit_changes_only_the_hash_of_its_page():
+    before = generator.lieferschein_page_plan(order(), TEMPLATE)
+    last_page_position = before[-1]["positions"][0]
+    after = generator.lieferschein_page_plan(order(**{f"p{last_page_position}": {"menge": 5}}), TEMPLATE)
+    assert [p["hash"] for p in before[:-1]] == [p["hash"] for p in after[:-1]]
+    assert before[-1]["hash"] != after[-1]["hash"]
+
+
+def test_only_changed_pages_are_rendered_again(tmp_path):
+    output = str(tmp_path / "out.pdf")
+    first = generator.render_lieferschein_incremental(order(), TEMPLATE, output)
+    assert first["rendered_pages"] == [p["page"] for p in first["pages"]]
+
+    again = generator.render_lieferschein_incremental(order(), TEMPLATE, output)
+    assert again["rendered_pages"] == []
+
+    last_page_position = first["pages"][-1]["positions"][0]
+    edited = generator.render_lieferschein_incremental(
+        order(**{f"p{last_page_position}": {"menge": 5}}), TEMPLATE, output)
+    assert edited["rendered_pages"] == [first["pages"][-1]["page"]]
+    assert len(PdfReader(output).pages) == len(first["pages"])
+
+
+def test_page_pruned_after_lookup_is_rendered_again(tmp_path, monkeypatch):
+    output = str(tmp_path / "out.pdf")
+    generator.render_lieferschein_incremental(order(), TEMPLATE, output)
+
+    # Another request prunes every cached page right after this one found it
+    load = generator._load_page_body
+    def load_then_prune(body_path):
+        body = load(body_path)
+        if os.path.exists(body_path):
+            os.remove(body_path)
+        return body
+    monkeypatch.setattr(generator, "_load_page_body", load_then_prune)
+    result = generator.render_lieferschein_incremental(order(), TEMPLATE, output)
+    assert result["rendered_pages"] == []
+    assert len(PdfReader(output).pages) == len(result["pages"])
+
+    # Pages already gone when this request looks them up are rendered again
+    monkeypatch.setattr(generator, "_load_page_body", load)
+    result = generator.render_lieferschein_incremental(order(), TEMPLATE, output)
+    assert result["rendered_pages"] == [p["page"] for p in result["pages"]]
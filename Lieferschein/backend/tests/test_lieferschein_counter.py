@@ -0,0 +1,99 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import lieferschein_counter as counter
+
+
+class FakeDatetime(datetime):
+    year_now = 2026
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(cls.year_now, 6, 1)
+
+
+@pytest.fixture
+def counter_file(tmp_path, monkeypatch):
+    path = tmp_path / ".lieferschein_counter.json"
+    monkeypatch.setattr(counter, "COUNTER_FILE", str(path))
+    monkeypatch.setattr(counter, "COUNTER_BACKEND", "file")
+    monkeypatch.setattr(counter, "LEASE_SIZE", 10)
+    monkeypatch.setattr(counter, "datetime", FakeDatetime)
+    FakeDatetime.year_now = 2026
+    counter._lease.update(pid=None, year=None, next=0, last=-1)
+    yield path
+    counter._lease.update(pid=None, year=None, next=0, last=-1)
+
+
+def stored(path):
+    return json.loads(path.read_text())
+
+
+def test_missing_file_starts_the_year_at_0001(counter_file):
+    assert counter.get_next_lieferschein_number() == "DZ2026-0001"
+    assert stored(counter_file) == {"year": 2026, "last_number": 10}
+
+
+def test_missing_file_in_legacy_year_continues_at_0901(counter_file):
+    FakeDatetime.year_now = 2025
+    assert counter.get_next_lieferschein_number() == "DZ2025-0901"
+
+
+def test_numbers_come_from_the_lease_until_it_is_used_up(counter_file):
+    numbers = [counter.get_next_lieferschein_number() for _ in range(12)]
+    assert numbers == [f"DZ2026-{n:04d}" for n in range(1, 13)]
+    # Two blocks of 10 reserved, the second one partly used
+    assert stored(counter_file) == {"year": 2026, "last_number": 20}
+
+
+def test_leases_of_separate_workers_do_not_overlap(counter_file):
+    first = counter.allocate_lieferschein_number()
+    # Another worker process: it has no lease yet and reserves the next block
+    counter._lease.update(pid=None)
+    second = counter.allocate_lieferschein_number()
+    assert first == (2026, 1)
+    assert second == (2026, 11)
+
+
+def test_legacy_file_without_year_rolls_over(counter_file):
+    counter_file.write_text(json.dumps({"last_number": 965}))
+    assert counter.get_next_lieferschein_number() == "DZ2026-0001"
+
+
+def test_legacy_file_continues_in_2025(counter_file):
+    FakeDatetime.year_now = 2025
+    counter_file.write_text(json.dumps({"last_number": 965}))
+    assert counter.get_next_lieferschein_number() == "DZ2025-0966"
+
+
+def test_new_year_drops_the_old_lease(counter_file):
+    counter.get_next_lieferschein_number()
+    FakeDatetime.year_now = 2027
+    assert counter.get_next_lieferschein_number() == "DZ2027-0001"
+    assert stored(counter_file) == {"year": 2027, "last_number": 10}
+
+
+@pytest.mark.parametrize("content", ['{"last_number": 9', '[]', '{"year": 2026}', '{"last_number": "12"}'])
+def test_corrupt_file_raises_instead_of_restarting(counter_file, content):
+    counter_file.write_text(content)
+    with pytest.raises(RuntimeError, match="unreadable"):
+        counter.get_next_lieferschein_number()
+    # The file is left for the operator to fix
+    assert counter_file.read_text() == content
+
+
+def test_reset_counter(counter_file):
+    counter.get_next_lieferschein_number()
+    counter.reset_counter(500)
+    assert counter.get_next_lieferschein_number() == "DZ2026-0500"
+    counter.reset_counter()
+    assert counter.get_next_lieferschein_number() == "DZ2026-0001"
+
+
+def test_write_is_atomic(counter_file):
+    counter.get_next_lieferschein_number()
+    leftovers = [name for name in os.listdir(counter_file.parent) if name.endswith('.tmp')]
+    assert leftovers == []
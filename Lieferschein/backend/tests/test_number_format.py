@@ -0,0 +1,46 @@
+import pytest
+
+from number_format import normalize_number
+from position_import import parse_number
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.234,56", "1234.56"),
+    ("1,234.56", "1234.56"),
+    ("1.234.567,5", "1234567.5"),
+    ("1,234,567", "1234567"),
+    ("12,50", "12.50"),
+    ("12.5", "12.5"),
+    ("0,125", "0.125"),
+    ("1234,567", "1234.567"),
+    (" 99 € ", "99"),
+    ("-3,5", "-3.5"),
+    (12, "12"),
+    (2.5, "2.5"),
+])
+def test_normalize_number(value, expected):
+    assert normalize_number(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "   "])
+def test_empty_values_are_none(value):
+    assert normalize_number(value) is None
+    assert parse_number(value) is None
+
+
+@pytest.mark.parametrize("value", ["1.234", "2,500", "-1.000"])
+def test_single_separator_before_three_digits_is_ambiguous(value):
+    with pytest.raises(ValueError, match="ambiguous"):
+        normalize_number(value)
+
+
+@pytest.mark.parametrize("value", ["abc", "1.23.4", "1,2345.6", "1.234.56", "12,34,5", "nan", "inf",
+                                   float("nan"), True])
+def test_invalid_numbers_raise(value):
+    with pytest.raises(ValueError):
+        normalize_number(value)
+
+
+def test_parse_number_returns_float():
+    assert parse_number("1.234,5") == 1234.5
+    assert parse_number(3) == 3.0
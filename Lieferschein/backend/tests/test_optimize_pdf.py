@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from PyPDF2 import PdfReader
+
+import lieferschein_generator as generator
+
+
+@pytest.fixture(autouse=True)
+def page_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(generator, "PAGE_CACHE_DIR", str(tmp_path / "pages"))
+
+
+def lieferschein(count=40):
+    return generator.generate_lieferschein({
+        "lieferschein_nr": "DZ2026-0001", "bestellnummer": "BL-1", "datum": "01.01.2026",
+        "positionen": [{"pos_nr": str(i), "auftrag": f"FL-{i}", "beschreibung": "Gussteil", "menge": 1}
+                       for i in range(count)],
+    })
+
+
+def test_optimised_lieferschein_still_opens_with_the_same_content():
+    pdf_path = lieferschein()
+    try:
+        before = [page.extract_text() for page in PdfReader(pdf_path).pages]
+        result = generator.optimize_pdf(pdf_path, linearize=False)
+        reader = PdfReader(pdf_path, strict=True)
+        assert [page.extract_text() for page in reader.pages] == before
+        assert result["deduplicated_objects"] > 0
+        assert result["bytes_saved"] > 0
+        assert os.path.getsize(pdf_path) == result["optimized_bytes"]
+    finally:
+        os.remove(pdf_path)
+
+
+def test_content_streams_are_indirect_objects():
+    pdf_path = lieferschein(5)
+    try:
+        generator.optimize_pdf(pdf_path, linearize=False)
+        for page in PdfReader(pdf_path).pages:
+            assert type(page.raw_get('/Contents')).__name__ == 'IndirectObject'
+    finally:
+        os.remove(pdf_path)
+
+
+def test_output_failing_verification_keeps_the_original(monkeypatch):
+    pdf_path = lieferschein(5)
+    try:
+        with open(pdf_path, 'rb') as f:
+            original = f.read()
+        monkeypatch.setattr(generator, "_verify_pdf", lambda path, page_count: False)
+        result = generator.optimize_pdf(pdf_path, linearize=False)
+        with open(pdf_path, 'rb') as f:
+            assert f.read() == original
+        assert result["bytes_saved"] == 0
+        assert not os.path.exists(pdf_path + '.opt')
+    finally:
+        os.remove(pdf_path)
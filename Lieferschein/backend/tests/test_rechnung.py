@@ -0,0 +1,73 @@
+import os
+import re
+from decimal import Decimal
+
+import pytest
+from PyPDF2 import PdfReader
+
+from lieferschein_generator import generate_rechnung, position_amounts, to_decimal
+
+
+def rechnung_pages(data):
+    pdf_path = generate_rechnung(data)
+    try:
+        return [page.extract_text() for page in PdfReader(pdf_path).pages]
+    finally:
+        os.remove(pdf_path)
+
+
+def amount(text, label):
+    match = re.search(re.escape(label) + r":? ([-\d.]+) €", text)
+    assert match, f"{label} not found"
+    return Decimal(match.group(1))
+
+
+def test_to_decimal_reads_german_and_english_notation():
+    assert to_decimal("1.234,56") == Decimal("1234.56")
+    assert to_decimal("1,234.56") == Decimal("1234.56")
+    assert to_decimal("12,5") == Decimal("12.5")
+    assert to_decimal(0.1) == Decimal("0.1")
+    assert to_decimal(None) == Decimal("0")
+    assert to_decimal("") == Decimal("0")
+
+
+def test_invalid_amount_names_the_position():
+    with pytest.raises(ValueError, match=r"Position 7, preis: '12,3x' is not a number"):
+        position_amounts({"pos_nr": "7", "menge": 1, "preis": "12,3x"})
+
+
+def test_invalid_amount_fails_the_rechnung():
+    data = {"bestellnummer": "BL-1", "positionen": [
+        {"pos_nr": "1", "menge": 1, "preis": "10,00"},
+        {"pos_nr": "2", "menge": "2,500", "preis": "10,00"},
+    ]}
+    with pytest.raises(ValueError, match="Position 2, menge"):
+        generate_rechnung(data)
+
+
+def test_totals_are_exact_decimal_sums():
+    # 0.1 + 0.2 in floats would not add up to 0.30
+    data = {"bestellnummer": "BL-1", "datum": "01.01.2026", "positionen": [
+        {"pos_nr": "1", "menge": 1, "preis": 0.1},
+        {"pos_nr": "2", "menge": 1, "preis": 0.2},
+        {"pos_nr": "3", "menge": "3", "preis": "1.234,50"},
+    ]}
+    text = rechnung_pages(data)[-1]
+    assert amount(text, "Netto") == Decimal("3703.80")
+    assert amount(text, "MwSt 19%") == Decimal("703.72")
+    assert amount(text, "Gesamt") == Decimal("4407.52")
+
+
+def test_uebertrag_carries_the_running_total_to_the_next_page():
+    positions = [{"pos_nr": str(i), "beschreibung": "Teil", "menge": 2, "preis": "1.234,50"} for i in range(30)]
+    pages = rechnung_pages({"bestellnummer": "BL-1", "datum": "01.01.2026", "positionen": positions})
+    assert len(pages) > 1
+
+    for page_no, (page, next_page) in enumerate(zip(pages, pages[1:]), start=1):
+        carried = amount(page, "Übertrag")
+        rows_so_far = sum(p.count("2469.00 €") for p in pages[:page_no])
+        assert carried == Decimal("2469.00") * rows_so_far
+        assert f"Übertrag von Seite {page_no}" in next_page
+        assert f"{carried:.2f} €" in next_page
+
+    assert amount(pages[-1], "Netto") == Decimal("2469.00") * len(positions)
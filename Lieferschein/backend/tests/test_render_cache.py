@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from render_cache import RenderCache, cache_key
+
+
+def key(data, doc_type="laufkarte"):
+    return cache_key(doc_type, data)
+
+
+def test_missing_field_and_none_have_different_keys():
+    assert key({"positionen": [{"fv": None}]}) != key({"positionen": [{}]})
+    assert key({"bestellnummer": None}) != key({})
+    assert key({"kunde": None}) != key({})
+
+
+def test_none_and_empty_string_have_different_keys():
+    assert key({"positionen": [{"werkstoff": None}]}) != key({"positionen": [{"werkstoff": ""}]})
+    assert key({"bestellnummer": None}) != key({"bestellnummer": ""})
+
+
+def test_datum_falls_back_to_today_only_when_missing():
+    today = datetime.now().strftime('%d.%m.%Y')
+    assert key({}) == key({"datum": today})
+    assert key({"datum": ""}) != key({})
+    assert key({"datum": None}) != key({})
+
+
+def test_database_bookkeeping_is_ignored():
+    browser = {"bestellnummer": "BL-1", "positionen": [{"pos_nr": "1", "menge": 2, "preis": 10}]}
+    database = {"bestellnummer": "BL-1", "positionen": [
+        {"id": 17, "created_at": "2026-01-01T00:00:00", "pos_nr": "1", "menge": 2.0, "preis": 10.0}
+    ]}
+    assert key(browser) == key(database)
+
+
+def test_only_amounts_are_compared_as_numbers():
+    # pos_nr is printed as str(): 1 and 1.0 render differently
+    assert key({"positionen": [{"pos_nr": 1}]}) != key({"positionen": [{"pos_nr": 1.0}]})
+    assert key({"positionen": [{"menge": "2"}]}) != key({"positionen": [{"menge": 2}]})
+
+
+def test_document_type_is_part_of_the_key():
+    data = {"bestellnummer": "BL-1"}
+    assert key(data, "laufkarte") != key(data, "rechnung")
+
+
+def test_put_get_and_invalidate(tmp_path):
+    cache = RenderCache(cache_dir=str(tmp_path / "cache"), max_entries=2)
+    data = {"bestellnummer": "BL-1", "positionen": []}
+    rendered = tmp_path / "rendered.pdf"
+    rendered.write_bytes(b"%PDF-1.4")
+
+    cached_path = cache.put("laufkarte", data, str(rendered), "BL-1")
+    assert cache.get("laufkarte", data)[0] == cached_path
+    assert cache.get("laufkarte", {**data, "datum": ""}) is None
+
+    assert cache.invalidate("BL-1") == 1
+    assert cache.get("laufkarte", data) is None
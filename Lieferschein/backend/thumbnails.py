@@ -0,0 +1,75 @@
+"""
+PNG thumbnails of generated documents.
+
+Page 1 of a PDF is rendered with pdf2image (poppler) at a low DPI and stored
+content-addressed next to the render cache: the file name is a hash of the
+render settings and either a stable key of the document (its archive path or
+history id) or, for documents without one, the PDF bytes. A thumbnail never
+goes stale and is rendered at most once per document.
+"""
+
+import os
+import hashlib
+import tempfile
+from typing import Optional
+
+try:
+    from pdf2image import convert_from_path
+except ImportError:  # Optional: thumbnails are unavailable without pdf2image/poppler
+    convert_from_path = None
+
+from render_cache import CACHE_DIR
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", os.path.join(CACHE_DIR, 'thumbnails'))
+THUMBNAIL_DPI = int(os.getenv("THUMBNAIL_DPI", 40))
+# Upper bound for the PNG width in pixels, whatever DPI is requested
+THUMBNAIL_MAX_WIDTH = int(os.getenv("THUMBNAIL_MAX_WIDTH", 400))
+MAX_DPI = 150
+
+def thumbnails_available() -> bool:
+    return convert_from_path is not None
+
+def thumbnail_key(pdf_path: str, dpi: int, source_key: Optional[str] = None) -> str:
+    """Hash of the render settings plus source_key, or plus the PDF content without one"""
+    digest = hashlib.sha256(f"{dpi}:{THUMBNAIL_MAX_WIDTH}:".encode('ascii'))
+    if source_key:
+        # Stable key: no need to read the whole PDF on every request
+        digest.update(source_key.encode('utf-8'))
+        return digest.hexdigest()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def render_thumbnail(pdf_path: str, dpi: Optional[int] = None, source_key: Optional[str] = None) -> str:
+    """Return the path of a PNG of page 1 of pdf_path, rendering it if needed.
+
+    source_key identifies an immutable PDF (see pdf_service.history_pdf_source).
+    """
+    if not thumbnails_available():
+        raise RuntimeError("Thumbnail rendering requires pdf2image and poppler")
+
+    dpi = max(10, min(int(dpi or THUMBNAIL_DPI), MAX_DPI))
+    png_path = os.path.join(THUMBNAIL_DIR, f"{thumbnail_key(pdf_path, dpi, source_key)}.png")
+    if os.path.exists(png_path):
+        return png_path
+
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=1, last_page=1)
+    if not images:
+        raise RuntimeError(f"Could not render a thumbnail of {pdf_path}")
+    image = images[0]
+    if image.width > THUMBNAIL_MAX_WIDTH:
+        image.thumbnail((THUMBNAIL_MAX_WIDTH, THUMBNAIL_MAX_WIDTH * 10))
+
+    # Write to a temp file first so concurrent requests never see a partial PNG
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=THUMBNAIL_DIR, suffix='.png.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, format='PNG', optimize=True)
+        os.replace(tmp_path, png_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return png_path
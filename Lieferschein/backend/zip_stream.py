@@ -0,0 +1,86 @@
+"""
+Streaming ZIP writer.
+
+zipfile writes to a non-seekable sink in this mode, using data descriptors
+instead of seeking back, so the archive can be sent to the client while it is
+being built. Nothing is buffered beyond the chunk currently being copied and
+no temporary files are used.
+"""
+
+import io
+import time
+import zipfile
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Tuple, Union
+
+CHUNK_SIZE = 64 * 1024
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable file object that collects written bytes until drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+# A member is (archive name, path to a file on disk or the bytes themselves)
+ZipMember = Tuple[str, Union[str, bytes]]
+
+def _write_member(zf: zipfile.ZipFile, sink: _ChunkSink, name: str, content: Union[str, bytes]) -> Iterator[bytes]:
+    """Write one member, yielding the compressed bytes as they are produced"""
+    # PDFs are already compressed; only deflate other content
+    compress_type = zipfile.ZIP_STORED if name.lower().endswith('.pdf') else zipfile.ZIP_DEFLATED
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = compress_type
+    with zf.open(info, 'w', force_zip64=True) as dest:
+        if isinstance(content, bytes):
+            dest.write(content)
+        else:
+            with open(content, 'rb') as src:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+def iter_zip(members: Iterable[ZipMember]) -> Iterator[bytes]:
+    """Yield a ZIP archive of members chunk by chunk.
+
+    members may be a generator; each member is only read when it is written,
+    so PDFs can be produced on the fly while the archive is streaming.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members:
+            yield from _write_member(zf, sink, name, content)
+    # Central directory
+    data = sink.drain()
+    if data:
+        yield data
+
+async def aiter_zip(members: AsyncIterable[ZipMember]) -> AsyncIterator[bytes]:
+    """Like iter_zip, for members produced by an async generator"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        async for name, content in members:
+            for data in _write_member(zf, sink, name, content):
+                yield data
+    # Central directory
+    data = sink.drain()
+    if data:
+        yield data
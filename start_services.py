@@ -59,21 +59,19 @@ def run_pdf_server():
 
 def create_unified_app():
     """Create a unified app that handles both API and PDF generation"""
-    from fastapi import FastAPI, Request, Response
+    from fastapi import FastAPI, Request, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
     from fastapi.responses import StreamingResponse
-    import uvicorn
-    from simple_supabase_server import app as backend_app
-    from pdf_server import app as pdf_app
-    from werkzeug.test import Client
-    from werkzeug.serving import WSGIRequestHandler
-    import io
+    from starlette.background import BackgroundTask
+    from simple_supabase_server import app as backend_app, insert_document_history
+    from pdf_service import (
+        render_document_async, build_history_record, pdf_response_headers, iter_pdf_file, DOCUMENT_TYPES
+    )
+    import json
     
     # Create a new FastAPI app that combines both services
     app = FastAPI(title="DZMetall Unified Service")
     
-    # Import the backend routes directly
-    from simple_supabase_server import app as backend_app
-    
     # Add health check at root level
     @app.get("/health")
     async def health_check():
@@ -82,31 +80,71 @@ def create_unified_app():
     # Mount the backend app only for /api routes
     app.mount("/api", backend_app)
     
-    # Create a wrapper for PDF generation
+    # Mounted apps get no startup event: start the scanner hot folder here (only if HOTFOLDER_DIRS is set)
+    @app.on_event("startup")
+    async def start_hotfolder():
+        from simple_supabase_server import start_hotfolder_watcher
+        start_hotfolder_watcher()
+    
+    @app.on_event("startup")
+    async def check_change_feed_workers():
+        from change_feed import warn_if_multi_worker
+        warn_if_multi_worker()
+    
+    async def record_history(history_data):
+        """Record document history after the response has been sent"""
+        try:
+            await insert_document_history(history_data)
+        except Exception as e:
+            print(f"Warning: Error recording document history: {str(e)}")
+    
+    # PDF generation runs natively on the render pool (no WSGI bridge)
     @app.post("/generate-pdf")
-    async def generate_pdf_wrapper(request: Request):
-        """Proxy PDF generation requests to Flask app"""
-        # Get the request body
-        body = await request.body()
+    async def generate_pdf(request: Request):
+        """Generate PDF based on document type"""
+        print("PDF generation endpoint called")
+        try:
+            data = json.loads(await request.body())
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
         
-        # Create a test client for the Flask app
-        client = Client(pdf_app, Response)
+        doc_type = data.get('docType')
+        doc_data = data.get('data', {})
         
-        # Make the request to Flask app
-        response = client.post(
-            '/generate-pdf',
-            data=body,
-            content_type='application/json',
-            headers=dict(request.headers)
-        )
+        if not doc_type:
+            raise HTTPException(status_code=400, detail="docType is required")
+        if doc_type not in DOCUMENT_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unknown docType: {doc_type}")
+        
+        try:
+            result = await render_document_async(doc_type, doc_data)
+        except Exception as e:
+            print(f"Error generating PDF: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        history_data = build_history_record(doc_type, doc_data, result, "pdf_server")
         
-        # Return the response
         return StreamingResponse(
-            io.BytesIO(response.get_data()),
-            media_type=response.content_type,
-            headers=dict(response.headers)
+            iter_pdf_file(result.pdf_path),
+            media_type='application/pdf',
+            headers=pdf_response_headers(doc_type, doc_data, result),
+            background=BackgroundTask(record_history, history_data)
         )
     
+    # Bundle generation (same handler as the backend's /generate-bundle)
+    from simple_supabase_server import generate_bundle, preview_laufkarte
+    app.add_api_route("/generate-bundle", generate_bundle, methods=["POST"])
+    app.add_api_route("/preview-laufkarte", preview_laufkarte, methods=["POST"])
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
     return app
 
 def main():
@@ -120,53 +158,8 @@ def main():
         # On Render, run unified app on single port
         print(f"Starting unified service on Render (port {port})...")
         
-        # Import here to avoid circular imports
-        import uvicorn
-        from fastapi import FastAPI, Request, Response
-        from fastapi.middleware.cors import CORSMiddleware
-        from fastapi.responses import StreamingResponse
-        from simple_supabase_server import app as backend_app
-        from pdf_server import app as pdf_app
-        from werkzeug.test import Client
-        import io
-        
-        # Create unified app directly here
-        unified_app = FastAPI(title="DZMetall Unified Service")
-        
-        # Add health endpoint
-        @unified_app.get("/health")
-        async def health():
-            return {"status": "healthy", "service": "unified-server"}
-        
-        # Mount backend for API routes
-        unified_app.mount("/api", backend_app)
-        
-        # Add PDF generation endpoint
-        @unified_app.post("/generate-pdf")
-        async def generate_pdf(request: Request):
-            print("PDF generation endpoint called")
-            body = await request.body()
-            client = Client(pdf_app, Response)
-            response = client.post(
-                '/generate-pdf',
-                data=body,
-                content_type='application/json',
-                headers=dict(request.headers)
-            )
-            return StreamingResponse(
-                io.BytesIO(response.get_data()),
-                media_type=response.content_type,
-                headers=dict(response.headers)
-            )
-        
-        # Add CORS middleware
-        unified_app.add_middleware(
-            CORSMiddleware,
-            allow_origins=["*"],
-            allow_credentials=True,
-            allow_methods=["*"],
-            allow_headers=["*"],
-        )
+        # Build the unified app (imports happen inside to avoid circular imports)
+        unified_app = create_unified_app()
         
         # List all registered routes
         print("\nRegistered routes:")